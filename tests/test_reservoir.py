@@ -0,0 +1,112 @@
+"""The groups of TxnReservoir against those xpnet.operations builds with algosdk."""
+
+import copy
+from base64 import b64decode
+from typing import Any, Dict, List, Tuple
+
+import msgpack
+import pytest
+from algosdk import encoding
+from algosdk.future import transaction
+
+from xpnet.account import Account, sign_many
+from xpnet.approvals import approveAction
+from xpnet.operations import (
+    _freezeNftTxns,
+    _validateTransferNftTxns,
+    _withdrawNftTxns,
+    createXpApp,
+    fund_action_pages,
+    getWhitelistShards,
+)
+from xpnet.reservoir import DEFAULT_VALID_ROUNDS, TxnReservoir
+from xpnet.testing.fake import FakeAlgodClient
+from xpnet.testing.server import _setUp
+
+FIRST_ROUND = 1000
+
+
+class CapturingClient:
+    """Hands out fixed suggested params and keeps what is sent instead of
+    sending it."""
+
+    def __init__(self, client: FakeAlgodClient, suggestedParams: transaction.SuggestedParams) -> None:
+        self.client = client
+        self.suggestedParams = suggestedParams
+        self.sent: List[bytes] = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+    def status(self, **kwargs) -> Dict[str, Any]:
+        return {"last-round": self.suggestedParams.first}
+
+    def suggested_params(self, **kwargs) -> transaction.SuggestedParams:
+        return copy.copy(self.suggestedParams)
+
+    def send_raw_transaction(self, txn, **kwargs) -> str:
+        self.sent.append(b64decode(txn))
+        return ""
+
+
+@pytest.fixture(scope="module")
+def app() -> Tuple[FakeAlgodClient, int, Account, Account, Account, int]:
+    fake = FakeAlgodClient()
+    bridge, holder, receiver, freezeID, _ = _setUp(fake)
+    appID = createXpApp(fake, bridge, [bridge], [freezeID], 1, 0, 0)
+    fund_action_pages(fake, appID, bridge, 1)
+    return fake, appID, bridge, holder, receiver, freezeID
+
+
+def _decode(raw: bytes) -> List[Dict[bytes, Any]]:
+    unpacker = msgpack.Unpacker(raw=True, strict_map_key=False)
+    unpacker.feed(raw)
+    return [stxn[b"txn"] for stxn in unpacker]
+
+
+@pytest.mark.parametrize("flatFee, fee", [(False, 0), (False, 7), (True, 2000)])
+@pytest.mark.parametrize("kind", ["freeze", "withdraw", "validate"])
+def test_groups_match_algosdk(app, flatFee: bool, fee: int, kind: str) -> None:
+    fake, appID, bridge, holder, receiver, freezeID = app
+
+    suggestedParams = fake.suggested_params()
+    suggestedParams.first = FIRST_ROUND
+    suggestedParams.last = FIRST_ROUND + DEFAULT_VALID_ROUNDS
+    suggestedParams.flat_fee = flatFee
+    suggestedParams.fee = fee
+
+    client = CapturingClient(fake, suggestedParams)
+    reservoir = TxnReservoir(client, appID)
+    try:
+        if kind == "freeze":
+            txID = reservoir.sendFreeze(bridge, holder, receiver, freezeID, 5)
+            txns = _freezeNftTxns(
+                appID, bridge, holder, receiver, freezeID, 5, getWhitelistShards(fake, appID),
+                copy.copy(suggestedParams),
+            )
+        elif kind == "withdraw":
+            txID = reservoir.sendWithdraw(holder, 78, 3)
+            txns = _withdrawNftTxns(appID, holder, 78, 3, copy.copy(suggestedParams))
+        else:
+            approval = approveAction(
+                bridge, 0, appID, 9, b"validate_transfer_nft", b"data", receiver.getAddress()
+            )
+            txID = reservoir.sendValidate(bridge, receiver, 9, "data", [approval])
+            txns = _validateTransferNftTxns(
+                appID, bridge, receiver, 9, "data", [approval], 1, copy.copy(suggestedParams)
+            )
+    finally:
+        reservoir.close()
+
+    for txn, _ in txns:
+        txn.group = None
+    transaction.assign_group_id([txn for txn, _ in txns])
+    signedTxns = sign_many(txns)
+    expected = b"".join(b64decode(encoding.msgpack_encode(stxn)) for stxn in signedTxns)
+
+    assert len(client.sent) == 1
+    sent = _decode(client.sent[0])
+    assert [txn[b"fee"] for txn in sent] == [txn.fee for txn, _ in txns]
+    assert {txn[b"grp"] for txn in sent} == {txns[0][0].group}
+    assert txID == signedTxns[0].get_txid()
+    assert client.sent[0] == expected
@@ -0,0 +1,185 @@
+import asyncio
+import base64
+import json
+from typing import Any, Dict, List, Optional, Union
+
+import aiohttp
+from algosdk import constants, encoding, error
+from algosdk.future import transaction
+
+
+class AsyncAlgodClient:
+    """An asyncio algod client over a pool of keep-alive connections.
+
+    Only the endpoints used by xpnet are implemented. They are named like the
+    methods of algosdk's AlgodClient and return the same values.
+
+    Args:
+        algod_token: The API token of the algod node.
+        algod_address: The address of the algod node, e.g.
+            "http://localhost:4001".
+        max_connections: The size of the connection pool.
+        max_concurrency: The maximum number of requests in flight at once.
+            Defaults to max_connections.
+        headers: Extra headers to send with every request.
+    """
+
+    def __init__(
+            self,
+            algod_token: str,
+            algod_address: str,
+            max_connections: int = 64,
+            max_concurrency: Optional[int] = None,
+            headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.algod_token = algod_token
+        self.algod_address = algod_address.rstrip("/")
+        self.max_connections = max_connections
+        self.headers = headers
+
+        self._semaphore = asyncio.Semaphore(max_concurrency or max_connections)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncAlgodClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _getSession(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def algod_request(
+            self,
+            method: str,
+            requrl: str,
+            params: Optional[Dict[str, Any]] = None,
+            data: Optional[bytes] = None,
+            headers: Optional[Dict[str, str]] = None,
+            response_format: str = "json",
+    ) -> Union[Dict[str, Any], bytes]:
+        header = {"User-Agent": "xpnet-aio"}
+
+        if self.headers:
+            header.update(self.headers)
+
+        if headers:
+            header.update(headers)
+
+        if requrl not in constants.no_auth:
+            header[constants.algod_auth_header] = self.algod_token
+
+        if requrl not in constants.unversioned_paths:
+            requrl = "/v2" + requrl
+
+        async with self._semaphore:
+            async with self._getSession().request(
+                    method,
+                    self.algod_address + requrl,
+                    params=params,
+                    data=data,
+                    headers=header,
+            ) as resp:
+                body = await resp.read()
+
+        if resp.status >= 400:
+            message = body.decode("utf-8")
+            try:
+                message = json.loads(message)["message"]
+            finally:
+                raise error.AlgodHTTPError(message, resp.status)
+
+        if response_format == "json":
+            try:
+                return json.loads(body)
+            except Exception as e:
+                raise error.AlgodResponseError(
+                    "Failed to parse JSON response from algod"
+                ) from e
+
+        return body
+
+    async def status(self) -> Dict[str, Any]:
+        return await self.algod_request("GET", "/status")
+
+    async def status_after_block(self, block_num: int) -> Dict[str, Any]:
+        return await self.algod_request(
+            "GET", "/status/wait-for-block-after/{}".format(block_num)
+        )
+
+    async def block_info(self, block: int, response_format: str = "json"):
+        return await self.algod_request(
+            "GET",
+            "/blocks/{}".format(block),
+            params={"format": response_format},
+            response_format=response_format,
+        )
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        res = await self.algod_request("GET", "/transactions/params")
+
+        return transaction.SuggestedParams(
+            res["fee"],
+            res["last-round"],
+            res["last-round"] + 1000,
+            res["genesis-hash"],
+            res["genesis-id"],
+            False,
+            res["consensus-version"],
+            res["min-fee"],
+        )
+
+    async def send_raw_transaction(self, txn: bytes) -> str:
+        res = await self.algod_request(
+            "POST",
+            "/transactions",
+            data=base64.b64decode(txn),
+            headers={"Content-Type": "application/x-binary"},
+        )
+        return res["txId"]
+
+    async def send_transaction(self, txn: Any) -> str:
+        return await self.send_transactions([txn])
+
+    async def send_transactions(self, txns: List[Any]) -> str:
+        serialized = []
+        for txn in txns:
+            assert not isinstance(
+                txn, transaction.Transaction
+            ), "Attempt to send UNSIGNED transaction {}".format(txn)
+            serialized.append(base64.b64decode(encoding.msgpack_encode(txn)))
+
+        return await self.send_raw_transaction(base64.b64encode(b"".join(serialized)))
+
+    async def pending_transaction_info(self, transaction_id: str) -> Dict[str, Any]:
+        return await self.algod_request(
+            "GET",
+            "/transactions/pending/" + transaction_id,
+            params={"format": "json"},
+        )
+
+    async def account_info(self, address: str) -> Dict[str, Any]:
+        return await self.algod_request("GET", "/accounts/" + address)
+
+    async def application_info(self, application_id: int) -> Dict[str, Any]:
+        return await self.algod_request(
+            "GET", "/applications/{}".format(application_id)
+        )
+
+    async def compile(self, source: str) -> Dict[str, Any]:
+        return await self.algod_request(
+            "POST",
+            "/teal/compile",
+            data=source.encode("utf-8"),
+            headers={"Content-Type": "application/x-binary"},
+        )
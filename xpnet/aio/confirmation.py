@@ -0,0 +1,196 @@
+import asyncio
+import weakref
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from weakref import WeakKeyDictionary
+
+from ..confirmation import (
+    FOLLOW_BACKOFF,
+    FOLLOW_BACKOFF_MAX,
+    FOLLOW_RETRIES,
+    RECENT_ROUNDS,
+    blockTransactions,
+    decodeBlock,
+)
+from ..utils import PendingTxnResponse
+from .client import AsyncAlgodClient
+
+
+class AsyncConfirmationEngine:
+    """The asyncio counterpart of xpnet.confirmation.ConfirmationEngine.
+
+    A single follower task walks the blocks while any transaction is tracked,
+    so thousands of concurrent waiters cost one status_after_block and one
+    block_info request per round. Like it, the engine only holds its client
+    weakly.
+    """
+
+    def __init__(self, client: AsyncAlgodClient) -> None:
+        self._client = weakref.ref(client)
+
+        self._waiters: Dict[str, List[Tuple[asyncio.Future, int, int]]] = dict()
+        self._recent: Deque[Tuple[int, Set[str]]] = deque(maxlen=RECENT_ROUNDS)
+        self._lastRound: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> AsyncAlgodClient:
+        client = self._client()
+        if client is None:
+            raise Exception("The client of the confirmation engine was collected")
+        return client
+
+    async def track(self, txID: str, timeout: int = 10) -> "asyncio.Future[PendingTxnResponse]":
+        """Start waiting for a transaction to be confirmed.
+
+        Args:
+            txID: The ID of a transaction that has already been sent.
+            timeout: The number of rounds to wait before giving up.
+
+        Returns:
+            A future that resolves to the PendingTxnResponse of the confirmed
+            transaction.
+        """
+        future: "asyncio.Future[PendingTxnResponse]" = asyncio.get_running_loop().create_future()
+
+        if self._lastRound is None:
+            status = await self.client.status()
+            if self._lastRound is None:
+                self._lastRound = status["last-round"] - 1
+
+        if any(txID in txIDs for _, txIDs in self._recent):
+            await self._resolve(txID, [future])
+            return future
+
+        deadline = self._lastRound + 1 + timeout
+        self._waiters.setdefault(txID, []).append((future, deadline, timeout))
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow())
+
+        return future
+
+    async def waitForTransactions(
+            self, txIDs: List[str], timeout: int = 10
+    ) -> List[PendingTxnResponse]:
+        futures = [await self.track(txID, timeout) for txID in txIDs]
+        return list(await asyncio.gather(*futures))
+
+    async def _follow(self) -> None:
+        failures = 0
+        while len(self._waiters) > 0:
+            assert self._lastRound is not None
+            nextRound = self._lastRound + 1
+
+            if self._client() is None:
+                self._failAll(Exception("The client of the confirmation engine was collected"))
+                continue
+
+            try:
+                await self.client.status_after_block(nextRound - 1)
+                block = decodeBlock(
+                    await self.client.block_info(nextRound, response_format="msgpack")
+                )
+            except Exception as e:
+                # a transient error of algod must not fail every waiter
+                failures += 1
+                if failures < FOLLOW_RETRIES:
+                    await asyncio.sleep(min(FOLLOW_BACKOFF_MAX, FOLLOW_BACKOFF * 2 ** (failures - 1)))
+                    continue
+
+                failures = 0
+                self._failAll(e)
+                continue
+
+            failures = 0
+            await self._scan(nextRound, block)
+
+        self._task = None
+        self._lastRound = None
+        self._recent.clear()
+
+    def _failAll(self, error: Exception) -> None:
+        waiters = self._waiters
+        self._waiters = dict()
+        for txWaiters in waiters.values():
+            for future, _, _ in txWaiters:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _scan(self, round: int, block: Dict) -> None:
+        txIDs = {txID for txID, _ in blockTransactions(block)}
+        self._recent.append((round, txIDs))
+        self._lastRound = round
+
+        confirmed = {
+            txID: self._waiters.pop(txID) for txID in txIDs & self._waiters.keys()
+        }
+
+        expired: List[Tuple[str, List[Tuple[asyncio.Future, int, int]]]] = []
+        for txID, waiters in list(self._waiters.items()):
+            due = [w for w in waiters if w[1] <= round]
+            if due:
+                remaining = [w for w in waiters if w[1] > round]
+                if remaining:
+                    self._waiters[txID] = remaining
+                else:
+                    del self._waiters[txID]
+                expired.append((txID, due))
+
+        await asyncio.gather(
+            *[
+                self._resolve(txID, [w[0] for w in waiters])
+                for txID, waiters in confirmed.items()
+            ],
+            *[self._expire(txID, waiters) for txID, waiters in expired],
+        )
+
+    async def _resolve(self, txID: str, futures: List[asyncio.Future]) -> None:
+        try:
+            response = PendingTxnResponse(await self.client.pending_transaction_info(txID))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future in futures:
+            if not future.done():
+                future.set_result(response)
+
+    async def _expire(self, txID: str, waiters: List[Tuple[asyncio.Future, int, int]]) -> None:
+        try:
+            pending_txn = await self.client.pending_transaction_info(txID)
+        except Exception as e:
+            for future, _, _ in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, _, timeout in waiters:
+            if future.done():
+                continue
+            if pending_txn.get("confirmed-round", 0) > 0:
+                future.set_result(PendingTxnResponse(pending_txn))
+            elif pending_txn["pool-error"]:
+                future.set_exception(
+                    Exception("Pool error: {}".format(pending_txn["pool-error"]))
+                )
+            else:
+                future.set_exception(
+                    Exception(
+                        "Transaction {} not confirmed after {} rounds".format(txID, timeout)
+                    )
+                )
+
+
+_engines: "WeakKeyDictionary[AsyncAlgodClient, AsyncConfirmationEngine]" = WeakKeyDictionary()
+
+
+def getConfirmationEngine(client: AsyncAlgodClient) -> AsyncConfirmationEngine:
+    """Get the confirmation engine shared by every caller of this client."""
+    engine = _engines.get(client)
+    if engine is None:
+        engine = AsyncConfirmationEngine(client)
+        _engines[client] = engine
+    return engine
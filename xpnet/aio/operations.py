@@ -0,0 +1,217 @@
+import asyncio
+from typing import Dict, List, Mapping, Sequence, Tuple, Union
+
+from algosdk.future import transaction
+
+from ..account import Account, sign_many
+from ..approvals import ActionApproval
+from ..operations import _freezeNftTxns, _setupTxns, _validateTransferNftTxns, _withdrawNftTxns
+from ..programs import APPROVAL, CLEAR_STATE, loadPrograms, programSources, storePrograms
+from ..whitelist import whitelistShardCount
+from .client import AsyncAlgodClient
+from .utils import compileProgram, getAppGlobalState, waitForTransaction, waitForTransactions
+
+APPROVAL_PROGRAM = b""
+CLEAR_STATE_PROGRAM = b""
+
+# (algod address, app ID) -> global state of the app, read once for the keys
+# that are only set when an app is created
+appGlobals: Dict[Tuple[str, int], Mapping[bytes, Union[int, bytes]]] = dict()
+
+
+async def getContracts(client: AsyncAlgodClient) -> Tuple[bytes, bytes]:
+    """Get the compiled TEAL contracts for the XP app.
+
+    See xpnet.operations.getContracts.
+
+    Args:
+        client: An async algod client that has the ability to compile TEAL
+            programs.
+
+    Returns:
+        A tuple of 2 byte strings. The first is the approval program, and the
+        second is the clear state program.
+    """
+    global APPROVAL_PROGRAM
+    global CLEAR_STATE_PROGRAM
+
+    if len(APPROVAL_PROGRAM) == 0:
+        programs = loadPrograms()
+        if programs is None:
+            sources = programSources()
+            programs = {
+                name: await compileProgram(client, teal)
+                for name, teal in sources.items()
+            }
+            try:
+                storePrograms(sources, programs)
+            except OSError:
+                pass
+
+        APPROVAL_PROGRAM = programs[APPROVAL]
+        CLEAR_STATE_PROGRAM = programs[CLEAR_STATE]
+
+    return APPROVAL_PROGRAM, CLEAR_STATE_PROGRAM
+
+
+async def _getCreationGlobal(client: AsyncAlgodClient, appID: int, key: bytes) -> int:
+    cacheKey = (client.algod_address, appID)
+    state = appGlobals.get(cacheKey)
+    if state is None:
+        state = appGlobals[cacheKey] = await getAppGlobalState(client, appID)
+    value = state[key]
+    assert isinstance(value, int)
+    return value
+
+
+async def getThreshold(client: AsyncAlgodClient, appID: int) -> int:
+    """Get the threshold of a XP app, fetching it from algod only once."""
+    return await _getCreationGlobal(client, appID, b"threshold")
+
+
+async def getWhitelistShards(client: AsyncAlgodClient, appID: int) -> int:
+    """Get the number of whitelist shards of a XP app, fetching it from algod
+    only once."""
+    return await _getCreationGlobal(client, appID, b"wl_shards")
+
+
+async def _signMany(
+        txns: Sequence[Tuple[transaction.Transaction, Account]]
+) -> List[transaction.SignedTransaction]:
+    """Sign with sign_many in the default executor, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, sign_many, txns)
+
+
+async def createXpApp(
+        client: AsyncAlgodClient,
+        sender: Account,
+        validators: List[Account],
+        nft_whitelist: List[int],
+        threshold: int,
+        nft_id: int,
+        token_id: int,
+) -> int:
+    """Create a XP app.
+
+    See xpnet.operations.createXpApp.
+
+    Returns:
+        The ID of the newly created XP app.
+    """
+    approval, clear = await getContracts(client)
+
+    globalSchema = transaction.StateSchema(num_uints=7, num_byte_slices=2)
+    localSchema = transaction.StateSchema(num_uints=0, num_byte_slices=0)
+
+    shards = whitelistShardCount(nft_whitelist)
+
+    app_args = [
+        threshold,
+        nft_id,
+        token_id,
+        shards,
+    ]
+
+    txn = transaction.ApplicationCreateTxn(
+        sender=sender.getAddress(),
+        on_complete=transaction.OnComplete.NoOpOC,
+        approval_program=approval,
+        clear_program=clear,
+        global_schema=globalSchema,
+        local_schema=localSchema,
+        app_args=app_args,
+        sp=await client.suggested_params(),
+    )
+
+    signedTxn = sender.sign(txn)
+
+    await client.send_transaction(signedTxn)
+
+    response = await waitForTransaction(client, signedTxn.get_txid())
+    assert response.applicationIndex is not None and response.applicationIndex > 0
+    appID = response.applicationIndex
+
+    groups = _setupTxns(
+        appID, sender, validators, nft_whitelist, shards, await client.suggested_params()
+    )
+    signedTxns = await _signMany([txn for group in groups for txn in group])
+
+    start = 0
+    for group in groups:
+        await client.send_transactions(signedTxns[start:start + len(group)])
+        start += len(group)
+
+    await waitForTransactions(client, [txn.get_txid() for txn in signedTxns])
+
+    return appID
+
+
+async def validate_transfer_nft(
+        client: AsyncAlgodClient,
+        appID: int,
+        sender: Account,
+        receiver: Account,
+        action_id: int,
+        action_data: str,
+        approvals: List[ActionApproval],
+) -> None:
+    """Transfer Foreign NFT
+
+    See xpnet.operations.validate_transfer_nft.
+    """
+    txns = _validateTransferNftTxns(
+        appID, sender, receiver, action_id, action_data, approvals, await getThreshold(client, appID),
+        await client.suggested_params(),
+    )
+    signedTxns = await _signMany(txns)
+
+    await client.send_transactions(signedTxns)
+
+    await waitForTransaction(client, signedTxns[0].get_txid())
+
+
+async def withdraw_nft(
+        client: AsyncAlgodClient,
+        appID: int,
+        nftHolder: Account,
+        nftID: int,
+        fee: int
+) -> None:
+    """Withdraw Foreign NFT
+
+    See xpnet.operations.withdraw_nft.
+    """
+    txns = _withdrawNftTxns(
+        appID, nftHolder, nftID, fee, await client.suggested_params()
+    )
+    transaction.assign_group_id([txn for txn, _ in txns])
+    signedTxns = await _signMany(txns)
+
+    await client.send_transactions(signedTxns)
+
+    await waitForTransaction(client, signedTxns[0].get_txid())
+
+
+async def freeze_nft(
+        client: AsyncAlgodClient,
+        appID: int,
+        funder: Account,
+        nftHolder: Account,
+        receiver: Account,
+        nftID: int,
+        fees: int
+) -> None:
+    """Freeze NFT
+
+    See xpnet.operations.freeze_nft.
+    """
+    txns = _freezeNftTxns(
+        appID, funder, nftHolder, receiver, nftID, fees, await getWhitelistShards(client, appID),
+        await client.suggested_params(),
+    )
+    transaction.assign_group_id([txn for txn, _ in txns])
+    signedTxns = await _signMany(txns)
+
+    await client.send_transactions(signedTxns)
+
+    await waitForTransaction(client, signedTxns[0].get_txid())
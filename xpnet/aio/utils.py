@@ -0,0 +1,58 @@
+from base64 import b64decode
+from typing import TYPE_CHECKING, Dict, Mapping, Union, List, Any
+
+from ..programs import TEAL_VERSION
+from ..utils import PendingTxnResponse, decodeState
+from .client import AsyncAlgodClient
+from .confirmation import getConfirmationEngine
+
+if TYPE_CHECKING:
+    from pyteal import Expr
+
+
+async def waitForTransaction(
+        client: AsyncAlgodClient, txID: str, timeout: int = 10
+) -> PendingTxnResponse:
+    return (await waitForTransactions(client, [txID], timeout))[0]
+
+
+async def waitForTransactions(
+        client: AsyncAlgodClient, txIDs: List[str], timeout: int = 10
+) -> List[PendingTxnResponse]:
+    return await getConfirmationEngine(client).waitForTransactions(txIDs, timeout)
+
+
+async def compileProgram(client: AsyncAlgodClient, teal: str) -> bytes:
+    response = await client.compile(teal)
+    return b64decode(response["result"])
+
+
+async def fullyCompileContract(client: AsyncAlgodClient, contract: "Expr") -> bytes:
+    from pyteal import compileTeal, Mode
+
+    teal = compileTeal(contract, mode=Mode.Application, version=TEAL_VERSION)
+    return await compileProgram(client, teal)
+
+
+async def getAppGlobalState(
+        client: AsyncAlgodClient, appID: int
+) -> Mapping[bytes, Union[int, bytes]]:
+    appInfo = await client.application_info(appID)
+    return decodeState(appInfo["params"]["global-state"])
+
+
+async def getBalances(client: AsyncAlgodClient, account: str) -> Dict[int, int]:
+    balances: Dict[int, int] = dict()
+
+    accountInfo = await client.account_info(account)
+
+    # set key 0 to Algo balance
+    balances[0] = accountInfo["amount"]
+
+    assets: List[Dict[str, Any]] = accountInfo.get("assets", [])
+    for assetHolding in assets:
+        assetID = assetHolding["asset-id"]
+        amount = assetHolding["amount"]
+        balances[assetID] = amount
+
+    return balances
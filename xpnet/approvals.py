@@ -0,0 +1,114 @@
+"""Off-chain collection of validator approvals for the XP app's actions.
+
+Instead of one app call per validator, every validator signs the payload of
+an action with its own key, and a single submitter puts threshold of those
+signatures on the one app call that executes the action. The app checks
+each signature with ed25519verify_bare against the validator keys it keeps
+in its validators box.
+
+Each signature check costs 1900 opcodes, more than the 700 a single app call
+gets, so the group is padded with budget calls to the app that do nothing
+but add their budget to the pool.
+"""
+
+from typing import Iterable, List, NamedTuple, Tuple
+
+from algosdk import encoding
+
+from .account import Account
+from .whitelist import BOX_BYTE_MIN_BALANCE, BOX_FLAT_MIN_BALANCE
+
+ACTION_PAYLOAD_PREFIX = b"xpnet-action"
+
+VALIDATORS_BOX = b"vs"
+
+PUBLIC_KEY_SIZE = 32
+SIGNATURE_SIZE = 64
+
+# the most validator keys that fit the box I/O of one box reference
+MAX_VALIDATORS = 32
+
+# the most signatures a single group can pay the verification of
+MAX_THRESHOLD = 5
+
+APP_CALL_BUDGET = 700
+
+# opcode cost of validating an action besides the signature checks, and of
+# checking one signature, rounded up from the profile of the approval program
+VALIDATE_BASE_COST = 200
+SIGNATURE_COST = 1950
+
+
+class ActionApproval(NamedTuple):
+    """The signature of one validator on the payload of an action."""
+
+    validatorIndex: int
+    signature: bytes
+
+
+def actionPayload(appID: int, actionID: int, action: bytes, actionData: bytes, receiver: str) -> bytes:
+    """The bytes validators sign to approve an action of an app.
+
+    The payload covers the receiver of the action, so approvals of an action
+    for one receiver cannot execute it for another.
+    """
+    return b"".join([
+        ACTION_PAYLOAD_PREFIX,
+        appID.to_bytes(8, "big"),
+        actionID.to_bytes(8, "big"),
+        len(action).to_bytes(8, "big"),
+        action,
+        encoding.decode_address(receiver),
+        actionData,
+    ])
+
+
+def approveAction(
+        validator: Account,
+        validatorIndex: int,
+        appID: int,
+        actionID: int,
+        action: bytes,
+        actionData: bytes,
+        receiver: str,
+) -> ActionApproval:
+    """Sign the payload of an action as the validator at validatorIndex."""
+    payload = actionPayload(appID, actionID, action, actionData, receiver)
+    return ActionApproval(validatorIndex, validator.signingKey.sign(payload).signature)
+
+
+def packValidators(validators: Iterable[Account]) -> bytes:
+    """The value of the validators box for a list of validators."""
+    keys = [encoding.decode_address(validator.getAddress()) for validator in validators]
+    if len(keys) > MAX_VALIDATORS:
+        raise Exception("At most {} validators are supported, got {}".format(MAX_VALIDATORS, len(keys)))
+    return b"".join(keys)
+
+
+def validatorsMinBalance(count: int) -> int:
+    """The minimum balance the app account needs for the validators box."""
+    return BOX_FLAT_MIN_BALANCE + BOX_BYTE_MIN_BALANCE * (len(VALIDATORS_BOX) + count * PUBLIC_KEY_SIZE)
+
+
+def packApprovals(approvals: Iterable[ActionApproval], threshold: int) -> Tuple[bytes, bytes]:
+    """Pick threshold approvals and pack them into app call arguments.
+
+    Returns:
+        The indexes of the signing validators, one byte each in increasing
+        order, and their signatures in the same order.
+    """
+    byValidator = {approval.validatorIndex: approval for approval in approvals}
+    if len(byValidator) < threshold:
+        raise Exception("Got {} approvals, {} are needed".format(len(byValidator), threshold))
+
+    chosen: List[ActionApproval] = [byValidator[i] for i in sorted(byValidator)[:threshold]]
+    return (
+        bytes(approval.validatorIndex for approval in chosen),
+        b"".join(approval.signature for approval in chosen),
+    )
+
+
+def budgetCalls(threshold: int) -> int:
+    """The number of budget calls a group validating an action needs."""
+    cost = VALIDATE_BASE_COST + SIGNATURE_COST * threshold
+    return max(0, -(-cost // APP_CALL_BUDGET) - 1)
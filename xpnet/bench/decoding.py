@@ -0,0 +1,136 @@
+"""Micro-benchmark of response and state decoding.
+
+Compares the lazy PendingTxnResponse and decodeState of xpnet.utils with the
+eager decoding they replaced, on responses with many logs and apps with many
+state entries, reading one field or key the way the operations do.
+
+    python -m xpnet.bench.decoding --logs 256 --entries 64
+"""
+
+import argparse
+import timeit
+import tracemalloc
+from base64 import b64decode, b64encode
+from typing import Any, Callable, Dict, List, Union
+
+from ..utils import PendingTxnResponse, decodeState
+
+
+class EagerPendingTxnResponse:
+    def __init__(self, response: Dict[str, Any]) -> None:
+        self.poolError: str = response["pool-error"]
+        self.txn: Dict[str, Any] = response["txn"]
+
+        self.applicationIndex = response.get("application-index")
+        self.assetIndex = response.get("asset-index")
+        self.closeRewards = response.get("close-rewards")
+        self.closingAmount = response.get("closing-amount")
+        self.confirmedRound = response.get("confirmed-round")
+        self.globalStateDelta = response.get("global-state-delta")
+        self.localStateDelta = response.get("local-state-delta")
+        self.receiverRewards = response.get("receiver-rewards")
+        self.senderRewards = response.get("sender-rewards")
+
+        self.innerTxns: List[Any] = response.get("inner-txns", [])
+        self.logs: List[bytes] = [b64decode(l) for l in response.get("logs", [])]
+
+
+def eagerDecodeState(stateArray: List[Any]) -> Dict[bytes, Union[int, bytes]]:
+    state: Dict[bytes, Union[int, bytes]] = dict()
+
+    for pair in stateArray:
+        value = pair["value"]
+        if value["type"] == 2:
+            state[b64decode(pair["key"])] = value.get("uint", 0)
+        else:
+            state[b64decode(pair["key"])] = b64decode(value.get("bytes", ""))
+
+    return state
+
+
+def makeResponse(logs: int) -> Dict[str, Any]:
+    return {
+        "pool-error": "",
+        "txn": {"txn": {"type": "appl", "apid": 1}},
+        "confirmed-round": 1000,
+        "logs": [b64encode(i.to_bytes(8, "big") * 8).decode() for i in range(logs)],
+    }
+
+
+def makeState(entries: int) -> List[Any]:
+    state = [
+        {
+            "key": b64encode(b"key_%d" % i).decode(),
+            "value": {"type": 1, "bytes": b64encode(b"v" * 64).decode(), "uint": 0},
+        }
+        for i in range(entries)
+    ]
+    state.append({"key": b64encode(b"nft_id").decode(), "value": {"type": 2, "uint": 42}})
+    return state
+
+
+def measure(name: str, func: Callable[[], Any], number: int) -> Dict[str, Any]:
+    # peak memory allocated while handling one response, above what was
+    # allocated before the call
+    tracemalloc.start()
+    func()
+    allocated = 0
+    for _ in range(100):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    seconds = timeit.timeit(func, number=number)
+
+    return {
+        "name": name,
+        "peak_bytes_per_call": allocated / 100,
+        "us_per_call": seconds / number * 1e6,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logs", type=int, default=256)
+    parser.add_argument("--entries", type=int, default=64)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    response = makeResponse(args.logs)
+    state = makeState(args.entries)
+
+    results = [
+        measure(
+            "eager response, confirmedRound",
+            lambda: EagerPendingTxnResponse(response).confirmedRound,
+            args.number,
+        ),
+        measure(
+            "lazy response, confirmedRound",
+            lambda: PendingTxnResponse(response).confirmedRound,
+            args.number,
+        ),
+        measure(
+            "eager state, nft_id",
+            lambda: eagerDecodeState(state)[b"nft_id"],
+            args.number,
+        ),
+        measure(
+            "lazy state, nft_id",
+            lambda: decodeState(state)[b"nft_id"],
+            args.number,
+        ),
+    ]
+
+    for result in results:
+        print(
+            "{name:<34} {peak_bytes_per_call:>12.0f} B/call {us_per_call:>10.2f} us/call".format(
+                **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""Load generator for the bridge operations.
+
+Runs a mix of freeze_nft, withdraw_nft and validate_transfer_nft at a target
+rate against a sandbox or the in-process fake network, and reports
+throughput, confirmation latency percentiles and algod calls per action.
+
+    python -m xpnet.bench --backend fake --actions 500 --rate 100 \\
+        --mix freeze=2,withdraw=1,validate=1 --output results.json
+
+Actions are started on schedule whether or not earlier ones have finished
+(an open loop), so the latency of an action is measured from the time it was
+due, and includes the time it waited for a free worker.
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from ..account import Account, sign_many
+from ..approvals import approveAction
+from ..metrics import InstrumentedAlgodClient, MetricsRegistry, enableMetrics
+from ..mirror import AppStateMirror
+from ..operations import (
+    MAX_GROUP_SIZE,
+    NftSpec,
+    createXpApp,
+    freeze_nft,
+    fund_action_pages,
+    mint_nfts,
+    validate_transfer_nft,
+    withdraw_nft,
+)
+from ..params import SuggestedParamsProvider, getSuggestedParams
+from ..replay import actionPage
+from ..reservoir import TxnReservoir
+from ..testing import setup
+from ..testing.resources import TemporaryAccountPool
+from ..utils import waitForTransaction, waitForTransactions
+
+FREEZE = "freeze"
+WITHDRAW = "withdraw"
+VALIDATE = "validate"
+
+ACTIONS = (FREEZE, WITHDRAW, VALIDATE)
+
+DEFAULT_MIX = "freeze=1,withdraw=1,validate=1"
+
+PERCENTILES = (50, 90, 99)
+
+# assets created per account, which bounds the account's minimum balance
+ASSETS_PER_ACCOUNT = 64
+
+
+def algodCalls(registry: MetricsRegistry) -> Dict[str, int]:
+    """The algod calls recorded into registry so far, by endpoint."""
+    return {
+        entry["labels"]["endpoint"]: int(entry["value"])
+        for entry in registry.snapshot().get("algod_calls", [])
+    }
+
+
+def parseMix(mix: str) -> Dict[str, int]:
+    """Parse a mix like "freeze=2,withdraw=1" into weights by action."""
+    weights: Dict[str, int] = dict()
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise Exception("Unknown action in mix: {}".format(name))
+        weights[name] = int(weight) if weight else 1
+
+    if sum(weights.values()) <= 0:
+        raise Exception("The mix has no actions: {}".format(mix))
+    return weights
+
+
+def schedule(weights: Dict[str, int], count: int, seed: int) -> List[str]:
+    """Pick the kind of each of count actions, in proportion to weights."""
+    rng = random.Random(seed)
+    names = list(weights)
+    return rng.choices(names, [weights[name] for name in names], k=count)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """The p-th percentile of values, by the nearest rank method."""
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {"count": len(latencies)}
+    for p in PERCENTILES:
+        summary["p{}_ms".format(p)] = _ms(percentile(latencies, p))
+    summary["max_ms"] = _ms(max(latencies) if latencies else None)
+    return summary
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class Workload:
+    """The accounts, app and NFTs the actions of one run use.
+
+    Every freeze and withdraw action gets an NFT of its own, minted during
+    setup, so that no two actions conflict.
+
+    Args:
+        client: An algod client.
+        kinds: The kind of every action that will be run.
+        params: A suggested params provider, or None to fetch the params from
+            algod for every transaction.
+        reservoir: Whether the actions are sent from the templates of a
+            TxnReservoir instead of built by xpnet.operations.
+    """
+
+    def __init__(
+            self,
+            client: AlgodClient,
+            kinds: List[str],
+            params: Optional[SuggestedParamsProvider],
+            reservoir: bool = False,
+    ) -> None:
+        self.client = client
+        self.params = params
+
+        pool = TemporaryAccountPool(client, params=params)
+        self.bridge = pool.get()
+        self.receiver = pool.get()
+
+        self.freezeNfts = self._mint(pool, kinds.count(FREEZE))
+        self.withdrawNfts = self._mint(pool, kinds.count(WITHDRAW))
+        self._optIn([nftID for _, nftID in self.freezeNfts])
+
+        # only whitelisted NFTs can be frozen
+        self.appID = createXpApp(
+            client, self.bridge, [self.bridge], [nftID for _, nftID in self.freezeNfts], 1, 0, 0,
+            params=params,
+        )
+
+        # validate_transfer_nft creates an NFT too, so its senders are rotated
+        validations = kinds.count(VALIDATE)
+        self.validators = [
+            pool.get() for _ in range(-(-validations // ASSETS_PER_ACCOUNT))
+        ]
+        if validations > 0:
+            fund_action_pages(
+                client, self.appID, self.bridge, actionPage(validations - 1) + 1, params=params
+            )
+        # only for the threshold and whitelist shards, which never change
+        self.mirror = AppStateMirror(client, self.appID, reconcileRounds=0)
+        self.reservoir = (
+            TxnReservoir(client, self.appID, params, mirror=self.mirror) if reservoir else None
+        )
+
+        self._actionID = 0
+        self._lock = threading.Lock()
+
+    def _mint(self, pool: TemporaryAccountPool, count: int) -> List[Tuple[Account, int]]:
+        nfts: List[Tuple[Account, int]] = []
+        while len(nfts) < count:
+            holder = pool.get()
+            batch = min(ASSETS_PER_ACCOUNT, count - len(nfts))
+            specs = [
+                NftSpec(unitName="B", assetName="Bench", note=i.to_bytes(4, "big"))
+                for i in range(batch)
+            ]
+            for nftID in mint_nfts(self.client, holder, specs, params=self.params):
+                nfts.append((holder, nftID))
+        return nfts
+
+    def _optIn(self, nftIDs: List[int]) -> None:
+        if len(nftIDs) == 0:
+            return
+
+        suggestedParams = getSuggestedParams(self.client, self.params)
+        txns = [
+            transaction.AssetTransferTxn(
+                sender=self.receiver.getAddress(),
+                receiver=self.receiver.getAddress(),
+                amt=0,
+                index=nftID,
+                sp=suggestedParams,
+            )
+            for nftID in nftIDs
+        ]
+        starts = range(0, len(txns), MAX_GROUP_SIZE)
+        for start in starts:
+            transaction.assign_group_id(txns[start:start + MAX_GROUP_SIZE])
+
+        signedTxns = sign_many([(txn, self.receiver) for txn in txns])
+        for start in starts:
+            self.client.send_transactions(signedTxns[start:start + MAX_GROUP_SIZE])
+
+        waitForTransactions(self.client, [signedTxns[start].get_txid() for start in starts])
+
+    def action(self, kind: str) -> Callable[[], None]:
+        """Prepare one action of the given kind and return its runner."""
+        reservoir = self.reservoir
+
+        if kind == FREEZE:
+            holder, nftID = self.freezeNfts.pop()
+            if reservoir is not None:
+                return lambda: waitForTransaction(
+                    self.client, reservoir.sendFreeze(holder, holder, self.receiver, nftID, 1)
+                )
+            return lambda: freeze_nft(
+                self.client, self.appID, holder, holder, self.receiver, nftID, 1, params=self.params,
+                mirror=self.mirror,
+            )
+
+        if kind == WITHDRAW:
+            holder, nftID = self.withdrawNfts.pop()
+            if reservoir is not None:
+                return lambda: waitForTransaction(self.client, reservoir.sendWithdraw(holder, nftID, 1))
+            return lambda: withdraw_nft(
+                self.client, self.appID, holder, nftID, 1, params=self.params
+            )
+
+        with self._lock:
+            actionID = self._actionID
+            self._actionID += 1
+        sender = self.validators[actionID // ASSETS_PER_ACCOUNT]
+
+        def validate() -> None:
+            # the bridge is the only validator, with a threshold of 1
+            approval = approveAction(
+                self.bridge, 0, self.appID, actionID, b"validate_transfer_nft", b"bench",
+                self.receiver.getAddress(),
+            )
+            if reservoir is not None:
+                txID = reservoir.sendValidate(sender, self.receiver, actionID, "bench", [approval])
+                waitForTransaction(self.client, txID)
+                return
+            validate_transfer_nft(
+                self.client, self.appID, sender, self.receiver, actionID, "bench", [approval],
+                params=self.params, mirror=self.mirror,
+            )
+
+        return validate
+
+    def close(self) -> None:
+        if self.reservoir is not None:
+            self.reservoir.close()
+        self.mirror.close()
+
+
+def run(
+        client: InstrumentedAlgodClient,
+        registry: MetricsRegistry,
+        kinds: List[str],
+        rate: float,
+        workers: int,
+        params: Optional[SuggestedParamsProvider],
+        reservoir: bool = False,
+) -> Dict[str, Any]:
+    """Set up a workload for kinds, run it at rate actions per second and
+    measure it, counting the algod calls of client in registry."""
+    setupStart = time.monotonic()
+    workload = Workload(client, kinds, params, reservoir)
+    setupSeconds = time.monotonic() - setupStart
+
+    actions = [(kind, workload.action(kind)) for kind in kinds]
+
+    latencies: Dict[str, List[float]] = {kind: [] for kind in ACTIONS}
+    errors: Dict[str, List[str]] = {kind: [] for kind in ACTIONS}
+    resultsLock = threading.Lock()
+
+    def execute(kind: str, runner: Callable[[], None], due: float) -> None:
+        try:
+            runner()
+        except Exception as e:
+            with resultsLock:
+                errors[kind].append(str(e))
+            return
+        elapsed = time.monotonic() - due
+        with resultsLock:
+            latencies[kind].append(elapsed)
+
+    callsBefore = algodCalls(registry)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, (kind, runner) in enumerate(actions):
+            due = start + i / rate if rate > 0 else start
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(execute, kind, runner, due)
+    elapsed = time.monotonic() - start
+    callsAfter = algodCalls(registry)
+    workload.close()
+
+    calls = {
+        name: count - callsBefore.get(name, 0)
+        for name, count in callsAfter.items()
+        if count - callsBefore.get(name, 0) > 0
+    }
+    completed = sum(len(values) for values in latencies.values())
+    failed = sum(len(values) for values in errors.values())
+
+    return {
+        "setup_seconds": round(setupSeconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "actions": len(kinds),
+        "completed": completed,
+        "failed": failed,
+        "throughput_per_second": round(completed / elapsed, 3) if elapsed > 0 else None,
+        "latency": summarize([value for values in latencies.values() for value in values]),
+        "latency_by_action": {
+            kind: summarize(values) for kind, values in latencies.items() if kinds.count(kind) > 0
+        },
+        "algod_calls": sum(calls.values()),
+        "algod_calls_per_action": round(sum(calls.values()) / len(kinds), 3) if kinds else None,
+        "algod_calls_by_endpoint": dict(sorted(calls.items())),
+        # the first few errors of each kind, for diagnosis
+        "errors": {kind: values[:5] for kind, values in errors.items() if values},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("fake", "sandbox"), default="fake")
+    parser.add_argument("--block-time", type=float, default=0.0,
+                        help="seconds between rounds of the fake network, 0 for instant rounds")
+    parser.add_argument("--actions", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50.0,
+                        help="actions started per second, 0 to start all at once")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--no-params-cache", action="store_true",
+                        help="fetch suggested params from algod for every action")
+    parser.add_argument("--reservoir", action="store_true",
+                        help="send the actions from pre-built templates, see xpnet.reservoir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--metrics", action="store_true",
+                        help="add the stage and endpoint metrics, setup included, to the results")
+    args = parser.parse_args(argv)
+
+    if args.backend == "fake":
+        setup.USE_FAKE_NETWORK = True
+        setup.FAKE_BLOCK_TIME = args.block_time
+
+    # the algod calls per action are counted in the registry either way
+    registry = enableMetrics()
+    client = InstrumentedAlgodClient(setup.getAlgodClient())
+    params = None if args.no_params_cache else SuggestedParamsProvider(client)
+
+    weights = parseMix(args.mix)
+    kinds = schedule(weights, args.actions, args.seed)
+
+    results = {
+        "config": {
+            "backend": args.backend,
+            "block_time": args.block_time if args.backend == "fake" else None,
+            "actions": args.actions,
+            "rate": args.rate,
+            "mix": weights,
+            "workers": args.workers,
+            "params_cache": params is not None,
+            "reservoir": args.reservoir,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": run(client, registry, kinds, args.rate, args.workers, params, args.reservoir),
+    }
+    if params is not None:
+        params.close()
+    if args.metrics:
+        results["metrics"] = registry.snapshot()
+
+    encoded = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(encoded + "\n")
+    print(encoded)
+
+    return 1 if results["results"]["failed"] > 0 else 0
@@ -0,0 +1,333 @@
+import threading
+import time
+import weakref
+from base64 import b32encode
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
+from weakref import WeakKeyDictionary
+
+import msgpack
+from algosdk import constants, encoding
+from algosdk.v2client.algod import AlgodClient
+
+from .metrics import recordPoolError, recordRounds
+from .utils import PendingTxnResponse
+
+# number of already scanned blocks kept around so that transactions which
+# confirmed just before they were registered are still found
+RECENT_ROUNDS = 4
+
+# concurrent pending_transaction_info requests when many tracked transactions
+# confirm in the same block
+RESOLVE_WORKERS = 16
+
+# consecutive failures of the block follower's algod calls after which every
+# waiter is failed, and the delays between retries in seconds
+FOLLOW_RETRIES = 6
+FOLLOW_BACKOFF = 0.25
+FOLLOW_BACKOFF_MAX = 4.0
+
+
+def decodeBlock(raw: bytes) -> Dict[str, Any]:
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+def txnID(txn: Dict[str, Any]) -> str:
+    """Compute the ID of a transaction given as a decoded msgpack map."""
+    encoded = msgpack.packb(dict(sorted(txn.items())), use_bin_type=True)
+    digest = encoding.checksum(constants.txid_prefix + encoded)
+    return b32encode(digest).decode().strip("=")
+
+
+def blockTransactions(block: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """List the top-level transactions of a block together with their IDs.
+
+    Blocks strip the genesis ID and hash from every transaction, so they are
+    restored from the block header before the ID is computed.
+
+    Args:
+        block: A block as returned by algod in msgpack format, decoded with
+            decodeBlock.
+
+    Returns:
+        A list of (txID, signed transaction in block) pairs in block order.
+    """
+    header = block["block"]
+    txns: List[Tuple[str, Dict[str, Any]]] = []
+
+    for stib in header.get("txns", []):
+        txn = dict(stib["txn"])
+        if stib.get("hgi"):
+            txn["gen"] = header["gen"]
+        if "gh" not in txn:
+            txn["gh"] = header["gh"]
+        txns.append((txnID(txn), stib))
+
+    return txns
+
+
+class ConfirmationEngine:
+    """Follows blocks once and resolves every tracked transaction from them.
+
+    Each round costs a single status_after_block and block_info call no matter
+    how many transactions are being waited on. pending_transaction_info is
+    only requested once per transaction, after it has been seen in a block.
+
+    The engine only holds its client weakly, so that the entry of the client
+    in the shared engines goes away with it. Transactions still tracked when
+    the client is collected fail.
+    """
+
+    def __init__(self, client: AlgodClient) -> None:
+        self._client = weakref.ref(client)
+
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, List[Tuple[Future, int, int]]] = dict()
+        self._recent: Deque[Tuple[int, Set[str]]] = deque(maxlen=RECENT_ROUNDS)
+        self._lastRound: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._roundListeners: List[Callable[[int], None]] = []
+        self._responseListeners: List[Callable[[PendingTxnResponse], None]] = []
+
+    @property
+    def client(self) -> AlgodClient:
+        client = self._client()
+        if client is None:
+            raise Exception("The client of the confirmation engine was collected")
+        return client
+
+    def addRoundListener(self, listener: Callable[[int], None]) -> None:
+        """Call listener with the number of every round the engine scans."""
+        with self._lock:
+            self._roundListeners.append(listener)
+
+    def addResponseListener(self, listener: Callable[[PendingTxnResponse], None]) -> None:
+        """Call listener with the response of every transaction confirmed.
+
+        Listeners run before the waiters of the transaction are woken up, in
+        the order the transactions appear in their block.
+        """
+        with self._lock:
+            self._responseListeners.append(listener)
+
+    def removeRoundListener(self, listener: Callable[[int], None]) -> None:
+        """Stop calling a listener added with addRoundListener."""
+        with self._lock:
+            if listener in self._roundListeners:
+                self._roundListeners.remove(listener)
+
+    def removeResponseListener(self, listener: Callable[[PendingTxnResponse], None]) -> None:
+        """Stop calling a listener added with addResponseListener."""
+        with self._lock:
+            if listener in self._responseListeners:
+                self._responseListeners.remove(listener)
+
+    def track(self, txID: str, timeout: int = 10) -> "Future[PendingTxnResponse]":
+        """Start waiting for a transaction to be confirmed.
+
+        Args:
+            txID: The ID of a transaction that has already been sent.
+            timeout: The number of rounds to wait before giving up.
+
+        Returns:
+            A future that resolves to the PendingTxnResponse of the confirmed
+            transaction, or fails if it is rejected or not confirmed in time.
+        """
+        future: "Future[PendingTxnResponse]" = Future()
+
+        startRound: Optional[int] = None
+        if self._lastRound is None:
+            startRound = self.client.status()["last-round"]
+
+        with self._lock:
+            if self._lastRound is None:
+                if startRound is None:
+                    startRound = self.client.status()["last-round"]
+                # the current round is scanned too, the transaction may
+                # already be in it
+                self._lastRound = startRound - 1
+
+            seen = any(txID in txIDs for _, txIDs in self._recent)
+            if not seen:
+                deadline = self._lastRound + 1 + timeout
+                self._waiters.setdefault(txID, []).append((future, deadline, timeout))
+                self._ensureFollowing()
+
+        if seen:
+            self._resolve(txID, [future])
+
+        return future
+
+    def waitForTransactions(
+            self, txIDs: List[str], timeout: int = 10
+    ) -> List[PendingTxnResponse]:
+        futures = [self.track(txID, timeout) for txID in txIDs]
+        return [future.result() for future in futures]
+
+    def _ensureFollowing(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._follow, name="xpnet-confirmation", daemon=True
+            )
+            self._thread.start()
+
+    def _follow(self) -> None:
+        failures = 0
+        while True:
+            with self._lock:
+                if len(self._waiters) == 0:
+                    self._thread = None
+                    self._lastRound = None
+                    self._recent.clear()
+                    return
+                assert self._lastRound is not None
+                nextRound = self._lastRound + 1
+
+            if self._client() is None:
+                self._failAll(Exception("The client of the confirmation engine was collected"))
+                continue
+
+            try:
+                self.client.status_after_block(nextRound - 1)
+                block = decodeBlock(
+                    self.client.block_info(nextRound, response_format="msgpack")
+                )
+            except Exception as e:
+                # a transient error of algod must not fail every waiter
+                failures += 1
+                if failures >= FOLLOW_RETRIES:
+                    failures = 0
+                    self._failAll(e)
+                else:
+                    time.sleep(min(FOLLOW_BACKOFF_MAX, FOLLOW_BACKOFF * 2 ** (failures - 1)))
+                continue
+
+            failures = 0
+            self._scan(nextRound, block)
+
+    def _scan(self, round: int, block: Dict[str, Any]) -> None:
+        blockTxIDs = [txID for txID, _ in blockTransactions(block)]
+        txIDs = set(blockTxIDs)
+
+        with self._lock:
+            self._recent.append((round, txIDs))
+            self._lastRound = round
+            roundListeners = list(self._roundListeners)
+
+            # kept in block order, so that response listeners see state
+            # changes in the order they were applied
+            confirmed = [
+                (txID, self._waiters.pop(txID))
+                for txID in blockTxIDs
+                if txID in self._waiters
+            ]
+
+            expired: List[Tuple[str, List[Tuple[Future, int, int]]]] = []
+            for txID, waiters in list(self._waiters.items()):
+                due = [w for w in waiters if w[1] <= round]
+                if due:
+                    remaining = [w for w in waiters if w[1] > round]
+                    if remaining:
+                        self._waiters[txID] = remaining
+                    else:
+                        del self._waiters[txID]
+                    expired.append((txID, due))
+
+        for listener in roundListeners:
+            listener(round)
+
+        # fetched concurrently, but handed out in block order
+        if len(confirmed) > 1:
+            with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as executor:
+                fetched = list(executor.map(self._fetch, [txID for txID, _ in confirmed]))
+        else:
+            fetched = [self._fetch(txID) for txID, _ in confirmed]
+
+        for (txID, waiters), result in zip(confirmed, fetched):
+            # waiting started timeout rounds before the deadline
+            _, deadline, timeout = waiters[0]
+            recordRounds(round - (deadline - timeout) + 1)
+            self._settle(result, [w[0] for w in waiters])
+
+        for txID, waiters in expired:
+            self._expire(txID, waiters)
+
+    def _resolve(self, txID: str, futures: List[Future]) -> None:
+        self._settle(self._fetch(txID), futures)
+
+    def _fetch(self, txID: str) -> Union[PendingTxnResponse, Exception]:
+        try:
+            return PendingTxnResponse(self.client.pending_transaction_info(txID))
+        except Exception as e:
+            return e
+
+    def _settle(
+            self, result: Union[PendingTxnResponse, Exception], futures: List[Future]
+    ) -> None:
+        if isinstance(result, Exception):
+            for future in futures:
+                future.set_exception(result)
+            return
+
+        self._confirmed(result, futures)
+
+    def _confirmed(self, response: PendingTxnResponse, futures: List[Future]) -> None:
+        with self._lock:
+            responseListeners = list(self._responseListeners)
+
+        for listener in responseListeners:
+            listener(response)
+
+        for future in futures:
+            future.set_result(response)
+
+    def _expire(self, txID: str, waiters: List[Tuple[Future, int, int]]) -> None:
+        # one last look, the pool error is only reported by the pending endpoint
+        try:
+            pending_txn = self.client.pending_transaction_info(txID)
+        except Exception as e:
+            for future, _, _ in waiters:
+                future.set_exception(e)
+            return
+
+        if pending_txn.get("confirmed-round", 0) > 0:
+            self._confirmed(
+                PendingTxnResponse(pending_txn), [future for future, _, _ in waiters]
+            )
+            return
+
+        if pending_txn["pool-error"]:
+            recordPoolError()
+
+        for future, _, timeout in waiters:
+            if pending_txn["pool-error"]:
+                error = Exception("Pool error: {}".format(pending_txn["pool-error"]))
+            else:
+                error = Exception(
+                    "Transaction {} not confirmed after {} rounds".format(txID, timeout)
+                )
+            future.set_exception(error)
+
+    def _failAll(self, error: Exception) -> None:
+        with self._lock:
+            waiters = self._waiters
+            self._waiters = dict()
+
+        for txWaiters in waiters.values():
+            for future, _, _ in txWaiters:
+                future.set_exception(error)
+
+
+_engines: "WeakKeyDictionary[AlgodClient, ConfirmationEngine]" = WeakKeyDictionary()
+_enginesLock = threading.Lock()
+
+
+def getConfirmationEngine(client: AlgodClient) -> ConfirmationEngine:
+    """Get the confirmation engine shared by every caller of this client."""
+    with _enginesLock:
+        engine = _engines.get(client)
+        if engine is None:
+            engine = ConfirmationEngine(client)
+            _engines[client] = engine
+        return engine
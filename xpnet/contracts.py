@@ -1,6 +1,26 @@
-from pyteal import Approve, compileTeal, Or, Reject, Assert, And, For, ScratchVar, TealType, Return, Subroutine, If
-from pyteal import Cond, Mode, OnComplete, Int, Seq, Bytes
-from pyteal import Txn, App, Btoi
+from pyteal import Approve, compileTeal, Or, Reject, Assert, And, While, ScratchVar, TealType, Return, Subroutine, If
+from pyteal import Cond, Mode, OnComplete, Int, Seq, Bytes, Comment, Concat, Len, Log, Not, Pop, Global
+from pyteal import Txn, App, Btoi, Itob, GetBit, GetByte, SetBit, Extract, Ed25519Verify_Bare
+
+from .approvals import (
+    ACTION_PAYLOAD_PREFIX,
+    MAX_THRESHOLD,
+    MAX_VALIDATORS,
+    PUBLIC_KEY_SIZE,
+    SIGNATURE_SIZE,
+    VALIDATORS_BOX,
+)
+from .events import FREEZE_LOG_TAG, VALIDATE_LOG_TAG, WITHDRAW_LOG_TAG
+from .programs import TEAL_VERSION
+from .replay import ACTION_BOX_PREFIX, PAGE_BITS, PAGE_SIZE
+from .whitelist import ASSET_ID_SIZE, MAX_SHARD_IDS, MAX_SHARDS, WHITELIST_BOX_PREFIX
+
+# marks the start of each entry point in the TEAL output, see xpnet.profiler
+BRANCH_MARKER = "branch: "
+
+
+def branch(name: str) -> Comment:
+    return Comment(BRANCH_MARKER + name)
 
 
 def approval_program():
@@ -10,26 +30,133 @@ def approval_program():
     tx_fees_key = Bytes("tx_fees")
     nft_id_key = Bytes("nft_id")
     token_id_key = Bytes("token_id")
+    wl_shards_key = Bytes("wl_shards")
+    ac_low_key = Bytes("ac_low")
+    validators_box = Bytes(VALIDATORS_BOX)
+
+    @Subroutine(TealType.bytes)
+    def whitelistBoxName(shard):
+        return Concat(Bytes(WHITELIST_BOX_PREFIX), Itob(shard))
+
+    # binary search of the sorted shard box the asset belongs to
+    @Subroutine(TealType.uint64)
+    def isWhitelisted(asset_id):
+        name = ScratchVar(TealType.bytes)
+        low = ScratchVar(TealType.uint64)
+        high = ScratchVar(TealType.uint64)
+        mid = ScratchVar(TealType.uint64)
+        value = ScratchVar(TealType.uint64)
+        length = App.box_length(name.load())
+
+        return Seq(
+            name.store(whitelistBoxName(asset_id % App.globalGet(wl_shards_key))),
+            length,
+            If(Not(length.hasValue())).Then(Return(Int(0))),
+            low.store(Int(0)),
+            high.store(length.value() / Int(ASSET_ID_SIZE)),
+            While(low.load() < high.load()).Do(
+                Seq(
+                    mid.store((low.load() + high.load()) / Int(2)),
+                    value.store(Btoi(App.box_extract(
+                        name.load(), mid.load() * Int(ASSET_ID_SIZE), Int(ASSET_ID_SIZE)
+                    ))),
+                    If(value.load() == asset_id).Then(Return(Int(1))),
+                    If(value.load() < asset_id)
+                    .Then(low.store(mid.load() + Int(1)))
+                    .Else(high.store(mid.load())),
+                )
+            ),
+            Return(Int(0)),
+        )
 
-    i = ScratchVar(TealType.uint64)
+    @Subroutine(TealType.bytes)
+    def actionBoxName(page):
+        return Concat(Bytes(ACTION_BOX_PREFIX), Itob(page))
 
+    # checks the threshold validator signatures on the payload of an action,
+    # see xpnet.approvals
+    @Subroutine(TealType.none)
+    def verifyApprovals(payload):
+        signers = Txn.application_args[3]
+        signatures = Txn.application_args[4]
+        i = ScratchVar(TealType.uint64)
+        signer = ScratchVar(TealType.uint64)
+        validators = App.box_length(validators_box)
+
+        return Seq(
+            validators,
+            Assert(validators.hasValue()),
+            Assert(Len(signers) == App.globalGet(threshold_key)),
+            Assert(Len(signatures) == Len(signers) * Int(SIGNATURE_SIZE)),
+            i.store(Int(0)),
+            While(i.load() < Len(signers)).Do(
+                Seq(
+                    signer.store(GetByte(signers, i.load())),
+                    # signers are in increasing order, so none signs twice
+                    If(i.load() > Int(0)).Then(
+                        Assert(signer.load() > GetByte(signers, i.load() - Int(1)))
+                    ),
+                    Assert(signer.load() * Int(PUBLIC_KEY_SIZE) < validators.value()),
+                    Assert(Ed25519Verify_Bare(
+                        payload,
+                        Extract(signatures, i.load() * Int(SIGNATURE_SIZE), Int(SIGNATURE_SIZE)),
+                        App.box_extract(
+                            validators_box, signer.load() * Int(PUBLIC_KEY_SIZE), Int(PUBLIC_KEY_SIZE)
+                        ),
+                    )),
+                    i.store(i.load() + Int(1)),
+                )
+            ),
+        )
+
+    # checks the approvals of the action, then checks and marks its bit in
+    # the replay bitmap, see xpnet.replay
     @Subroutine(TealType.uint64)
-    def validateAction(action_id, action, action_data):
+    def validateAction(action_id, action, receiver, action_data):
+        page = action_id / Int(PAGE_BITS)
+        payload = Concat(
+            Bytes(ACTION_PAYLOAD_PREFIX),
+            Itob(Global.current_application_id()),
+            Itob(action_id),
+            Itob(Len(action)),
+            action,
+            receiver,
+            action_data,
+        )
+        name = ScratchVar(TealType.bytes)
+        offset = ScratchVar(TealType.uint64)
+        current = ScratchVar(TealType.bytes)
+        length = App.box_length(name.load())
+
         return Seq(
-            # TODO:
+            # the page was pruned
+            Assert(page >= App.globalGet(ac_low_key)),
+            verifyApprovals(payload),
+            name.store(actionBoxName(page)),
+            length,
+            If(Not(length.hasValue())).Then(
+                Pop(App.box_create(name.load(), Int(PAGE_SIZE)))
+            ),
+            offset.store((action_id % Int(PAGE_BITS)) / Int(8)),
+            current.store(App.box_extract(name.load(), offset.load(), Int(1))),
+            If(GetBit(current.load(), action_id % Int(8)) == Int(1)).Then(
+                Return(Int(1)),  # ValidationRes.Noop
+            ),
+            App.box_replace(
+                name.load(), offset.load(), SetBit(current.load(), action_id % Int(8), Int(1))
+            ),
             Return(Int(0)),  # ValidationRes.Execute
-            # Return(Int(1)),  # ValidationRes.Noop
         )
 
     on_create = Seq(
-        # Validators must not be empty
-        Assert(Txn.accounts.length() == 0),
+        branch("on_create"),
 
-        # Invalid threshold
+        # Invalid threshold, the validators themselves are written by
+        # set_validators once the app account is funded for their box
         Assert(
             And(
-                Txn.application_args[0] <= 0,
-                Txn.application_args[0] > Txn.accounts.length()
+                Btoi(Txn.application_args[0]) > Int(0),
+                Btoi(Txn.application_args[0]) <= Int(MAX_THRESHOLD)
             )
         ),
 
@@ -40,12 +167,16 @@ def approval_program():
         App.globalPut(tx_fees_key, Int(0)),
         App.globalPut(nft_cnt_key, Int(0)),
 
-        # for (uint i = 0; i < _nft_whitelist.length; i++) {
-        # 	nft_whitelist[address(_nft_whitelist[i])] = 2;
-        # }
-        For(i.store(Int(0)), i.load() < Txn.assets.length(), i.store(i.load() + Int(1))).Do(
-            App.globalPut(Txn.assets[i.load()], Int(2))
+        # the whitelist itself is written by set_whitelist once the app
+        # account is funded for its boxes
+        Assert(
+            And(
+                Btoi(Txn.application_args[3]) > Int(0),
+                Btoi(Txn.application_args[3]) <= Int(MAX_SHARDS)
+            )
         ),
+        App.globalPut(wl_shards_key, Btoi(Txn.application_args[3])),
+        App.globalPut(ac_low_key, Int(0)),
 
         # threshold = _threshold;
         # nft_token = _nft_token;
@@ -60,37 +191,122 @@ def approval_program():
 
     # Transfer Foreign NFT
     on_validate_transfer_nft = Seq(
-        If(validateAction() == Int(0)).Then(
+        branch("validate_transfer_nft"),
+        If(
+            validateAction(
+                Btoi(Txn.application_args[1]), on_call_method, Txn.accounts[1], Txn.application_args[2]
+            ) == Int(0)
+        ).Then(
             Seq(
                 App.globalPut(nft_cnt_key, App.globalGet(nft_cnt_key) + Int(1)),
+                Log(Concat(
+                    Bytes(VALIDATE_LOG_TAG),
+                    Txn.accounts[1],
+                    Itob(Btoi(Txn.application_args[1])),
+                    Itob(App.globalGet(nft_cnt_key)),
+                )),
                 Approve(),
             )
         ),
         Reject()
     )
 
-    # Freeze NFT, requires approval to transfer
+    # the record of a freeze or withdraw, see xpnet.events
     tx_fee = Btoi(Txn.application_args[1])
+
+    def action_log(tag: bytes) -> Log:
+        return Log(Concat(
+            Bytes(tag),
+            Txn.sender(),
+            Itob(Txn.assets[0]),
+            Itob(tx_fee),
+            Itob(App.globalGet(action_cnt_key)),
+            Itob(App.globalGet(tx_fees_key)),
+        ))
+
+    # Freeze NFT, requires approval to transfer, and only of whitelisted NFTs
     on_freeze_nft = Seq(
+        branch("freeze_nft"),
+        Assert(isWhitelisted(Txn.assets[0])),
         App.globalPut(action_cnt_key, App.globalGet(action_cnt_key) + Int(1)),
         App.globalPut(tx_fees_key, App.globalGet(tx_fees_key) + tx_fee),
+        action_log(FREEZE_LOG_TAG),
         Approve()
     )
 
     # Withdraw Foreign NFT
     on_withdraw_nft = Seq(
+        branch("withdraw_nft"),
         App.globalPut(action_cnt_key, App.globalGet(action_cnt_key) + Int(1)),
         App.globalPut(tx_fees_key, App.globalGet(tx_fees_key) + tx_fee),
+        action_log(WITHDRAW_LOG_TAG),
+        Approve()
+    )
+
+    # Replace one shard of the NFT whitelist
+    shard = Btoi(Txn.application_args[1])
+    shard_value = Txn.application_args[2]
+    on_set_whitelist = Seq(
+        branch("set_whitelist"),
+        Assert(Txn.sender() == Global.creator_address()),
+        Assert(shard < App.globalGet(wl_shards_key)),
+        Assert(Len(shard_value) % Int(ASSET_ID_SIZE) == Int(0)),
+        Assert(Len(shard_value) <= Int(MAX_SHARD_IDS * ASSET_ID_SIZE)),
+        Pop(App.box_delete(whitelistBoxName(shard))),
+        If(Len(shard_value) > Int(0)).Then(
+            App.box_put(whitelistBoxName(shard), shard_value)
+        ),
+        Approve()
+    )
+
+    # Replace the validators, at least threshold of them
+    validator_keys = Txn.application_args[1]
+    on_set_validators = Seq(
+        branch("set_validators"),
+        Assert(Txn.sender() == Global.creator_address()),
+        Assert(Len(validator_keys) % Int(PUBLIC_KEY_SIZE) == Int(0)),
+        Assert(Len(validator_keys) >= App.globalGet(threshold_key) * Int(PUBLIC_KEY_SIZE)),
+        Assert(Len(validator_keys) <= Int(MAX_VALIDATORS * PUBLIC_KEY_SIZE)),
+        Pop(App.box_delete(validators_box)),
+        App.box_put(validators_box, validator_keys),
         Approve()
     )
 
+    # Only adds its opcode budget to the group of a validate call
+    on_budget = Seq(
+        branch("budget"),
+        Approve()
+    )
+
+    # Delete the oldest page of the replay bitmap, rejecting its actions
+    # from then on
+    on_prune_actions = Seq(
+        branch("prune_actions"),
+        Assert(Txn.sender() == Global.creator_address()),
+        Pop(App.box_delete(actionBoxName(App.globalGet(ac_low_key)))),
+        App.globalPut(ac_low_key, App.globalGet(ac_low_key) + Int(1)),
+        Approve()
+    )
+
+    # Approve only if the first foreign asset is whitelisted
+    on_check_whitelist = Seq(
+        branch("check_whitelist"),
+        Return(isWhitelisted(Txn.assets[0]))
+    )
+
     on_call = Cond(
         [on_call_method == Bytes("validate_transfer_nft"), on_validate_transfer_nft],
         [on_call_method == Bytes("freeze_nft"), on_freeze_nft],
         [on_call_method == Bytes("withdraw_nft"), on_withdraw_nft],
+        [on_call_method == Bytes("set_whitelist"), on_set_whitelist],
+        [on_call_method == Bytes("check_whitelist"), on_check_whitelist],
+        [on_call_method == Bytes("prune_actions"), on_prune_actions],
+        [on_call_method == Bytes("set_validators"), on_set_validators],
+        [on_call_method == Bytes("budget"), on_budget],
     )
 
     on_delete = Seq(
+        branch("on_delete"),
         # TODO: 
         Reject()
     )
@@ -121,10 +337,18 @@ def clear_state_program():
 if __name__ == "__main__":
     with open("xpnet_approval.teal", "w") as f:
         compiled = compileTeal(
-            approval_program(), mode=Mode.Application, version=5)
+            approval_program(), mode=Mode.Application, version=TEAL_VERSION)
         f.write(compiled)
 
     with open("xpnet_clear_state.teal", "w") as f:
         compiled = compileTeal(clear_state_program(),
-                               mode=Mode.Application, version=5)
+                               mode=Mode.Application, version=TEAL_VERSION)
         f.write(compiled)
+
+    # fill the compiled program cache read by operations.getContracts
+    from xpnet.programs import buildPrograms
+    from xpnet.testing.setup import getAlgodClient
+    from xpnet.utils import compileProgram
+
+    client = getAlgodClient()
+    buildPrograms(lambda teal: compileProgram(client, teal))
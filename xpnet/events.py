@@ -0,0 +1,282 @@
+"""Typed events of the bridge actions, decoded from blocks and logs.
+
+The app calls of the XP app carry everything an action did in their
+arguments, as encoded by xpnet.operations: the method name first, then its
+integer arguments as 8 byte big endian values. The transaction that follows
+the app call in its group is the rest of the action, the transfer of the NFT
+for freeze_nft and its destruction for withdraw_nft.
+
+The app also logs one fixed-layout record per action, with the global
+counters as they are after the action, so that nobody needs to read the
+app's state to follow them. Every record starts with a 4 byte tag, followed
+by 8 byte big endian integers and 32 byte addresses:
+
+    freeze_nft             "xpfz" sender nftID fees actionCount totalFees
+    withdraw_nft           "xpwd" sender nftID fee actionCount totalFees
+    validate_transfer_nft  "xpvl" receiver actionID nftCount
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from algosdk import encoding
+
+from .confirmation import blockTransactions
+from .utils import PendingTxnResponse
+
+FREEZE_LOG_TAG = b"xpfz"
+WITHDRAW_LOG_TAG = b"xpwd"
+VALIDATE_LOG_TAG = b"xpvl"
+
+LOG_TAG_SIZE = 4
+ADDRESS_SIZE = 32
+UINT_SIZE = 8
+
+FREEZE_LOG_SIZE = LOG_TAG_SIZE + ADDRESS_SIZE + 4 * UINT_SIZE
+WITHDRAW_LOG_SIZE = FREEZE_LOG_SIZE
+VALIDATE_LOG_SIZE = LOG_TAG_SIZE + ADDRESS_SIZE + 2 * UINT_SIZE
+
+
+class FreezeEvent(NamedTuple):
+    """A freeze_nft action: the NFT went to receiver, fees were paid."""
+
+    round: int
+    txID: str
+    funder: str
+    nftHolder: str
+    receiver: str
+    nftID: int
+    fees: int
+
+
+class WithdrawEvent(NamedTuple):
+    """A withdraw_nft action: the NFT of nftHolder was destroyed."""
+
+    round: int
+    txID: str
+    nftHolder: str
+    nftID: int
+    fee: int
+
+
+class ValidateTransferEvent(NamedTuple):
+    """A validate_transfer_nft action: a foreign NFT was minted."""
+
+    round: int
+    txID: str
+    sender: str
+    receiver: str
+    actionID: int
+    actionData: bytes
+
+
+BridgeEvent = Union[FreezeEvent, WithdrawEvent, ValidateTransferEvent]
+
+
+class FreezeLog(NamedTuple):
+    """The record a freeze_nft call logs."""
+
+    sender: str
+    nftID: int
+    fees: int
+    # the action_cnt and tx_fees globals after the call
+    actionCount: int
+    totalFees: int
+
+
+class WithdrawLog(NamedTuple):
+    """The record a withdraw_nft call logs."""
+
+    sender: str
+    nftID: int
+    fee: int
+    actionCount: int
+    totalFees: int
+
+
+class ValidateLog(NamedTuple):
+    """The record a validate_transfer_nft call logs."""
+
+    receiver: str
+    actionID: int
+    # the nft_cnt global after the call
+    nftCount: int
+
+
+LogRecord = Union[FreezeLog, WithdrawLog, ValidateLog]
+
+
+def _btoi(value: bytes) -> int:
+    return int.from_bytes(value, "big")
+
+
+def _address(value: Optional[bytes]) -> str:
+    return encoding.encode_address(value) if value else ""
+
+
+def _itob(value: int) -> bytes:
+    return value.to_bytes(UINT_SIZE, "big")
+
+
+def encodeLog(record: LogRecord) -> bytes:
+    """Encode a record the way the app logs it."""
+    if isinstance(record, ValidateLog):
+        return b"".join([
+            VALIDATE_LOG_TAG,
+            encoding.decode_address(record.receiver),
+            _itob(record.actionID),
+            _itob(record.nftCount),
+        ])
+
+    tag = FREEZE_LOG_TAG if isinstance(record, FreezeLog) else WITHDRAW_LOG_TAG
+    return b"".join([
+        tag,
+        encoding.decode_address(record.sender),
+        _itob(record.nftID),
+        _itob(record[2]),
+        _itob(record.actionCount),
+        _itob(record.totalFees),
+    ])
+
+
+def decodeLog(data: bytes) -> Optional[LogRecord]:
+    """Decode a record logged by the app.
+
+    Returns:
+        The record, or None if data is not a record of the app.
+    """
+    tag = data[:LOG_TAG_SIZE]
+
+    if tag == VALIDATE_LOG_TAG and len(data) == VALIDATE_LOG_SIZE:
+        return ValidateLog(
+            _address(data[4:36]), _btoi(data[36:44]), _btoi(data[44:52])
+        )
+
+    if tag in (FREEZE_LOG_TAG, WITHDRAW_LOG_TAG) and len(data) == FREEZE_LOG_SIZE:
+        record = FreezeLog if tag == FREEZE_LOG_TAG else WithdrawLog
+        return record(
+            _address(data[4:36]), _btoi(data[36:44]), _btoi(data[44:52]),
+            _btoi(data[52:60]), _btoi(data[60:68]),
+        )
+
+    return None
+
+
+def responseLogs(response: PendingTxnResponse) -> List[LogRecord]:
+    """Decode the records in the logs of a confirmed app call."""
+    records: List[LogRecord] = []
+    for data in response.logs:
+        record = decodeLog(data)
+        if record is not None:
+            records.append(record)
+    return records
+
+
+def blockLogs(block: Dict[str, Any], appID: int) -> List[Tuple[str, LogRecord]]:
+    """Decode the records logged by the app calls of an app in a block.
+
+    Args:
+        block: A block as returned by algod in msgpack format, decoded with
+            xpnet.confirmation.decodeBlock.
+        appID: The ID of the XP app.
+
+    Returns:
+        The ID of the app call and the record, for every record in block
+        order.
+    """
+    records: List[Tuple[str, LogRecord]] = []
+    for txID, stib in blockTransactions(block):
+        txn = stib["txn"]
+        if txn.get("type") != "appl" or txn.get("apid", 0) != appID:
+            continue
+        for data in stib.get("dt", {}).get("lg", []):
+            record = decodeLog(data)
+            if record is not None:
+                records.append((txID, record))
+    return records
+
+
+def decodeAppCall(
+        round: int,
+        txID: str,
+        txn: Dict[str, Any],
+        nextTxn: Optional[Dict[str, Any]],
+) -> Optional[BridgeEvent]:
+    """Decode the event of an app call to the XP app.
+
+    Args:
+        round: The round the app call was confirmed in.
+        txID: The ID of the app call.
+        txn: The app call, as a decoded msgpack map.
+        nextTxn: The transaction after the app call in its group, if any.
+
+    Returns:
+        The event, or None if the call is not a bridge action.
+    """
+    args: List[bytes] = txn.get("apaa", [])
+    if len(args) == 0:
+        return None
+
+    method = args[0]
+    sender = _address(txn.get("snd"))
+    assets: List[int] = txn.get("apas", [])
+
+    if method == b"freeze_nft" and len(args) >= 2 and assets and nextTxn is not None:
+        return FreezeEvent(
+            round=round,
+            txID=txID,
+            funder=sender,
+            nftHolder=_address(nextTxn.get("snd")),
+            receiver=_address(nextTxn.get("arcv")),
+            nftID=assets[0],
+            fees=_btoi(args[1]),
+        )
+
+    if method == b"withdraw_nft" and len(args) >= 2 and assets:
+        return WithdrawEvent(
+            round=round, txID=txID, nftHolder=sender, nftID=assets[0], fee=_btoi(args[1])
+        )
+
+    if method == b"validate_transfer_nft" and len(args) >= 3:
+        accounts: List[bytes] = txn.get("apat", [])
+        return ValidateTransferEvent(
+            round=round,
+            txID=txID,
+            sender=sender,
+            receiver=_address(accounts[0]) if accounts else "",
+            actionID=_btoi(args[1]),
+            actionData=args[2],
+        )
+
+    return None
+
+
+def blockEvents(block: Dict[str, Any], appID: int) -> List[BridgeEvent]:
+    """Find the bridge events of an app in a block.
+
+    Args:
+        block: A block as returned by algod in msgpack format, decoded with
+            xpnet.confirmation.decodeBlock.
+        appID: The ID of the XP app.
+
+    Returns:
+        The events in block order.
+    """
+    round = block["block"].get("rnd", 0)
+    txns = blockTransactions(block)
+
+    events: List[BridgeEvent] = []
+    for i, (txID, stib) in enumerate(txns):
+        txn = stib["txn"]
+        if txn.get("type") != "appl" or txn.get("apid", 0) != appID:
+            continue
+
+        nextTxn: Optional[Dict[str, Any]] = None
+        if i + 1 < len(txns):
+            candidate = txns[i + 1][1]["txn"]
+            if txn.get("grp") is not None and candidate.get("grp") == txn.get("grp"):
+                nextTxn = candidate
+
+        event = decodeAppCall(round, txID, txn, nextTxn)
+        if event is not None:
+            events.append(event)
+    return events
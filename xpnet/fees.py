@@ -0,0 +1,196 @@
+"""Fee bumping and resubmission of groups under congestion.
+
+A group sent with the suggested fee may be turned away by a congested pool,
+or sit in it unconfirmed until its last valid round. submitWithFeeBump
+watches the group instead of waiting a fixed number of rounds: while it is
+not confirmed it raises the fees of the group, re-signs it and sends it
+again, up to a cap and only while the validity window lasts. When the window
+runs out unconfirmed, the group is built again with a new window.
+
+Every attempt in a window keeps the same first and last valid rounds and a
+lease on its first transaction, so of all attempts in a window at most one
+can ever be confirmed: algod rejects a transaction whose sender and lease
+are those of a transaction confirmed before in an overlapping window. An
+attempt that comes after its own window has run out, and after all the
+attempts in it were seen to be absent from every block of that window, can
+not execute twice either.
+
+The lease also means a bumped attempt cannot replace one algod still holds
+in its pool: it is rejected for an overlapping lease. Fees are therefore
+only raised within a window while the pool turns attempts away, or once it
+has dropped the earlier attempt. While the lease is held, the bumped
+attempt is sent again every bumpAfterRounds rounds, and the next window
+starts from the fees reached in the last one.
+
+algod only tells why it rejects a group in its message, so the rejections
+for a fee too low and for an overlapping lease are told apart by the text
+of algod's messages. A rejection not recognized as either fails the call if
+no attempt is in flight, and otherwise ends the attempts of the window.
+
+Only the first transaction of a group gets the lease, as the transactions of
+one sender in a group may not share one.
+"""
+
+import os
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from algosdk import constants, error
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .account import Account, sign_many
+from .confirmation import getConfirmationEngine
+from .metrics import getRegistry
+from .params import SuggestedParamsProvider, getSuggestedParams
+from .utils import PendingTxnResponse
+
+LEASE_SIZE = 32
+
+
+class FeePolicy(NamedTuple):
+    """How far and how fast submitWithFeeBump raises fees.
+
+    Args:
+        maxFee: The highest fee paid for any transaction, in microalgos.
+        bumpFactor: The factor fees are raised by at every bump.
+        bumpAfterRounds: The number of rounds an attempt is given before the
+            fees are raised.
+        validRounds: The size of the validity window of a group.
+        windows: The number of windows tried before giving up.
+    """
+
+    maxFee: int = 20 * constants.min_txn_fee
+    bumpFactor: float = 2.0
+    bumpAfterRounds: int = 2
+    validRounds: int = 10
+    windows: int = 3
+
+
+DEFAULT_FEE_POLICY = FeePolicy()
+
+GroupBuilder = Callable[[transaction.SuggestedParams], List[Tuple[transaction.Transaction, Account]]]
+
+
+def _isFeeRejection(e: error.AlgodHTTPError) -> bool:
+    message = str(e)
+    return e.code == 400 and ("below threshold" in message or "less than the minimum" in message)
+
+
+def _isLeaseRejection(e: error.AlgodHTTPError) -> bool:
+    return e.code == 400 and "overlapping lease" in str(e)
+
+
+def _bumped(fees: List[int], policy: FeePolicy) -> Optional[List[int]]:
+    if all(fee >= policy.maxFee for fee in fees):
+        return None
+    return [min(policy.maxFee, max(fee + 1, int(fee * policy.bumpFactor))) for fee in fees]
+
+
+def _recordBump() -> None:
+    registry = getRegistry()
+    if registry is not None:
+        registry.increment("fee_bumps")
+
+
+def submitWithFeeBump(
+        client: AlgodClient,
+        build: GroupBuilder,
+        policy: FeePolicy = DEFAULT_FEE_POLICY,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> PendingTxnResponse:
+    """Send a group and raise its fees until it is confirmed.
+
+    Args:
+        client: An algod client.
+        build: Builds the transactions of the group, and their signers, from
+            suggested params. It is called once per validity window.
+        policy: How fees are raised.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+
+    Returns:
+        The PendingTxnResponse of the first transaction of the group.
+    """
+    engine = getConfirmationEngine(client)
+    lastError: Optional[Exception] = None
+    # the fees reached in the last window, which the next one starts from
+    carried: Optional[List[int]] = None
+
+    for _ in range(policy.windows):
+        # the window starts at the latest round, the provider may lag behind
+        round = client.status()["last-round"]
+        suggestedParams = getSuggestedParams(client, params, round)
+        suggestedParams.first = round
+        suggestedParams.last = round + policy.validRounds
+
+        txns = build(suggestedParams)
+        txns[0][0].lease = os.urandom(LEASE_SIZE)
+        fees: Optional[List[int]] = [max(txn.fee, constants.min_txn_fee) for txn, _ in txns]
+        if carried is not None and len(carried) == len(txns):
+            fees = [max(fee, carriedFee) for fee, carriedFee in zip(fees, carried)]
+
+        futures = []
+        lastTxID = ""
+        sentFees: Optional[List[int]] = None
+        bumpRound = round
+
+        while True:
+            # an attempt sent in the last valid round can no longer make it
+            if fees is not None and bumpRound <= round < suggestedParams.last:
+                if len(futures) > 0:
+                    # the pool knows before the block follower does
+                    pending = client.pending_transaction_info(lastTxID)
+                    if pending.get("confirmed-round", 0) > 0:
+                        return PendingTxnResponse(pending)
+
+                for (txn, _), fee in zip(txns, fees):
+                    txn.fee = fee
+                    txn.group = None
+                transaction.assign_group_id([txn for txn, _ in txns])
+                signedTxns = sign_many(txns)
+                if sentFees is not None and fees != sentFees:
+                    _recordBump()
+                sentFees = fees
+
+                try:
+                    client.send_transactions(signedTxns)
+                except error.AlgodHTTPError as e:
+                    if _isFeeRejection(e):
+                        # the pool turned it away, bump again without waiting
+                        lastError = e
+                        fees = _bumped(fees, policy)
+                        continue
+                    if len(futures) == 0:
+                        raise
+                    lastError = e
+                    if not _isLeaseRejection(e):
+                        # rejected for itself, as any other attempt in the
+                        # window would be
+                        fees = None
+                    # otherwise an earlier attempt is still in the pool, and
+                    # its lease keeps any other from replacing it; this one is
+                    # sent again later, in case the pool drops the earlier one
+                else:
+                    lastTxID = signedTxns[0].get_txid()
+                    futures.append(engine.track(lastTxID, suggestedParams.last - round + 1))
+                    fees = _bumped(fees, policy)
+                bumpRound = round + policy.bumpAfterRounds
+
+            confirmed = [future for future in futures if future.done() and future.exception() is None]
+            if len(confirmed) > 0:
+                return confirmed[0].result()
+
+            if all(future.done() for future in futures) and (
+                    round >= suggestedParams.last or (fees is None and len(futures) == 0)
+            ):
+                for future in futures:
+                    lastError = future.exception()
+                break
+
+            round = client.status_after_block(round)["last-round"]
+
+        carried = fees if fees is not None else sentFees
+
+    raise Exception("Group not confirmed in {} windows of {} rounds: {}".format(
+        policy.windows, policy.validRounds, lastError
+    ))
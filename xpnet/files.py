@@ -0,0 +1,45 @@
+"""Files shared by processes, like the caches of compiled programs and keys."""
+
+import contextlib
+import os
+import tempfile
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore[assignment]
+
+
+def atomicWrite(path: str, data: bytes) -> None:
+    """Replace the file at path with data, so that readers see either the old
+    or the new content, never part of it.
+
+    The file is created readable and writable by its owner only.
+    """
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmpPath, path)
+    except BaseException:
+        os.unlink(tmpPath)
+        raise
+
+
+@contextlib.contextmanager
+def fileLock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on the file at path, across processes.
+
+    Where there is no fcntl, nothing is locked.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,117 @@
+"""A block follower streaming the bridge events of an XP app.
+
+Every block is fetched once and all of its events are decoded from it, see
+xpnet.events, instead of looking transactions up one by one:
+
+    store = CheckpointStore("indexer.db")
+    for event in BridgeIndexer(client, appID, store).events(stop):
+        handle(event)
+
+The last round whose events were all consumed is kept in the store, and a
+new indexer with the same store and name starts after it. A round is
+checkpointed once the generator is resumed after its last event, so an
+interrupted consumer gets the events of the round it was in again: delivery
+is at least once, and events carry their round and txID for deduplication.
+"""
+
+import sqlite3
+import threading
+from typing import Iterator, Optional
+
+from algosdk.v2client.algod import AlgodClient
+
+from .confirmation import decodeBlock
+from .events import BridgeEvent, blockEvents
+
+
+class CheckpointStore:
+    """The rounds indexers have consumed, by name, in a SQLite database.
+
+    Args:
+        path: The path of the database, created if missing.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints (name TEXT PRIMARY KEY, round INTEGER NOT NULL)"
+        )
+
+    def get(self, name: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute("SELECT round FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, name: str, round: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints (name, round) VALUES (?, ?)", (name, round)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class BridgeIndexer:
+    """Streams the bridge events of an app, block by block.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        store: Where the consumed rounds are checkpointed.
+        name: The name of the checkpoint, so indexers of different apps can
+            share a store.
+        startRound: The first round to scan when the store has no checkpoint
+            yet. If omitted, the scan starts at the latest round.
+    """
+
+    def __init__(
+            self,
+            client: AlgodClient,
+            appID: int,
+            store: CheckpointStore,
+            name: Optional[str] = None,
+            startRound: Optional[int] = None,
+    ) -> None:
+        self.client = client
+        self.appID = appID
+        self.store = store
+        self.name = name if name is not None else "bridge-{}".format(appID)
+        self.startRound = startRound
+
+    def nextRound(self) -> int:
+        """The first round that has not been consumed."""
+        checkpoint = self.store.get(self.name)
+        if checkpoint is not None:
+            return checkpoint + 1
+        if self.startRound is not None:
+            return self.startRound
+        return self.client.status()["last-round"]
+
+    def events(
+            self, stop: Optional[threading.Event] = None, until: Optional[int] = None
+    ) -> Iterator[BridgeEvent]:
+        """Yield the events of every round from the checkpoint on.
+
+        Args:
+            stop: Stops the scan before the next round when set.
+            until: The last round to scan. If omitted, new rounds are waited
+                for forever.
+        """
+        round = self.nextRound()
+        latest = self.client.status()["last-round"]
+
+        while (stop is None or not stop.is_set()) and (until is None or round <= until):
+            if round > latest:
+                latest = self.client.status_after_block(round - 1)["last-round"]
+                continue
+
+            block = decodeBlock(self.client.block_info(round, response_format="msgpack"))
+            for event in blockEvents(block, self.appID):
+                yield event
+
+            self.store.set(self.name, round)
+            round += 1
@@ -0,0 +1,317 @@
+"""A Python model of the XP app's approval program.
+
+XpnetAppLogic runs an app call the way xpnet.contracts.approval_program
+does, on the global state and boxes of an AppCall, and raises AppRejected
+where the program would fail. It is the one model of the program in xpnet:
+the fake algod of xpnet.testing.fake runs app calls with it, and
+xpnet.preflight checks groups with it before they are sent.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from algosdk import encoding
+from algosdk.future import transaction
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from .approvals import (
+    APP_CALL_BUDGET,
+    MAX_THRESHOLD,
+    MAX_VALIDATORS,
+    PUBLIC_KEY_SIZE,
+    SIGNATURE_COST,
+    SIGNATURE_SIZE,
+    VALIDATE_BASE_COST,
+    VALIDATORS_BOX,
+    actionPayload,
+)
+from .events import FreezeLog, ValidateLog, WithdrawLog, encodeLog
+from .replay import PAGE_SIZE, actionBit, actionBoxName, actionPage
+from .whitelist import (
+    ASSET_ID_SIZE,
+    MAX_SHARD_IDS,
+    MAX_SHARDS,
+    shardContains,
+    shardOf,
+    whitelistBoxName,
+)
+
+MAX_BOX_SIZE = 32768
+MAX_UINT = 2 ** 64 - 1
+
+
+class AppRejected(Exception):
+    """Raised by an AppLogic to reject an app call."""
+
+
+class AppCall:
+    """The context an AppLogic runs an app call in.
+
+    globalState can be changed in place, boxes through the box methods, and
+    log appends to the logs of the call.
+    """
+
+    def __init__(
+            self,
+            appID: int,
+            creator: str,
+            txn: Dict[str, Any],
+            group: List[Dict[str, Any]],
+            groupIndex: int,
+            globalState: Dict[bytes, Union[int, bytes]],
+            boxes: Dict[bytes, bytes],
+            round: int,
+    ) -> None:
+        self.appID = appID
+        self.creator = creator
+        self.txn = txn
+        self.group = group
+        self.groupIndex = groupIndex
+        self.globalState = globalState
+        self.boxes = boxes
+        self.round = round
+        self.logs: List[bytes] = []
+
+    @property
+    def isCreate(self) -> bool:
+        return self.txn.get("apid", 0) == 0
+
+    @property
+    def sender(self) -> str:
+        return encoding.encode_address(self.txn["snd"])
+
+    @property
+    def onCompletion(self) -> int:
+        return self.txn.get("apan", transaction.OnComplete.NoOpOC)
+
+    @property
+    def args(self) -> List[bytes]:
+        return self.txn.get("apaa", [])
+
+    @property
+    def accounts(self) -> List[str]:
+        return [encoding.encode_address(a) for a in self.txn.get("apat", [])]
+
+    @property
+    def assets(self) -> List[int]:
+        return self.txn.get("apas", [])
+
+    def arg(self, index: int) -> bytes:
+        if index >= len(self.args):
+            raise AppRejected("invalid ApplicationArgs index {}".format(index))
+        return self.args[index]
+
+    def btoi(self, index: int) -> int:
+        value = self.arg(index)
+        if len(value) > 8:
+            raise AppRejected("btoi arg too long")
+        return int.from_bytes(value, "big")
+
+    def log(self, data: bytes) -> None:
+        self.logs.append(data)
+
+    def _checkBoxRef(self, name: bytes) -> None:
+        # box references are shared by the app calls of a group, index 0
+        # being the app a transaction calls
+        for i, txn in enumerate(self.group):
+            if txn.get("type") != "appl":
+                continue
+            calledApp = self.appID if i == self.groupIndex else txn.get("apid", 0)
+            for ref in txn.get("apbx", []):
+                index = ref.get("i", 0)
+                refApp = calledApp if index == 0 else txn.get("apfa", [])[index - 1]
+                if refApp == self.appID and ref.get("n", b"") == name:
+                    return
+        raise AppRejected("invalid Box reference {!r}".format(name))
+
+    def boxGet(self, name: bytes) -> Optional[bytes]:
+        self._checkBoxRef(name)
+        return self.boxes.get(name)
+
+    def boxPut(self, name: bytes, value: bytes) -> None:
+        self._checkBoxRef(name)
+        if len(value) > MAX_BOX_SIZE:
+            raise AppRejected("box size too large")
+        if name in self.boxes and len(self.boxes[name]) != len(value):
+            raise AppRejected("attempt to resize box {!r}".format(name))
+        self.boxes[name] = value
+
+    def boxDelete(self, name: bytes) -> bool:
+        self._checkBoxRef(name)
+        return self.boxes.pop(name, None) is not None
+
+
+AppLogic = Callable[[AppCall], None]
+
+
+def approveAll(call: AppCall) -> None:
+    pass
+
+
+def _add(a: int, b: int) -> int:
+    if a + b > MAX_UINT:
+        raise AppRejected("+ overflowed")
+    return a + b
+
+
+class XpnetAppLogic:
+    """A Python model of the XP app approval program."""
+
+    def __call__(self, call: AppCall) -> None:
+        state = call.globalState
+
+        if call.isCreate:
+            self.onCreate(call)
+            return
+
+        if call.onCompletion != transaction.OnComplete.NoOpOC:
+            raise AppRejected("rejected on completion {}".format(call.onCompletion))
+
+        method = call.arg(0)
+        if method == b"validate_transfer_nft":
+            if not call.accounts:
+                raise AppRejected("invalid Accounts index 1")
+            if not self.validateAction(call, call.btoi(1), call.arg(0), call.arg(2), call.accounts[0]):
+                raise AppRejected("action {} was already executed".format(call.btoi(1)))
+            state[b"nft_cnt"] = _add(state[b"nft_cnt"], 1)
+            call.log(encodeLog(ValidateLog(call.accounts[0], call.btoi(1), state[b"nft_cnt"])))
+        elif method == b"freeze_nft" or method == b"withdraw_nft":
+            if not call.assets:
+                raise AppRejected("invalid Assets index 0")
+            if method == b"freeze_nft" and not self.isWhitelisted(call, call.assets[0]):
+                raise AppRejected("asset {} is not whitelisted".format(call.assets[0]))
+            state[b"action_cnt"] = _add(state[b"action_cnt"], 1)
+            state[b"tx_fees"] = _add(state[b"tx_fees"], call.btoi(1))
+            record = FreezeLog if method == b"freeze_nft" else WithdrawLog
+            call.log(encodeLog(record(
+                call.sender, call.assets[0], call.btoi(1), state[b"action_cnt"], state[b"tx_fees"]
+            )))
+        elif method == b"set_whitelist":
+            self.setWhitelist(call)
+        elif method == b"prune_actions":
+            if call.sender != call.creator:
+                raise AppRejected("only the creator can prune actions")
+            call.boxDelete(actionBoxName(state[b"ac_low"]))
+            state[b"ac_low"] = state[b"ac_low"] + 1
+        elif method == b"check_whitelist":
+            if not call.assets:
+                raise AppRejected("invalid Assets index 0")
+            if not self.isWhitelisted(call, call.assets[0]):
+                raise AppRejected("asset is not whitelisted")
+        elif method == b"set_validators":
+            self.setValidators(call)
+        elif method == b"budget":
+            pass
+        else:
+            raise AppRejected("unknown method {!r}".format(method))
+
+    def validateAction(
+            self, call: AppCall, actionID: int, action: bytes, actionData: bytes, receiver: str
+    ) -> bool:
+        page = actionPage(actionID)
+        if page < call.globalState[b"ac_low"]:
+            raise AppRejected("action {} was pruned".format(actionID))
+
+        self.verifyApprovals(call, actionPayload(call.appID, actionID, action, actionData, receiver))
+
+        name = actionBoxName(page)
+        value = call.boxGet(name)
+        if value is None:
+            value = bytes(PAGE_SIZE)
+
+        byte, bit = actionBit(actionID)
+        if value[byte] & (0x80 >> bit):
+            return False
+
+        marked = bytearray(value)
+        marked[byte] |= 0x80 >> bit
+        call.boxPut(name, bytes(marked))
+        return True
+
+    def verifyApprovals(self, call: AppCall, payload: bytes) -> None:
+        threshold = call.globalState[b"threshold"]
+
+        # the signature checks of every validation of the group run on the
+        # budget pooled by its app calls
+        appCalls = [txn for txn in call.group if txn.get("type") == "appl"]
+        validations = sum(
+            1 for txn in appCalls
+            if txn.get("apid") == call.appID and txn.get("apaa", [b""])[0] == b"validate_transfer_nft"
+        )
+        if len(appCalls) * APP_CALL_BUDGET < validations * (VALIDATE_BASE_COST + SIGNATURE_COST * threshold):
+            raise AppRejected("dynamic cost budget exceeded")
+
+        validators = call.boxGet(VALIDATORS_BOX)
+        if validators is None:
+            raise AppRejected("validators are not set")
+
+        signers = call.arg(3)
+        signatures = call.arg(4)
+        if len(signers) != threshold or len(signatures) != threshold * SIGNATURE_SIZE:
+            raise AppRejected("expected {} approvals".format(threshold))
+
+        for i, signer in enumerate(signers):
+            if i > 0 and signer <= signers[i - 1]:
+                raise AppRejected("approvals are not in increasing validator order")
+            if (signer + 1) * PUBLIC_KEY_SIZE > len(validators):
+                raise AppRejected("unknown validator {}".format(signer))
+            key = validators[signer * PUBLIC_KEY_SIZE:(signer + 1) * PUBLIC_KEY_SIZE]
+            try:
+                VerifyKey(key).verify(payload, signatures[i * SIGNATURE_SIZE:(i + 1) * SIGNATURE_SIZE])
+            except BadSignatureError:
+                raise AppRejected("invalid approval of validator {}".format(signer))
+
+    def setValidators(self, call: AppCall) -> None:
+        if call.sender != call.creator:
+            raise AppRejected("only the creator can set the validators")
+
+        keys = call.arg(1)
+        if (
+                len(keys) % PUBLIC_KEY_SIZE != 0
+                or len(keys) < call.globalState[b"threshold"] * PUBLIC_KEY_SIZE
+                or len(keys) > MAX_VALIDATORS * PUBLIC_KEY_SIZE
+        ):
+            raise AppRejected("invalid validators")
+
+        call.boxDelete(VALIDATORS_BOX)
+        call.boxPut(VALIDATORS_BOX, keys)
+
+    def setWhitelist(self, call: AppCall) -> None:
+        if call.sender != call.creator:
+            raise AppRejected("only the creator can set the whitelist")
+
+        shard = call.btoi(1)
+        value = call.arg(2)
+        if shard >= call.globalState[b"wl_shards"]:
+            raise AppRejected("invalid whitelist shard {}".format(shard))
+        if len(value) % ASSET_ID_SIZE != 0 or len(value) > MAX_SHARD_IDS * ASSET_ID_SIZE:
+            raise AppRejected("invalid whitelist shard value")
+
+        name = whitelistBoxName(shard)
+        call.boxDelete(name)
+        if len(value) > 0:
+            call.boxPut(name, value)
+
+    def isWhitelisted(self, call: AppCall, assetID: int) -> bool:
+        value = call.boxGet(whitelistBoxName(shardOf(assetID, call.globalState[b"wl_shards"])))
+        return value is not None and shardContains(value, assetID)
+
+    def onCreate(self, call: AppCall) -> None:
+        state = call.globalState
+
+        threshold = call.btoi(0)
+        if threshold <= 0 or threshold > MAX_THRESHOLD:
+            raise AppRejected("invalid threshold")
+
+        shards = call.btoi(3)
+        if shards <= 0 or shards > MAX_SHARDS:
+            raise AppRejected("invalid whitelist shard count")
+
+        state[b"action_cnt"] = 0
+        state[b"tx_fees"] = 0
+        state[b"nft_cnt"] = 0
+        state[b"wl_shards"] = shards
+        state[b"ac_low"] = 0
+        state[b"threshold"] = threshold
+        state[b"nft_id"] = call.arg(1)
+        state[b"token_id"] = call.arg(2)
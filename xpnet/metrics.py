@@ -0,0 +1,242 @@
+"""Instrumentation of algod calls and of the stages of the operations.
+
+Metrics are off by default, and every hook then costs a single global
+lookup. They are turned on process-wide with enableMetrics:
+
+    registry = enableMetrics()
+    client = InstrumentedAlgodClient(getAlgodClient())
+    freeze_nft(client, ...)
+    registry.snapshot()
+
+InstrumentedAlgodClient counts the calls to every algod endpoint and their
+errors, and records their latency. The operations record the time they spend
+getting suggested params, signing and waiting for confirmation, and their
+own duration and errors. The confirmation engine records the number of
+rounds each transaction took to confirm and counts the transactions that
+left the pool with an error. Listeners added to the registry get
+every observation as it is made, for exporting them elsewhere.
+"""
+
+import bisect
+import contextlib
+import functools
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple, TypeVar
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = [
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+]
+
+# upper bounds of the rounds to confirm histogram buckets
+ROUND_BUCKETS = [1, 2, 3, 4, 5, 8, 10, 20, 50, 100, 1000]
+
+Labels = Tuple[Tuple[str, str], ...]
+Listener = Callable[[str, Dict[str, str], float], None]
+
+
+class Histogram:
+    """Counts of observations by bucket, with their count and sum."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: List[float]) -> None:
+        self.bounds = bounds
+        # the last count is of the observations above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": [
+                [bound, count] for bound, count in zip(self.bounds + [float("inf")], self.counts)
+            ],
+        }
+
+
+class MetricsRegistry:
+    """Counters and histograms by name and labels."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = dict()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = dict()
+        self._listeners: List[Listener] = []
+
+    def addListener(self, listener: Listener) -> None:
+        """Call listener with the name, labels and value of every observation."""
+        with self._lock:
+            # replaced rather than appended to, so it is iterated unlocked
+            self._listeners = self._listeners + [listener]
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            listeners = self._listeners
+        for listener in listeners:
+            listener(name, labels, value)
+
+    def observe(self, name: str, value: float, buckets: List[float] = LATENCY_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(buckets)
+                self._histograms[key] = histogram
+            histogram.observe(value)
+            listeners = self._listeners
+        for listener in listeners:
+            listener(name, labels, value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            histogram = self._histograms.get((name, tuple(sorted(labels.items()))))
+            return None if histogram is None else histogram.snapshot()
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Get every metric, by name, as a list of labels and values."""
+        result: Dict[str, List[Dict[str, Any]]] = dict()
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                result.setdefault(name, []).append({"labels": dict(labels), **histogram.snapshot()})
+        return result
+
+
+_registry: Optional[MetricsRegistry] = None
+
+
+def enableMetrics(registry: Optional[MetricsRegistry] = None) -> MetricsRegistry:
+    """Start recording metrics into registry, or into a new registry."""
+    global _registry
+    _registry = registry if registry is not None else MetricsRegistry()
+    return _registry
+
+
+def disableMetrics() -> None:
+    global _registry
+    _registry = None
+
+
+def getRegistry() -> Optional[MetricsRegistry]:
+    """The registry metrics are recorded into, or None if they are disabled."""
+    return _registry
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry: MetricsRegistry, name: str, labels: Dict[str, str]) -> None:
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+_NOT_TIMED = contextlib.nullcontext()
+
+
+def timed(stage: str) -> ContextManager[None]:
+    """Time a stage of an operation into the stage_seconds histogram."""
+    registry = _registry
+    if registry is None:
+        return _NOT_TIMED
+    return _Timer(registry, "stage_seconds", {"stage": stage})
+
+
+def recordRounds(rounds: int) -> None:
+    """Record the number of rounds a transaction took to confirm."""
+    registry = _registry
+    if registry is not None:
+        registry.observe("rounds_to_confirm", rounds, ROUND_BUCKETS)
+
+
+def recordPoolError() -> None:
+    registry = _registry
+    if registry is not None:
+        registry.increment("pool_errors")
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def instrumented(operation: str) -> Callable[[F], F]:
+    """Record the duration and errors of every call of an operation."""
+
+    def decorate(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            registry = _registry
+            if registry is None:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                registry.increment("operation_errors", operation=operation)
+                raise
+            finally:
+                registry.observe("operation_seconds", time.perf_counter() - start, operation=operation)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+class InstrumentedAlgodClient:
+    """Wraps an algod client and records every call made through it.
+
+    Calls are counted and timed by endpoint, that is by client method, into
+    algod_calls and algod_seconds, and failed calls are counted into
+    algod_errors. Nothing is recorded while metrics are disabled.
+
+    Args:
+        client: An algod client.
+    """
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            registry = _registry
+            if registry is None:
+                return attr(*args, **kwargs)
+
+            registry.increment("algod_calls", endpoint=name)
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                registry.increment("algod_errors", endpoint=name)
+                raise
+            finally:
+                registry.observe("algod_seconds", time.perf_counter() - start, endpoint=name)
+
+        return call
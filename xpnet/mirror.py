@@ -0,0 +1,193 @@
+import threading
+from base64 import b64decode
+from typing import Dict, Optional, Union
+
+from algosdk.v2client.algod import AlgodClient
+
+from .confirmation import getConfirmationEngine
+from .utils import PendingTxnResponse, decodeStateDelta, getAppGlobalState
+from .whitelist import getWhitelist, shardContains, shardOf
+
+
+class AppStateMirror:
+    """An in-memory copy of an app's global state.
+
+    The mirror is seeded from application_info once. After that it applies the
+    global state delta of every app call to the app that the client's
+    confirmation engine confirms, so reads never go to algod. The whitelist
+    boxes are mirrored too, from the arguments of set_whitelist calls. Changes
+    made by transactions nobody waits on through this client are not seen,
+    so the whole state is fetched again every reconcileRounds rounds, on a
+    thread of the mirror's own so the confirmation engine keeps following
+    blocks meanwhile. A mirror no longer needed must be closed, or the engine
+    keeps it alive and updated.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the app to mirror.
+        reconcileRounds: The number of rounds between two full fetches of the
+            global state. 0 disables reconciliation.
+    """
+
+    def __init__(self, client: AlgodClient, appID: int, reconcileRounds: int = 100) -> None:
+        self.client = client
+        self.appID = appID
+        self.reconcileRounds = reconcileRounds
+
+        self._lock = threading.Lock()
+        self._state: Dict[bytes, Union[int, bytes]] = dict()
+        # round of the latest delta applied to each key
+        self._keyRounds: Dict[bytes, int] = dict()
+        # value of each whitelist shard box, and the round it was last set in
+        self._whitelist: Dict[int, bytes] = dict()
+        self._shardRounds: Dict[int, int] = dict()
+        self._round = 0
+        self._reconciledRound = 0
+        self._reconciling = False
+        self._reconcileThread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.reconcile()
+
+        engine = getConfirmationEngine(client)
+        engine.addRoundListener(self._onRound)
+        engine.addResponseListener(self.apply)
+
+    def close(self) -> None:
+        """Stop following the confirmation engine, and wait for a reconcile
+        in progress. The mirrored state is kept, but no longer updated."""
+        engine = getConfirmationEngine(self.client)
+        engine.removeRoundListener(self._onRound)
+        engine.removeResponseListener(self.apply)
+
+        with self._lock:
+            self._closed = True
+            thread = self._reconcileThread
+        if thread is not None:
+            thread.join()
+
+    def reconcile(self) -> None:
+        """Replace the mirrored state with the state algod reports."""
+        round = self._round
+        state = dict(getAppGlobalState(self.client, self.appID))
+        shards = state.get(b"wl_shards", 0)
+        whitelist = getWhitelist(self.client, self.appID, shards) if isinstance(shards, int) else dict()
+
+        with self._lock:
+            # keep changes confirmed while the state was being fetched
+            for key, keyRound in self._keyRounds.items():
+                if keyRound > round:
+                    if key in self._state:
+                        state[key] = self._state[key]
+                    else:
+                        state.pop(key, None)
+
+            for shard, shardRound in self._shardRounds.items():
+                if shardRound > round:
+                    if shard in self._whitelist:
+                        whitelist[shard] = self._whitelist[shard]
+                    else:
+                        whitelist.pop(shard, None)
+
+            self._state = state
+            self._whitelist = whitelist
+            self._reconciledRound = max(self._reconciledRound, round)
+
+            # later fetches start at a later round, so they keep these anyway
+            self._keyRounds = {
+                key: keyRound for key, keyRound in self._keyRounds.items() if keyRound > round
+            }
+            self._shardRounds = {
+                shard: shardRound for shard, shardRound in self._shardRounds.items() if shardRound > round
+            }
+
+    def apply(self, response: PendingTxnResponse) -> None:
+        """Apply the changes of a confirmed transaction to the app."""
+        txn = response.txn["txn"]
+        appID = txn.get("apid", response.applicationIndex)
+        if appID != self.appID:
+            return
+
+        confirmedRound = response.confirmedRound or self._round
+
+        args = [b64decode(arg) for arg in txn.get("apaa", [])]
+        if len(args) == 3 and args[0] == b"set_whitelist":
+            shard = int.from_bytes(args[1], "big")
+            with self._lock:
+                if len(args[2]) > 0:
+                    self._whitelist[shard] = args[2]
+                else:
+                    self._whitelist.pop(shard, None)
+                self._shardRounds[shard] = confirmedRound
+
+        if response.globalStateDelta is None:
+            return
+
+        delta = decodeStateDelta(response.globalStateDelta)
+
+        with self._lock:
+            for key, value in delta.items():
+                if value is None:
+                    self._state.pop(key, None)
+                else:
+                    self._state[key] = value
+                self._keyRounds[key] = confirmedRound
+
+    def _onRound(self, round: int) -> None:
+        self._round = max(self._round, round)
+
+        if self.reconcileRounds > 0 and round - self._reconciledRound >= self.reconcileRounds:
+            self._startReconcile()
+
+    def _startReconcile(self) -> None:
+        with self._lock:
+            if self._reconciling or self._closed:
+                return
+            self._reconciling = True
+            self._reconcileThread = threading.Thread(
+                target=self._reconcileInBackground, name="xpnet-mirror-reconcile", daemon=True
+            )
+            self._reconcileThread.start()
+
+    def _reconcileInBackground(self) -> None:
+        try:
+            self.reconcile()
+        except Exception:
+            # the mirror stays as it is, and the next round tries again
+            pass
+        finally:
+            with self._lock:
+                self._reconciling = False
+                self._reconcileThread = None
+
+    def get(
+            self, key: bytes, default: Optional[Union[int, bytes]] = None
+    ) -> Optional[Union[int, bytes]]:
+        with self._lock:
+            return self._state.get(key, default)
+
+    def __getitem__(self, key: bytes) -> Union[int, bytes]:
+        with self._lock:
+            return self._state[key]
+
+    def __contains__(self, key: bytes) -> bool:
+        with self._lock:
+            return key in self._state
+
+    def snapshot(self) -> Dict[bytes, Union[int, bytes]]:
+        """Get a copy of the whole mirrored state."""
+        with self._lock:
+            return dict(self._state)
+
+    def getWhitelistShard(self, shard: int) -> Optional[bytes]:
+        """Get the value of a whitelist shard box, or None if it does not exist."""
+        with self._lock:
+            return self._whitelist.get(shard)
+
+    def isWhitelisted(self, assetID: int) -> bool:
+        with self._lock:
+            shards = self._state.get(b"wl_shards")
+            if not isinstance(shards, int) or shards == 0:
+                return False
+            value = self._whitelist.get(shardOf(assetID, shards))
+        return value is not None and shardContains(value, assetID)
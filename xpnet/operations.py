@@ -1,12 +1,47 @@
-from typing import Tuple, List
+from base64 import b64decode
+from typing import Dict, Tuple, List, Mapping, NamedTuple, Optional, Union
 
-from algosdk import encoding
+from algosdk import encoding, error
 from algosdk.future import transaction
 from algosdk.v2client.algod import AlgodClient
 
-from .account import Account
-from .contracts import approval_program, clear_state_program
-from .utils import fullyCompileContract, waitForTransaction, getAppGlobalState
+from .account import Account, sign_many
+from .approvals import (
+    PUBLIC_KEY_SIZE,
+    VALIDATORS_BOX,
+    ActionApproval,
+    budgetCalls,
+    packApprovals,
+    packValidators,
+    validatorsMinBalance,
+)
+from .fees import FeePolicy, submitWithFeeBump
+from .metrics import instrumented
+from .mirror import AppStateMirror
+from .params import SuggestedParamsProvider, getSuggestedParams
+from .preflight import Preflight
+from .programs import APPROVAL, CLEAR_STATE, buildPrograms, loadPrograms
+from .replay import PAGE_MIN_BALANCE, actionBoxName, actionBoxRef
+from .utils import (
+    PendingTxnResponse,
+    compileProgram,
+    getAppAddress,
+    waitForTransaction,
+    waitForTransactions,
+    getAppGlobalState,
+)
+from .whitelist import (
+    ACCOUNT_MIN_BALANCE,
+    getWhitelist,
+    packWhitelist,
+    shardOf,
+    whitelistBoxName,
+    whitelistMinBalance,
+    whitelistShardCount,
+)
+
+# the largest atomic transaction group algod accepts
+MAX_GROUP_SIZE = 16
 
 APPROVAL_PROGRAM = b""
 CLEAR_STATE_PROGRAM = b""
@@ -15,6 +50,10 @@ CLEAR_STATE_PROGRAM = b""
 def getContracts(client: AlgodClient) -> Tuple[bytes, bytes]:
     """Get the compiled TEAL contracts for the auction.
 
+    The programs are read from the compiled program cache, which is filled by
+    running xpnet.contracts. Only when the cache is missing or stale are they
+    generated with pyteal and compiled by algod.
+
     Args:
         client: An algod client that has the ability to compile TEAL programs.
 
@@ -26,31 +65,45 @@ def getContracts(client: AlgodClient) -> Tuple[bytes, bytes]:
     global CLEAR_STATE_PROGRAM
 
     if len(APPROVAL_PROGRAM) == 0:
-        APPROVAL_PROGRAM = fullyCompileContract(client, approval_program())
-        CLEAR_STATE_PROGRAM = fullyCompileContract(client, clear_state_program())
+        programs = loadPrograms()
+        if programs is None:
+            programs = buildPrograms(lambda teal: compileProgram(client, teal))
+
+        APPROVAL_PROGRAM = programs[APPROVAL]
+        CLEAR_STATE_PROGRAM = programs[CLEAR_STATE]
 
     return APPROVAL_PROGRAM, CLEAR_STATE_PROGRAM
 
 
+@instrumented("createXpApp")
 def createXpApp(
         client: AlgodClient,
         sender: Account,
         validators: List[Account],
-        nft_whitelist: List[str],
+        nft_whitelist: List[int],
         threshold: int,
         nft_id: int,
         token_id: int,
+        params: Optional[SuggestedParamsProvider] = None,
 ) -> int:
     """Create a XP app.
 
+    The validators and the whitelist are stored in boxes of the app, so the
+    app account is funded for them by the sender, see set_validators and
+    set_whitelist.
+
     Args:
         client: An algod client.
         sender: The account that will create the XP application.
-        validators:
-        nft_whitelist:
-        threshold:
+        validators: The accounts whose signatures approve actions, at most
+            xpnet.approvals.MAX_VALIDATORS.
+        nft_whitelist: The IDs of the whitelisted NFT assets.
+        threshold: The number of validators that must approve an action, at
+            most xpnet.approvals.MAX_THRESHOLD.
         nft_id:
         token_id:
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
 
     Returns:
         The ID of the newly created XP app.
@@ -60,10 +113,13 @@ def createXpApp(
     globalSchema = transaction.StateSchema(num_uints=7, num_byte_slices=2)
     localSchema = transaction.StateSchema(num_uints=0, num_byte_slices=0)
 
+    shards = whitelistShardCount(nft_whitelist)
+
     app_args = [
         threshold,
         nft_id,
         token_id,
+        shards,
     ]
 
     txn = transaction.ApplicationCreateTxn(
@@ -73,22 +129,259 @@ def createXpApp(
         clear_program=clear,
         global_schema=globalSchema,
         local_schema=localSchema,
-        accounts=[validator.getAddress() for validator in validators],
-        foreign_assets=nft_whitelist,
         app_args=app_args,
-        sp=client.suggested_params(),
+        sp=getSuggestedParams(client, params),
     )
 
-    signedTxn = txn.sign(sender.getPrivateKey())
+    signedTxn = sender.sign(txn)
 
     client.send_transaction(signedTxn)
 
     response = waitForTransaction(client, signedTxn.get_txid())
     assert response.applicationIndex is not None and response.applicationIndex > 0
-    return response.applicationIndex
+    appID = response.applicationIndex
+
+    _sendGroups(client, _setupTxns(
+        appID, sender, validators, nft_whitelist, shards, getSuggestedParams(client, params)
+    ))
+
+    return appID
+
+
+def _setupTxns(
+        appID: int,
+        creator: Account,
+        validators: List[Account],
+        nft_whitelist: List[int],
+        shards: int,
+        suggestedParams: transaction.SuggestedParams,
+) -> List[List[Tuple[transaction.Transaction, Account]]]:
+    # the validators box of a new app, then its whitelist boxes
+    group = _setValidatorsTxns(
+        appID, creator, validators, ACCOUNT_MIN_BALANCE + validatorsMinBalance(len(validators)),
+        suggestedParams,
+    )
+    transaction.assign_group_id([txn for txn, _ in group])
+    groups = [group]
+
+    if len(nft_whitelist) > 0:
+        # the balance funded above beyond the validators box
+        groups += _setWhitelistTxns(
+            appID, creator, packWhitelist(nft_whitelist, shards), dict(), ACCOUNT_MIN_BALANCE,
+            suggestedParams,
+        )
+    return groups
+
+
+def _setValidatorsTxns(
+        appID: int,
+        creator: Account,
+        validators: List[Account],
+        funding: int,
+        suggestedParams: transaction.SuggestedParams,
+) -> List[Tuple[transaction.Transaction, Account]]:
+    txns: List[Tuple[transaction.Transaction, Account]] = []
+    if funding > 0:
+        txns.append((
+            transaction.PaymentTxn(
+                sender=creator.getAddress(),
+                receiver=getAppAddress(appID),
+                amt=funding,
+                sp=suggestedParams,
+            ),
+            creator,
+        ))
+
+    txns.append((
+        transaction.ApplicationCallTxn(
+            sender=creator.getAddress(),
+            index=appID,
+            on_complete=transaction.OnComplete.NoOpOC,
+            app_args=[b"set_validators", packValidators(validators)],
+            boxes=[(appID, VALIDATORS_BOX)],
+            sp=suggestedParams,
+        ),
+        creator,
+    ))
+    return txns
+
+
+def _setWhitelistTxns(
+        appID: int,
+        creator: Account,
+        packed: Dict[int, bytes],
+        current: Dict[int, bytes],
+        balance: int,
+        suggestedParams: transaction.SuggestedParams,
+) -> List[List[Tuple[transaction.Transaction, Account]]]:
+    # shards are deleted and recreated one call at a time, so the app
+    # account needs the larger of both boxes of every shard meanwhile
+    shards = set(packed) | set(current)
+    required = ACCOUNT_MIN_BALANCE + sum(
+        max(
+            whitelistMinBalance({shard: packed[shard]}) if shard in packed else 0,
+            whitelistMinBalance({shard: current[shard]}) if shard in current else 0,
+        )
+        for shard in shards
+    )
+
+    txns: List[Tuple[transaction.Transaction, Account]] = []
+    if balance < required:
+        txns.append((
+            transaction.PaymentTxn(
+                sender=creator.getAddress(),
+                receiver=getAppAddress(appID),
+                amt=required - balance,
+                sp=suggestedParams,
+            ),
+            creator,
+        ))
+
+    for shard in sorted(shards):
+        value = packed.get(shard, b"")
+        if current.get(shard, b"") == value:
+            continue
+        txns.append((
+            transaction.ApplicationCallTxn(
+                sender=creator.getAddress(),
+                index=appID,
+                on_complete=transaction.OnComplete.NoOpOC,
+                app_args=[b"set_whitelist", shard, value],
+                boxes=[(appID, whitelistBoxName(shard))],
+                sp=suggestedParams,
+            ),
+            creator,
+        ))
+
+    groups = [txns[i:i + MAX_GROUP_SIZE] for i in range(0, len(txns), MAX_GROUP_SIZE)]
+    for group in groups:
+        transaction.assign_group_id([txn for txn, _ in group])
+    return groups
+
+
+def _sendGroups(
+        client: AlgodClient,
+        groups: List[List[Tuple[transaction.Transaction, Account]]],
+        timeout: int = 10,
+) -> None:
+    signedTxns = sign_many([txn for group in groups for txn in group])
+
+    start = 0
+    for group in groups:
+        client.send_transactions(signedTxns[start:start + len(group)])
+        start += len(group)
+
+    # every transaction is waited on, so that mirrors see every app call
+    waitForTransactions(client, [txn.get_txid() for txn in signedTxns], timeout)
+
+
+def getWhitelistShards(
+        client: AlgodClient, appID: int, mirror: Optional[AppStateMirror] = None
+) -> int:
+    """Get the number of whitelist shards of an XP app.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        mirror: A mirror of the app's global state. If omitted, the global
+            state is fetched from algod.
+    """
+    if mirror is not None:
+        shards = mirror[b"wl_shards"]
+    else:
+        shards = getAppGlobalState(client, appID)[b"wl_shards"]
+    assert isinstance(shards, int)
+    return shards
+
+
+@instrumented("set_whitelist")
+def set_whitelist(
+        client: AlgodClient,
+        appID: int,
+        creator: Account,
+        nft_whitelist: List[int],
+        params: Optional[SuggestedParamsProvider] = None,
+) -> None:
+    """Replace the NFT whitelist of an XP app.
+
+    Only the shards whose content changes are written. The app account is
+    topped up by the creator if the new boxes need a higher minimum balance.
+    The number of shards is fixed when the app is created, so a whitelist
+    much larger than the one the app was created with may not fit.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        creator: The account that created the app.
+        nft_whitelist: The IDs of the whitelisted NFT assets.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+    """
+    shards = getWhitelistShards(client, appID)
+
+    packed = packWhitelist(nft_whitelist, shards)
+    current = getWhitelist(client, appID, shards)
+    info = client.account_info(getAppAddress(appID))
+    # the balance not held for the validators box and the replay bitmap
+    balance = info["amount"] - info["min-balance"] + ACCOUNT_MIN_BALANCE + whitelistMinBalance(current)
+
+    groups = _setWhitelistTxns(
+        appID, creator, packed, current, balance, getSuggestedParams(client, params)
+    )
+    if len(groups) > 0:
+        _sendGroups(client, groups)
+
+
+@instrumented("set_validators")
+def set_validators(
+        client: AlgodClient,
+        appID: int,
+        creator: Account,
+        validators: List[Account],
+        params: Optional[SuggestedParamsProvider] = None,
+) -> None:
+    """Replace the validators of an XP app.
+
+    The app account is topped up by the creator if the new validators box
+    needs a higher minimum balance. The order of validators matters, the
+    approvals of an action refer to validators by their index.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        creator: The account that created the app.
+        validators: The accounts whose signatures approve actions, at least
+            the threshold of the app and at most
+            xpnet.approvals.MAX_VALIDATORS of them.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+    """
+    info = client.account_info(getAppAddress(appID))
+    try:
+        box = client.application_box_by_name(appID, VALIDATORS_BOX)
+        current = validatorsMinBalance(len(b64decode(box["value"])) // PUBLIC_KEY_SIZE)
+    except error.AlgodHTTPError as e:
+        if e.code != 404:
+            raise
+        current = 0
+
+    spare = info["amount"] - info["min-balance"]
+    funding = max(0, validatorsMinBalance(len(validators)) - current - spare)
+
+    txns = _setValidatorsTxns(
+        appID, creator, validators, funding, getSuggestedParams(client, params)
+    )
+    _sendGroups(client, [txns])
 
 
-def closeXpApp(client: AlgodClient, appID: int, closer: Account):
+@instrumented("closeXpApp")
+def closeXpApp(
+        client: AlgodClient,
+        appID: int,
+        closer: Account,
+        params: Optional[SuggestedParamsProvider] = None,
+        mirror: Optional[AppStateMirror] = None,
+):
     """Close an XP application.
 
     Args:
@@ -97,8 +390,16 @@ def closeXpApp(client: AlgodClient, appID: int, closer: Account):
         closer: The account initiating the close transaction. This must be
             either the seller or auction creator if you wish to close the
             auction before it starts. Otherwise, this can be any account.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+        mirror: A mirror of the app's global state. If omitted, the state is
+            fetched from algod.
     """
-    appGlobalState = getAppGlobalState(client, appID)
+    appGlobalState: Mapping[bytes, Union[int, bytes]]
+    if mirror is not None:
+        appGlobalState = mirror.snapshot()
+    else:
+        appGlobalState = getAppGlobalState(client, appID)
 
     nftID = appGlobalState[b"nft_id"]
 
@@ -109,47 +410,50 @@ def closeXpApp(client: AlgodClient, appID: int, closer: Account):
         index=appID,
         accounts=accounts,
         foreign_assets=[nftID],
-        sp=client.suggested_params()
+        sp=getSuggestedParams(client, params)
     )
-    signedDeleteTxn = deleteTxn.sign(closer.getPrivateKey())
+    signedDeleteTxn = closer.sign(deleteTxn)
 
     client.send_transaction(signedDeleteTxn)
 
     waitForTransaction(client, signedDeleteTxn.get_txid())
 
 
+def _preflight(
+        preflight: Optional[Preflight], txns: List[Tuple[transaction.Transaction, Account]]
+) -> List[Tuple[transaction.Transaction, Account]]:
+    # a group the app would reject is not sent at all
+    if preflight is not None:
+        reason = preflight.check([txn for txn, _ in txns])
+        if reason is not None:
+            raise Exception("Pre-flight check failed: {}".format(reason))
+    return txns
+
+
 def validate_transfer():
     # TODO:
     pass
 
 
-def validate_transfer_nft(
-        client: AlgodClient,
+def _validateTransferNftTxns(
         appID: int,
         sender: Account,
         receiver: Account,
         action_id: int,
-        action_data: str
-):
-    """
-    Transfer Foreign NFT
-
-    Args:
-        client:
-        appID:
-        sender:
-        receiver:
-        action_id:
-        action_data:
-    """
-    suggestedParams = client.suggested_params()
+        action_data: str,
+        approvals: List[ActionApproval],
+        threshold: int,
+        suggestedParams: transaction.SuggestedParams,
+) -> List[Tuple[transaction.Transaction, Account]]:
+    signers, signatures = packApprovals(approvals, threshold)
 
     appCallTxn = transaction.ApplicationCallTxn(
         sender=sender.getAddress(),
         index=appID,
         on_complete=transaction.OnComplete.NoOpOC,
-        app_args=[b"validate_transfer_nft", action_id, action_data],
+        app_args=[b"validate_transfer_nft", action_id, action_data, signers, signatures],
         accounts=[receiver.getAddress()],
+        boxes=[actionBoxRef(appID, action_id), (appID, VALIDATORS_BOX)],
         sp=suggestedParams,
     )
     createNftTxn = transaction.AssetConfigTxn(
@@ -157,14 +461,255 @@ def validate_transfer_nft(
         total=1,
         decimals=0,
         sp=suggestedParams,
+        strict_empty_address_check=False,
+        # identical for every action otherwise, see the budget calls
+        note=action_id.to_bytes(8, "big"),
+    )
+    txns = [(appCallTxn, sender), (createNftTxn, sender)]
+
+    # the signature checks need the opcode budget of more app calls
+    for i in range(budgetCalls(threshold)):
+        txns.append((
+            transaction.ApplicationCallTxn(
+                sender=sender.getAddress(),
+                index=appID,
+                on_complete=transaction.OnComplete.NoOpOC,
+                app_args=[b"budget"],
+                sp=suggestedParams,
+                # the calls are otherwise identical, to each other and to those
+                # of other actions of the sender, and algod takes a transaction
+                # only once
+                note=action_id.to_bytes(8, "big") + i.to_bytes(8, "big"),
+            ),
+            sender,
+        ))
+
+    transaction.assign_group_id([txn for txn, _ in txns])
+    return txns
+
+
+@instrumented("validate_transfer_nft")
+def validate_transfer_nft(
+        client: AlgodClient,
+        appID: int,
+        sender: Account,
+        receiver: Account,
+        action_id: int,
+        action_data: str,
+        approvals: List[ActionApproval],
+        params: Optional[SuggestedParamsProvider] = None,
+        mirror: Optional[AppStateMirror] = None,
+        preflight: Optional[Preflight] = None,
+):
+    """
+    Transfer Foreign NFT
+
+    The action is approved by the signatures of threshold validators on its
+    payload, collected off chain with xpnet.approvals.approveAction, so a
+    single group executes it whatever the threshold.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        sender: The account submitting the action, which needs not be a
+            validator.
+        receiver:
+        action_id:
+        action_data:
+        approvals: The approvals of the action, at least threshold of them.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+        mirror: A mirror of the app's global state. If omitted, the
+            threshold is fetched from algod.
+        preflight: If given, the group is checked against the app before
+            it is sent, and not sent if the app would reject it.
+    """
+    appGlobalState: Mapping[bytes, Union[int, bytes]]
+    if mirror is not None:
+        appGlobalState = mirror.snapshot()
+    else:
+        appGlobalState = getAppGlobalState(client, appID)
+
+    threshold = appGlobalState[b"threshold"]
+    assert isinstance(threshold, int)
+
+    txns = _validateTransferNftTxns(
+        appID, sender, receiver, action_id, action_data, approvals, threshold,
+        getSuggestedParams(client, params),
     )
+    _preflight(preflight, txns)
+    signedTxns = sign_many(txns)
+
+    client.send_transactions(signedTxns)
+
+    waitForTransaction(client, signedTxns[0].get_txid())
+
+
+@instrumented("fund_action_pages")
+def fund_action_pages(
+        client: AlgodClient,
+        appID: int,
+        funder: Account,
+        pages: int,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> None:
+    """Fund the app account for more pages of the replay bitmap.
+
+    The app creates a page the first time one of its actions is validated,
+    which fails unless the app account can afford the page's box.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        funder: The account paying for the pages.
+        pages: The number of pages to fund, each for xpnet.replay.PAGE_BITS
+            action IDs.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+    """
+    appAddress = getAppAddress(appID)
+    amount = pages * PAGE_MIN_BALANCE
+    balance = client.account_info(appAddress)["amount"]
+    if balance < ACCOUNT_MIN_BALANCE:
+        amount += ACCOUNT_MIN_BALANCE - balance
 
-    signedAppCallTxn = appCallTxn.sign(sender.getPrivateKey())
-    signedCreateNftTxn = createNftTxn.sign(sender.getPrivateKey())
+    txn = transaction.PaymentTxn(
+        sender=funder.getAddress(),
+        receiver=appAddress,
+        amt=amount,
+        sp=getSuggestedParams(client, params),
+    )
+    signedTxn = funder.sign(txn)
 
-    client.send_transactions([signedAppCallTxn, signedCreateNftTxn])
+    client.send_transaction(signedTxn)
 
-    waitForTransaction(client, appCallTxn.get_txid())
+    waitForTransaction(client, signedTxn.get_txid())
+
+
+@instrumented("prune_actions")
+def prune_actions(
+        client: AlgodClient,
+        appID: int,
+        creator: Account,
+        belowPage: int,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> None:
+    """Delete the pages of the replay bitmap below a page.
+
+    Actions in pruned pages can no longer be validated, and the minimum
+    balance of their boxes is freed.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        creator: The account that created the app.
+        belowPage: The first page to keep.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+    """
+    low = getAppGlobalState(client, appID)[b"ac_low"]
+    assert isinstance(low, int)
+
+    suggestedParams = getSuggestedParams(client, params)
+    txns = [
+        (
+            transaction.ApplicationCallTxn(
+                sender=creator.getAddress(),
+                index=appID,
+                on_complete=transaction.OnComplete.NoOpOC,
+                app_args=[b"prune_actions"],
+                boxes=[(appID, actionBoxName(page))],
+                sp=suggestedParams,
+                # the calls are otherwise identical
+                note=page.to_bytes(8, "big"),
+            ),
+            creator,
+        )
+        for page in range(low, belowPage)
+    ]
+    if len(txns) == 0:
+        return
+
+    groups = [txns[i:i + MAX_GROUP_SIZE] for i in range(0, len(txns), MAX_GROUP_SIZE)]
+    for group in groups:
+        transaction.assign_group_id([txn for txn, _ in group])
+    _sendGroups(client, groups)
+
+
+class NftSpec(NamedTuple):
+    """The metadata of one NFT minted by mint_nfts."""
+
+    unitName: str = ""
+    assetName: str = ""
+    url: str = ""
+    note: Optional[bytes] = None
+
+
+@instrumented("mint_nfts")
+def mint_nfts(
+        client: AlgodClient,
+        creator: Account,
+        nfts: List[NftSpec],
+        timeout: int = 10,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> List[int]:
+    """Mint many NFTs at once.
+
+    The asset creations are packed into atomic groups of up to MAX_GROUP_SIZE
+    transactions sharing one set of suggested params. Every group is sent
+    before any of them is waited on.
+
+    Args:
+        client: An algod client.
+        creator: The account creating the NFTs. It is also their manager,
+            reserve, freeze and clawback account.
+        nfts: The metadata of each NFT. Identical specs in the same round make
+            identical transactions, use distinct notes to tell them apart.
+        timeout: The number of rounds to wait for the groups to be confirmed.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+
+    Returns:
+        The IDs of the created assets, in the order of nfts.
+    """
+    suggestedParams = getSuggestedParams(client, params)
+
+    txns = [
+        transaction.AssetCreateTxn(
+            sender=creator.getAddress(),
+            total=1,  # NFTs have totalIssuance of exactly 1
+            decimals=0,  # NFTs have decimals of exactly 0
+            default_frozen=False,
+            manager=creator.getAddress(),
+            reserve=creator.getAddress(),
+            freeze=creator.getAddress(),
+            clawback=creator.getAddress(),
+            unit_name=nft.unitName,
+            asset_name=nft.assetName,
+            url=nft.url,
+            note=nft.note,
+            sp=suggestedParams,
+        )
+        for nft in nfts
+    ]
+
+    for start in range(0, len(txns), MAX_GROUP_SIZE):
+        transaction.assign_group_id(txns[start:start + MAX_GROUP_SIZE])
+
+    signedTxns = sign_many([(txn, creator) for txn in txns])
+
+    for start in range(0, len(signedTxns), MAX_GROUP_SIZE):
+        client.send_transactions(signedTxns[start:start + MAX_GROUP_SIZE])
+
+    responses = waitForTransactions(
+        client, [txn.get_txid() for txn in signedTxns], timeout
+    )
+
+    assetIDs: List[int] = []
+    for response in responses:
+        assert response.assetIndex is not None and response.assetIndex > 0
+        assetIDs.append(response.assetIndex)
+    return assetIDs
 
 
 def validate_unfreeze():
@@ -222,24 +767,13 @@ def withdraw():
     pass
 
 
-def withdraw_nft(
-        client: AlgodClient,
+def _withdrawNftTxns(
         appID: int,
         nftHolder: Account,
         nftID: int,
-        fee: int
-) -> None:
-    """Withdraw Foreign NFT
-
-    Args:
-        client: An algod client.
-        appID: The ID of the XP app.
-        nftHolder:
-        nftID:
-        fee: Transaction fee
-    """
-    suggestedParams = client.suggested_params()
-
+        fee: int,
+        suggestedParams: transaction.SuggestedParams,
+) -> List[Tuple[transaction.Transaction, Account]]:
     appCallTxn = transaction.ApplicationCallTxn(
         sender=nftHolder.getAddress(),
         index=appID,
@@ -256,31 +790,73 @@ def withdraw_nft(
         strict_empty_address_check=False
     )
 
-    signedAppCallTxn = appCallTxn.sign(nftHolder.getPrivateKey())
-    signedDestroyNftTxn = destroyNftTxn.sign(nftHolder.getPrivateKey())
+    return [(appCallTxn, nftHolder), (destroyNftTxn, nftHolder)]
 
-    client.send_transactions([signedAppCallTxn, signedDestroyNftTxn])
 
-    waitForTransaction(client, appCallTxn.get_txid())
+@instrumented("withdraw_nft")
+def withdraw_nft(
+        client: AlgodClient,
+        appID: int,
+        nftHolder: Account,
+        nftID: int,
+        fee: int,
+        params: Optional[SuggestedParamsProvider] = None,
+        feePolicy: Optional[FeePolicy] = None,
+        preflight: Optional[Preflight] = None,
+) -> None:
+    """Withdraw Foreign NFT
 
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        nftHolder:
+        nftID:
+        fee: Transaction fee
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+        feePolicy: If given, the group is resubmitted with higher fees
+            until it is confirmed, see xpnet.fees.
+        preflight: If given, the group is checked against the app before
+            it is sent, and not sent if the app would reject it.
+    """
+    if feePolicy is not None:
+        submitWithFeeBump(
+            client,
+            lambda sp: _preflight(preflight, _withdrawNftTxns(appID, nftHolder, nftID, fee, sp)),
+            feePolicy,
+            params,
+        )
+        return
 
-def freeze_nft(
-        client: AlgodClient,
+    txns = _preflight(preflight, _withdrawNftTxns(
+        appID, nftHolder, nftID, fee, getSuggestedParams(client, params)
+    ))
+    transaction.assign_group_id([txn for txn, _ in txns])
+    signedTxns = sign_many(txns)
+
+    client.send_transactions(signedTxns)
+
+    waitForTransaction(client, signedTxns[0].get_txid())
+
+
+def _freezeNftTxns(
         appID: int,
         funder: Account,
         nftHolder: Account,
         receiver: Account,
         nftID: int,
-        fees: int
-) -> None:
-    suggestedParams = client.suggested_params()
-
+        fees: int,
+        shards: int,
+        suggestedParams: transaction.SuggestedParams,
+) -> List[Tuple[transaction.Transaction, Account]]:
     appCallTxn = transaction.ApplicationCallTxn(
         sender=funder.getAddress(),
         index=appID,
         on_complete=transaction.OnComplete.NoOpOC,
         app_args=[b"freeze_nft", fees],
         foreign_assets=[nftID],
+        # the app looks the NFT up in its whitelist shard
+        boxes=[(appID, whitelistBoxName(shardOf(nftID, shards)))],
         sp=suggestedParams,
     )
 
@@ -292,12 +868,175 @@ def freeze_nft(
         sp=suggestedParams,
     )
 
-    signedAppCallTxn = appCallTxn.sign(receiver.getPrivateKey())
-    signedTransferNftTxn = transferNftTxn.sign(nftHolder.getPrivateKey())
+    return [(appCallTxn, funder), (transferNftTxn, nftHolder)]
+
+
+@instrumented("freeze_nft")
+def freeze_nft(
+        client: AlgodClient,
+        appID: int,
+        funder: Account,
+        nftHolder: Account,
+        receiver: Account,
+        nftID: int,
+        fees: int,
+        params: Optional[SuggestedParamsProvider] = None,
+        feePolicy: Optional[FeePolicy] = None,
+        preflight: Optional[Preflight] = None,
+        mirror: Optional[AppStateMirror] = None,
+) -> None:
+    """Freeze NFT
+
+    The app only freezes NFTs of its whitelist.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        funder: The account paying the fees.
+        nftHolder: The account holding the NFT.
+        receiver: The account the NFT is transferred to.
+        nftID: The ID of the NFT.
+        fees: The bridge fees.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+        feePolicy: If given, the group is resubmitted with higher fees
+            until it is confirmed, see xpnet.fees.
+        preflight: If given, the group is checked against the app before
+            it is sent, and not sent if the app would reject it.
+        mirror: A mirror of the app's global state. If omitted, the number
+            of whitelist shards is fetched from algod.
+    """
+    shards = getWhitelistShards(client, appID, mirror)
+
+    if feePolicy is not None:
+        submitWithFeeBump(
+            client,
+            lambda sp: _preflight(
+                preflight, _freezeNftTxns(appID, funder, nftHolder, receiver, nftID, fees, shards, sp)
+            ),
+            feePolicy,
+            params,
+        )
+        return
 
-    client.send_transactions([signedAppCallTxn, signedTransferNftTxn])
+    txns = _preflight(preflight, _freezeNftTxns(
+        appID, funder, nftHolder, receiver, nftID, fees, shards,
+        getSuggestedParams(client, params),
+    ))
+    transaction.assign_group_id([txn for txn, _ in txns])
+    signedTxns = sign_many(txns)
 
-    waitForTransaction(client, appCallTxn.get_txid())
+    client.send_transactions(signedTxns)
+
+    waitForTransaction(client, signedTxns[0].get_txid())
+
+
+class FreezeRequest(NamedTuple):
+    """The arguments of one freeze_nft call, for submit_nft_actions."""
+
+    funder: Account
+    nftHolder: Account
+    receiver: Account
+    nftID: int
+    fees: int
+
+
+class WithdrawRequest(NamedTuple):
+    """The arguments of one withdraw_nft call, for submit_nft_actions."""
+
+    nftHolder: Account
+    nftID: int
+    fee: int
+
+
+class ValidateRequest(NamedTuple):
+    """The arguments of one validate_transfer_nft call, for xpnet.outbox."""
+
+    sender: Account
+    receiver: Account
+    actionID: int
+    actionData: str
+    approvals: List[ActionApproval]
+
+
+def _packGroups(
+        actions: List[List[Tuple[transaction.Transaction, Account]]],
+        maxGroupSize: int,
+) -> List[List[Tuple[transaction.Transaction, Account]]]:
+    groups: List[List[Tuple[transaction.Transaction, Account]]] = []
+    group: List[Tuple[transaction.Transaction, Account]] = []
+
+    for txns in actions:
+        if len(group) + len(txns) > maxGroupSize:
+            groups.append(group)
+            group = []
+        group.extend(txns)
+
+    if len(group) > 0:
+        groups.append(group)
+
+    return groups
+
+
+@instrumented("submit_nft_actions")
+def submit_nft_actions(
+        client: AlgodClient,
+        appID: int,
+        requests: List[Union[FreezeRequest, WithdrawRequest]],
+        timeout: int = 10,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> List[PendingTxnResponse]:
+    """Submit many freeze and withdraw actions at once.
+
+    The transactions of all actions are built from one set of suggested
+    params and packed into atomic groups of up to MAX_GROUP_SIZE
+    transactions, never splitting an action across groups. Every group is
+    sent before any of them is waited on, and all of them are confirmed
+    together.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        requests: The actions to submit.
+        timeout: The number of rounds to wait for the groups to be confirmed.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+
+    Returns:
+        The PendingTxnResponse of the app call of each action, in the order of
+        requests.
+    """
+    suggestedParams = getSuggestedParams(client, params)
+    shards = getWhitelistShards(client, appID) if any(
+        isinstance(request, FreezeRequest) for request in requests
+    ) else 0
+
+    actions: List[List[Tuple[transaction.Transaction, Account]]] = []
+    for request in requests:
+        if isinstance(request, FreezeRequest):
+            actions.append(_freezeNftTxns(appID, *request, shards, suggestedParams))
+        elif isinstance(request, WithdrawRequest):
+            actions.append(_withdrawNftTxns(appID, *request, suggestedParams))
+        else:
+            raise Exception("Unexpected bridge action: {}".format(request))
+
+    # an action's app call is always its first transaction
+    appCallTxns = [txns[0][0] for txns in actions]
+
+    groups = _packGroups(actions, MAX_GROUP_SIZE)
+    for group in groups:
+        transaction.assign_group_id([txn for txn, _ in group])
+
+    signedTxns = sign_many([txn for group in groups for txn in group])
+
+    start = 0
+    for group in groups:
+        client.send_transactions(signedTxns[start:start + len(group)])
+        start += len(group)
+
+    return waitForTransactions(
+        client, [txn.get_txid() for txn in appCallTxns], timeout
+    )
 
 
 def freeze(client: AlgodClient, appID: int, ) -> None:
@@ -0,0 +1,550 @@
+"""A durable queue of bridge actions in front of the operations.
+
+The operations send their transactions and wait for them, and remember
+nothing: an action whose process dies in between is either lost or sent
+again without knowing whether it already went through. An Outbox keeps every
+action in a SQLite database instead, and a scheduler sends them:
+
+    outbox = Outbox(client, appID, "actions.db", signers=[bridge, holder])
+    outbox.enqueue(FreezeRequest(bridge, holder, receiver, nftID, 1))
+    outbox.run(stop)
+
+Every round the scheduler packs up to batchSize pending actions into atomic
+groups built from one set of suggested params. The signed groups are written
+to the database before they are sent, so after a restart the exact same
+bytes are sent again, which algod ignores if they are already in the ledger.
+Submitted groups are resolved by scanning each block once for their
+transaction IDs, from a checkpoint that is kept in the database as well. A
+group that is not in any block up to its last valid round can never be
+confirmed, so its actions are safely built and sent again. A group algod
+rejects on evaluating it is split, and an action rejected on its own is
+marked failed. A group turned away for a reason that passes, like a full
+pool, is built and sent again in the next step. A group whose send failed
+without an answer from algod, which may have taken it, is resolved like any
+other submitted group. With a Preflight, actions the app would reject are
+marked failed before they are sent, see xpnet.preflight.
+
+enqueue blocks while maxPending actions are pending or submitted, which
+keeps a producer from running ahead of the chain.
+"""
+
+import copy
+import json
+import sqlite3
+import threading
+from base64 import b64decode, b64encode
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from algosdk import encoding, error
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .account import Account, sign_many
+from .approvals import ActionApproval
+from .confirmation import blockTransactions, decodeBlock
+from .operations import (
+    MAX_GROUP_SIZE,
+    FreezeRequest,
+    ValidateRequest,
+    WithdrawRequest,
+    _freezeNftTxns,
+    _validateTransferNftTxns,
+    _withdrawNftTxns,
+    getWhitelistShards,
+)
+from .params import SuggestedParamsProvider, getSuggestedParams
+from .preflight import Preflight
+from .utils import getAppGlobalState, isEvalRejection
+
+FREEZE = "freeze_nft"
+WITHDRAW = "withdraw_nft"
+VALIDATE = "validate_transfer_nft"
+
+# states of an action
+PENDING = "pending"
+SUBMITTED = "submitted"
+CONFIRMED = "confirmed"
+FAILED = "failed"
+
+# states of a batch, one atomic group
+EXPIRED = "expired"
+REJECTED = "rejected"
+
+# a short validity window bounds the blocks scanned for a lost group
+DEFAULT_VALID_ROUNDS = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE,
+    kind TEXT NOT NULL,
+    request TEXT NOT NULL,
+    state TEXT NOT NULL,
+    -- sent in a group of its own, after its group was rejected
+    isolated INTEGER NOT NULL DEFAULT 0,
+    batch INTEGER,
+    txid TEXT,
+    confirmed_round INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS actions_state ON actions (state);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    txids TEXT NOT NULL,
+    signed BLOB NOT NULL,
+    first_valid INTEGER NOT NULL,
+    last_valid INTEGER NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batches_state ON batches (state);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+Request = Union[FreezeRequest, WithdrawRequest, ValidateRequest]
+
+
+class ActionStatus(NamedTuple):
+    """The state of one action of an Outbox."""
+
+    id: int
+    kind: str
+    state: str
+    # the ID of the action's app call, once submitted
+    txID: Optional[str]
+    confirmedRound: Optional[int]
+    error: Optional[str]
+
+
+def encodeRequest(request: Request) -> Tuple[str, str]:
+    """Serialize a request without its keys, as its kind and JSON."""
+    if isinstance(request, FreezeRequest):
+        return FREEZE, json.dumps({
+            "funder": request.funder.getAddress(),
+            "nftHolder": request.nftHolder.getAddress(),
+            "receiver": request.receiver.getAddress(),
+            "nftID": request.nftID,
+            "fees": request.fees,
+        })
+    if isinstance(request, WithdrawRequest):
+        return WITHDRAW, json.dumps({
+            "nftHolder": request.nftHolder.getAddress(),
+            "nftID": request.nftID,
+            "fee": request.fee,
+        })
+    if isinstance(request, ValidateRequest):
+        return VALIDATE, json.dumps({
+            "sender": request.sender.getAddress(),
+            "receiver": request.receiver.getAddress(),
+            "actionID": request.actionID,
+            "actionData": request.actionData,
+            "approvals": [
+                [approval.validatorIndex, b64encode(approval.signature).decode()]
+                for approval in request.approvals
+            ],
+        })
+    raise Exception("Unexpected bridge action: {}".format(request))
+
+
+def decodeRequest(kind: str, data: str, signers: Dict[str, Account]) -> Request:
+    """Rebuild a request serialized by encodeRequest.
+
+    Args:
+        kind: The kind of the request.
+        data: The JSON of the request.
+        signers: The account of every address the request refers to.
+    """
+    fields = json.loads(data)
+
+    def account(address: str) -> Account:
+        if address not in signers:
+            raise Exception("No key for account {}".format(address))
+        return signers[address]
+
+    if kind == FREEZE:
+        return FreezeRequest(
+            account(fields["funder"]), account(fields["nftHolder"]), account(fields["receiver"]),
+            fields["nftID"], fields["fees"],
+        )
+    if kind == WITHDRAW:
+        return WithdrawRequest(account(fields["nftHolder"]), fields["nftID"], fields["fee"])
+    if kind == VALIDATE:
+        return ValidateRequest(
+            account(fields["sender"]), account(fields["receiver"]), fields["actionID"],
+            fields["actionData"],
+            [ActionApproval(index, b64decode(signature)) for index, signature in fields["approvals"]],
+        )
+    raise Exception("Unexpected bridge action kind: {}".format(kind))
+
+
+def _requestAccounts(request: Request) -> List[Account]:
+    return [value for value in request if isinstance(value, Account)]
+
+
+class _Group(NamedTuple):
+    # the actions packed into one atomic group, with the app call of each
+    actionIDs: List[int]
+    appCalls: List[transaction.Transaction]
+    txns: List[Tuple[transaction.Transaction, Account]]
+    isolated: bool
+
+
+class Outbox:
+    """A durable queue of freeze, withdraw and validate actions of an app.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        path: The path of the SQLite database, created if missing.
+        signers: The accounts of the actions, needed to sign the actions
+            still pending after a restart. The accounts of enqueued requests
+            are added to them.
+        maxPending: The number of pending and submitted actions above which
+            enqueue blocks.
+        batchSize: The most actions sent per round.
+        validRounds: The size of the validity window of the groups.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod every round.
+        preflight: If given, every action is checked against the app before
+            it is sent, and marked failed if the app would reject it.
+    """
+
+    def __init__(
+            self,
+            client: AlgodClient,
+            appID: int,
+            path: str,
+            signers: Iterable[Account] = (),
+            maxPending: int = 1024,
+            batchSize: int = 8 * MAX_GROUP_SIZE,
+            validRounds: int = DEFAULT_VALID_ROUNDS,
+            params: Optional[SuggestedParamsProvider] = None,
+            preflight: Optional[Preflight] = None,
+    ) -> None:
+        self.client = client
+        self.appID = appID
+        self.maxPending = maxPending
+        self.batchSize = batchSize
+        self.validRounds = validRounds
+        self.params = params
+        self.preflight = preflight
+
+        self._signers: Dict[str, Account] = {signer.getAddress(): signer for signer in signers}
+        self._threshold: Optional[int] = None
+        self._shards: Optional[int] = None
+        self._resumed = False
+
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def enqueue(self, request: Request, key: Optional[str] = None, timeout: Optional[float] = None) -> int:
+        """Add an action to the queue.
+
+        Args:
+            request: The action.
+            key: A unique key of the action. Enqueueing a key again returns
+                the existing action instead of adding one, so a producer can
+                safely enqueue again after a restart.
+            timeout: The most seconds to wait for room in the queue. If
+                omitted, wait as long as it takes.
+
+        Returns:
+            The ID of the action.
+        """
+        kind, data = encodeRequest(request)
+
+        with self._changed:
+            for account in _requestAccounts(request):
+                self._signers[account.getAddress()] = account
+
+            if key is not None:
+                row = self._db.execute("SELECT id FROM actions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    return row[0]
+
+            if not self._changed.wait_for(lambda: self.inFlight() < self.maxPending, timeout):
+                raise Exception("Outbox is full, {} actions in flight".format(self.maxPending))
+
+            cursor = self._db.execute(
+                "INSERT INTO actions (key, kind, request, state) VALUES (?, ?, ?, ?)",
+                (key, kind, data, PENDING),
+            )
+            return cursor.lastrowid
+
+    def inFlight(self) -> int:
+        """The number of pending and submitted actions."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM actions WHERE state IN (?, ?)", (PENDING, SUBMITTED)
+            ).fetchone()[0]
+
+    def status(self, actionID: int) -> ActionStatus:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, state, txid, confirmed_round, error FROM actions WHERE id = ?",
+                (actionID,),
+            ).fetchone()
+        if row is None:
+            raise Exception("Unknown action {}".format(actionID))
+        return ActionStatus(*row)
+
+    def run(self, stop: threading.Event) -> None:
+        """Run the scheduler, one step per round, until stop is set."""
+        round = self.client.status()["last-round"]
+        while not stop.is_set():
+            self.step(round)
+            round = self.client.status_after_block(round)["last-round"]
+
+    def step(self, round: Optional[int] = None) -> int:
+        """Resolve the submitted groups up to a round, then send a batch.
+
+        Args:
+            round: The latest round. If omitted, it is fetched from algod.
+
+        Returns:
+            The number of actions sent.
+        """
+        if round is None:
+            round = self.client.status()["last-round"]
+
+        if not self._resumed:
+            self._resend(round)
+            self._resumed = True
+
+        self._scan(round)
+        return self._submit(round)
+
+    def _meta(self, key: str) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _setMeta(self, key: str, value: int) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _resend(self, round: int) -> None:
+        # groups sent before a restart that may still make it: the same bytes
+        # are sent again, algod drops them if they were already confirmed
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT signed FROM batches WHERE state = ? AND last_valid > ?", (SUBMITTED, round)
+            ).fetchall()
+
+        for signed, in rows:
+            try:
+                self.client.send_raw_transaction(b64encode(signed).decode())
+            except error.AlgodHTTPError:
+                pass
+
+    def _scan(self, round: int) -> None:
+        with self._lock:
+            batches = self._db.execute(
+                "SELECT id, txids, last_valid FROM batches WHERE state = ?", (SUBMITTED,)
+            ).fetchall()
+            scanned = self._meta("scanned_round")
+
+        if len(batches) == 0 or scanned is None:
+            with self._lock:
+                self._setMeta("scanned_round", round)
+            return
+
+        # an atomic group is confirmed when any of its transactions is
+        byTxID = {json.loads(txids)[0]: (batchID, lastValid) for batchID, txids, lastValid in batches}
+
+        for blockRound in range(scanned + 1, round + 1):
+            block = decodeBlock(self.client.block_info(blockRound, response_format="msgpack"))
+            confirmed = [
+                byTxID.pop(txID)[0] for txID, _ in blockTransactions(block) if txID in byTxID
+            ]
+            expired = [batchID for batchID, lastValid in byTxID.values() if lastValid <= blockRound]
+            for txID in [txID for txID, (_, lastValid) in byTxID.items() if lastValid <= blockRound]:
+                del byTxID[txID]
+
+            with self._changed:
+                self._db.execute("BEGIN IMMEDIATE")
+                for batchID in confirmed:
+                    self._db.execute("UPDATE batches SET state = ? WHERE id = ?", (CONFIRMED, batchID))
+                    self._db.execute(
+                        "UPDATE actions SET state = ?, confirmed_round = ? WHERE batch = ?",
+                        (CONFIRMED, blockRound, batchID),
+                    )
+                for batchID in expired:
+                    self._db.execute("UPDATE batches SET state = ? WHERE id = ?", (EXPIRED, batchID))
+                    self._db.execute(
+                        "UPDATE actions SET state = ?, batch = NULL, txid = NULL WHERE batch = ?",
+                        (PENDING, batchID),
+                    )
+                self._setMeta("scanned_round", blockRound)
+                self._db.execute("COMMIT")
+                if confirmed:
+                    self._changed.notify_all()
+
+            if len(byTxID) == 0:
+                with self._lock:
+                    self._setMeta("scanned_round", round)
+                return
+
+    def _getThreshold(self) -> int:
+        if self._threshold is None:
+            threshold = getAppGlobalState(self.client, self.appID)[b"threshold"]
+            assert isinstance(threshold, int)
+            self._threshold = threshold
+        return self._threshold
+
+    def _getShards(self) -> int:
+        if self._shards is None:
+            self._shards = getWhitelistShards(self.client, self.appID)
+        return self._shards
+
+    def _build(
+            self, kind: str, data: str, suggestedParams: transaction.SuggestedParams
+    ) -> List[Tuple[transaction.Transaction, Account]]:
+        request = decodeRequest(kind, data, self._signers)
+        if isinstance(request, FreezeRequest):
+            return _freezeNftTxns(self.appID, *request, self._getShards(), suggestedParams)
+        if isinstance(request, WithdrawRequest):
+            return _withdrawNftTxns(self.appID, *request, suggestedParams)
+
+        txns = _validateTransferNftTxns(
+            self.appID, *request, self._getThreshold(), suggestedParams
+        )
+        # packed into a group of the outbox's own
+        for txn, _ in txns:
+            txn.group = None
+        return txns
+
+    def _submit(self, round: int) -> int:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, request, isolated FROM actions WHERE state = ? ORDER BY id LIMIT ?",
+                (PENDING, self.batchSize),
+            ).fetchall()
+        if len(rows) == 0:
+            return 0
+
+        # the window starts at the round just scanned, the provider may not
+        # have seen it
+        suggestedParams = copy.copy(getSuggestedParams(self.client, self.params, round))
+        suggestedParams.first = round
+        suggestedParams.last = round + self.validRounds
+
+        groups: List[_Group] = []
+        for actionID, kind, data, isolated in rows:
+            try:
+                txns = self._build(kind, data, suggestedParams)
+            except Exception as e:
+                self._fail([actionID], str(e))
+                continue
+
+            if self.preflight is not None:
+                reason = self.preflight.check([txn for txn, _ in txns], round)
+                if reason is not None:
+                    self._fail([actionID], "Pre-flight check failed: {}".format(reason))
+                    continue
+
+            if (
+                    isolated
+                    or len(groups) == 0
+                    or groups[-1].isolated
+                    or len(groups[-1].txns) + len(txns) > MAX_GROUP_SIZE
+            ):
+                groups.append(_Group([], [], [], bool(isolated)))
+            groups[-1].actionIDs.append(actionID)
+            groups[-1].appCalls.append(txns[0][0])
+            groups[-1].txns.extend(txns)
+
+        for group in groups:
+            transaction.assign_group_id([txn for txn, _ in group.txns])
+
+        signedTxns = sign_many([txn for group in groups for txn in group.txns])
+
+        start = 0
+        for group in groups:
+            self._send(group, signedTxns[start:start + len(group.txns)], suggestedParams)
+            start += len(group.txns)
+        return sum(len(group.actionIDs) for group in groups)
+
+    def _send(
+            self,
+            group: "_Group",
+            signedGroup: List[transaction.SignedTransaction],
+            suggestedParams: transaction.SuggestedParams,
+    ) -> None:
+        txIDs = [stxn.get_txid() for stxn in signedGroup]
+        signed = b"".join(b64decode(encoding.msgpack_encode(stxn)) for stxn in signedGroup)
+
+        # recorded before it is sent, so that a restart sends the same group
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            batchID = self._db.execute(
+                "INSERT INTO batches (txids, signed, first_valid, last_valid, state) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(txIDs), signed, suggestedParams.first, suggestedParams.last, SUBMITTED),
+            ).lastrowid
+            self._db.executemany(
+                "UPDATE actions SET state = ?, batch = ?, txid = ? WHERE id = ?",
+                [
+                    (SUBMITTED, batchID, appCall.get_txid(), actionID)
+                    for actionID, appCall in zip(group.actionIDs, group.appCalls)
+                ],
+            )
+            self._db.execute("COMMIT")
+
+        try:
+            self.client.send_raw_transaction(b64encode(signed).decode())
+        except error.AlgodHTTPError as e:
+            if isEvalRejection(e):
+                self._rejected(batchID, len(group.actionIDs), str(e))
+            elif e.code is not None and e.code < 500:
+                self._requeue(batchID)
+            # otherwise algod may have taken the group before it failed, so
+            # it stays submitted until it is seen in a block or expires
+        except Exception:
+            # timed out or lost the connection, as above
+            pass
+
+    def _requeue(self, batchID: int) -> None:
+        # turned away without being evaluated, sent again as they were
+        with self._changed:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("UPDATE batches SET state = ? WHERE id = ?", (REJECTED, batchID))
+            self._db.execute(
+                "UPDATE actions SET state = ?, batch = NULL, txid = NULL WHERE batch = ?",
+                (PENDING, batchID),
+            )
+            self._db.execute("COMMIT")
+            self._changed.notify_all()
+
+    def _rejected(self, batchID: int, actions: int, reason: str) -> None:
+        with self._changed:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("UPDATE batches SET state = ? WHERE id = ?", (REJECTED, batchID))
+            if actions > 1:
+                # one of them spoiled the group, find out which on their own
+                self._db.execute(
+                    "UPDATE actions SET state = ?, isolated = 1, batch = NULL, txid = NULL WHERE batch = ?",
+                    (PENDING, batchID),
+                )
+            else:
+                self._db.execute(
+                    "UPDATE actions SET state = ?, error = ? WHERE batch = ?", (FAILED, reason, batchID)
+                )
+            self._db.execute("COMMIT")
+            self._changed.notify_all()
+
+    def _fail(self, actionIDs: List[int], reason: str) -> None:
+        with self._changed:
+            self._db.executemany(
+                "UPDATE actions SET state = ?, error = ? WHERE id = ?",
+                [(FAILED, reason, actionID) for actionID in actionIDs],
+            )
+            self._changed.notify_all()
@@ -0,0 +1,117 @@
+import copy
+import threading
+import time
+from typing import Optional
+
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .confirmation import getConfirmationEngine
+from .metrics import timed
+
+# seconds without a round from the confirmation engine after which the latest
+# round is asked of algod; longer than a round takes, so a following engine
+# is never second-guessed
+IDLE_SECONDS = 5.0
+
+
+class SuggestedParamsProvider:
+    """Caches suggested params and keeps their validity window current.
+
+    The params are fetched from algod at most once per ttl seconds. In
+    between, the first and last valid rounds are recomputed locally from the
+    latest round seen, which the provider learns from the client's
+    confirmation engine as it follows blocks. When the engine has not seen
+    one for IDLE_SECONDS, because nothing was waited on, the latest round is
+    asked of algod instead, unless the caller passes it.
+
+    Args:
+        client: An algod client.
+        ttl: The number of seconds after which the params are fetched again,
+            so that fee changes are picked up.
+        validRounds: The size of the validity window of transactions built
+            from these params.
+    """
+
+    def __init__(
+            self, client: AlgodClient, ttl: float = 30.0, validRounds: int = 1000
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.validRounds = validRounds
+
+        self._lock = threading.Lock()
+        self._params: Optional[transaction.SuggestedParams] = None
+        self._fetchedAt = 0.0
+        self._round = 0
+        self._roundSeenAt = 0.0
+
+        getConfirmationEngine(client).addRoundListener(self.advance)
+
+    def close(self) -> None:
+        """Stop following the client's confirmation engine."""
+        getConfirmationEngine(self.client).removeRoundListener(self.advance)
+
+    def get(self, round: Optional[int] = None) -> transaction.SuggestedParams:
+        """Get suggested params whose validity window starts at the latest round.
+
+        Args:
+            round: The latest round, if the caller knows it already.
+        """
+        with self._lock:
+            if self._params is None or time.monotonic() - self._fetchedAt > self.ttl:
+                self._refresh()
+            elif round is None and time.monotonic() - self._roundSeenAt > IDLE_SECONDS:
+                round = self.client.status()["last-round"]
+            if round is not None:
+                self._advance(round)
+
+            assert self._params is not None
+            params = copy.copy(self._params)
+            params.first = self._round
+            params.last = self._round + self.validRounds
+            return params
+
+    def advance(self, round: int) -> None:
+        """Record that the chain reached a round, without calling algod."""
+        with self._lock:
+            self._advance(round)
+
+    def invalidate(self) -> None:
+        """Make the next get fetch the params from algod again."""
+        with self._lock:
+            self._params = None
+
+    def _advance(self, round: int) -> None:
+        self._round = max(self._round, round)
+        self._roundSeenAt = time.monotonic()
+
+    def _refresh(self) -> None:
+        self._params = self.client.suggested_params()
+        self._fetchedAt = time.monotonic()
+        self._advance(self._params.first)
+
+
+def getSuggestedParams(
+        client: AlgodClient,
+        params: Optional[SuggestedParamsProvider] = None,
+        round: Optional[int] = None,
+) -> transaction.SuggestedParams:
+    """Get suggested params from a provider, or from algod if there is none.
+
+    Args:
+        client: An algod client.
+        params: A suggested params provider.
+        round: The latest round, if the caller knows it already. The
+            validity window starts at it, or at a later round the provider
+            has seen.
+    """
+    with timed("suggested_params"):
+        if params is not None:
+            return params.get(round)
+
+        suggestedParams = client.suggested_params()
+        if round is not None and round > suggestedParams.first:
+            suggestedParams.last += round - suggestedParams.first
+            suggestedParams.first = round
+        return suggestedParams
@@ -0,0 +1,195 @@
+"""Local pre-flight checks of bridge groups before they are sent.
+
+A group the app rejects is only found out after it was sent and waited on,
+and it takes the place of a group that would have gone through. Preflight
+runs the app calls of a group through xpnet.logic.XpnetAppLogic, the model
+of the approval program the fake algod runs too, before it is sent:
+
+    preflight = Preflight(client, appID, mirror)
+    reason = preflight.check([txn for txn, _ in txns])
+    if reason is not None:
+        ...  # the app would reject the group
+
+The model runs on a copy of the global state, taken from the mirror if one
+is given, and of the boxes the group references, which are read from algod
+at most once per round. The whitelist boxes are taken from the mirror too.
+The round is learnt from the client's confirmation engine as it follows
+blocks; when it has not seen one for IDLE_SECONDS and the caller does not
+pass it, it is asked of algod.
+
+Only an app running this build's approval program is checked, every group
+to any other app passes. A group passing the checks may still be rejected,
+by a change of state that lands before it or by anything outside the app,
+like the balance of its sender.
+"""
+
+import threading
+import time
+from base64 import b64decode
+from typing import Dict, List, Mapping, Optional, Sequence, Union
+
+from algosdk import constants, error
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from .confirmation import getConfirmationEngine
+from .logic import AppCall, AppLogic, AppRejected, XpnetAppLogic
+from .metrics import getRegistry
+from .mirror import AppStateMirror
+from .params import IDLE_SECONDS
+from .utils import getAppGlobalState
+from .whitelist import WHITELIST_BOX_PREFIX
+
+
+class Preflight:
+    """Checks groups against the approval program of an XP app.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        mirror: A mirror of the app's global state and whitelist. If
+            omitted, they are read from algod once per round.
+        logic: The model of the approval program the app calls run through.
+    """
+
+    def __init__(
+            self,
+            client: AlgodClient,
+            appID: int,
+            mirror: Optional[AppStateMirror] = None,
+            logic: Optional[AppLogic] = None,
+    ) -> None:
+        self.client = client
+        self.appID = appID
+        self.mirror = mirror
+        self.logic: AppLogic = logic if logic is not None else XpnetAppLogic()
+
+        self._lock = threading.Lock()
+        self._supported: Optional[bool] = None
+        self._creator = ""
+
+        self._round = 0
+        self._roundSeenAt = 0.0
+
+        # state read from algod, dropped when a later round is checked
+        self._stateRound = 0
+        self._globalState: Optional[Mapping[bytes, Union[int, bytes]]] = None
+        self._boxes: Dict[bytes, Optional[bytes]] = dict()
+
+        getConfirmationEngine(client).addRoundListener(self.advance)
+
+    def close(self) -> None:
+        """Stop following the client's confirmation engine."""
+        getConfirmationEngine(self.client).removeRoundListener(self.advance)
+
+    def advance(self, round: int) -> None:
+        """Record that the chain reached a round, without calling algod."""
+        self._round = max(self._round, round)
+        self._roundSeenAt = time.monotonic()
+
+    def _loadProgram(self) -> None:
+        # imported here, operations takes a Preflight
+        from .operations import getContracts
+
+        params = self.client.application_info(self.appID)["params"]
+        self._supported = b64decode(params["approval-program"]) == getContracts(self.client)[0]
+        self._creator = params["creator"]
+
+    def _startRound(self, round: Optional[int]) -> int:
+        if round is not None:
+            self.advance(round)
+        elif time.monotonic() - self._roundSeenAt > IDLE_SECONDS:
+            self.advance(self.client.status()["last-round"])
+
+        if self._round > self._stateRound:
+            self._stateRound = self._round
+            self._globalState = None
+            self._boxes = dict()
+        return self._stateRound
+
+    def _getGlobalState(self) -> Mapping[bytes, Union[int, bytes]]:
+        if self.mirror is not None:
+            return self.mirror.snapshot()
+        if self._globalState is None:
+            self._globalState = getAppGlobalState(self.client, self.appID)
+        return self._globalState
+
+    def _getBox(self, name: bytes) -> Optional[bytes]:
+        if self.mirror is not None and name.startswith(WHITELIST_BOX_PREFIX):
+            return self.mirror.getWhitelistShard(int.from_bytes(name[len(WHITELIST_BOX_PREFIX):], "big"))
+
+        if name not in self._boxes:
+            try:
+                box = self.client.application_box_by_name(self.appID, name)
+            except error.AlgodHTTPError as e:
+                if e.code != 404:
+                    raise
+                self._boxes[name] = None
+            else:
+                self._boxes[name] = b64decode(box["value"])
+        return self._boxes[name]
+
+    def check(
+            self, txns: Sequence[transaction.Transaction], round: Optional[int] = None
+    ) -> Optional[str]:
+        """Check a group against the approval program of the app.
+
+        Args:
+            txns: The unsigned transactions of the group.
+            round: The latest round, if the caller knows it already.
+
+        Returns:
+            The reason the app would reject the group, or None if it would
+            not.
+        """
+        appCalls = [
+            txn for txn in txns
+            if isinstance(txn, transaction.ApplicationCallTxn) and txn.index == self.appID
+        ]
+        if len(appCalls) == 0:
+            return None
+
+        with self._lock:
+            if self._supported is None:
+                self._loadProgram()
+            if not self._supported:
+                return None
+
+            reason = self._checkGroup(txns, round)
+
+        if reason is not None:
+            registry = getRegistry()
+            if registry is not None:
+                args = appCalls[0].app_args or [b""]
+                registry.increment("preflight_failures", method=args[0].decode(errors="replace"))
+        return reason
+
+    def _checkGroup(
+            self, txns: Sequence[transaction.Transaction], round: Optional[int]
+    ) -> Optional[str]:
+        if len(txns) > constants.tx_group_limit:
+            return "{} transactions do not fit a group".format(len(txns))
+
+        round = self._startRound(round)
+        group = [txn.dictify() for txn in txns]
+        globalState = dict(self._getGlobalState())
+
+        # the app can only read the boxes the group references
+        boxes: Dict[bytes, bytes] = dict()
+        for txn in group:
+            if txn.get("type") != "appl" or txn.get("apid") != self.appID:
+                continue
+            for ref in txn.get("apbx", []):
+                value = self._getBox(ref.get("n", b"")) if ref.get("i", 0) == 0 else None
+                if value is not None:
+                    boxes[ref["n"]] = value
+
+        for i, txn in enumerate(group):
+            if txn.get("type") != "appl" or txn.get("apid") != self.appID:
+                continue
+            call = AppCall(self.appID, self._creator, txn, group, i, globalState, boxes, round + 1)
+            try:
+                self.logic(call)
+            except AppRejected as e:
+                return str(e)
+        return None
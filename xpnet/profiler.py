@@ -0,0 +1,594 @@
+"""Static opcode cost and size profiler for the XP app programs.
+
+The TEAL generated by xpnet.contracts is split into basic blocks and every
+path from the start of the program to a return or err is costed. Subroutine
+calls cost their most expensive path. A loop costs a fixed part plus a part
+per iteration, so the cost of a path is reported as a + b·n, where n is the
+number of times the loop runs. The loops of the approval program are the
+binary search of the whitelist, whose n is at most log2 of the number of
+assets in a whitelist shard, and the signature checks of validate_transfer_nft,
+whose n is at most MAX_THRESHOLD.
+
+Paths are attributed to the entry point they run through, as marked by the
+branch comments of xpnet.contracts.
+
+    python -m xpnet.profiler --budget 700 --loop-bound 8
+
+exits with status 1 when a path can cost more than the budget with the loops
+running loop-bound times, or when the programs are larger than max-size. A
+branch in BRANCH_LOOP_BOUNDS is checked with its own bound instead, and one in
+POOLED_CALLS against the budget its group pools from that many app calls.
+"""
+
+import argparse
+import json
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from .approvals import APP_CALL_BUDGET, MAX_THRESHOLD, budgetCalls
+from .programs import APPROVAL, CLEAR_STATE, programSources
+from .whitelist import MAX_SHARD_IDS
+
+# the most iterations of the binary search of a full whitelist shard
+DEFAULT_LOOP_BOUND = MAX_SHARD_IDS.bit_length()
+
+# branches whose loops are bounded by something else than the whitelist
+BRANCH_LOOP_BOUNDS: Dict[str, int] = {
+    "validate_transfer_nft": MAX_THRESHOLD,
+}
+
+# branches whose group pools the budget of more than one app call, with the
+# number of app calls it has
+POOLED_CALLS: Dict[str, int] = {
+    "validate_transfer_nft": budgetCalls(MAX_THRESHOLD) + 1,
+}
+
+# the most bytes the approval and clear state programs may take together,
+# without extra pages
+MAX_PROGRAM_SIZE = 2048
+
+BRANCH_MARKER = "branch: "
+NO_BRANCH = "-"
+
+# opcodes that do not cost 1
+OPCODE_COSTS: Dict[str, int] = {
+    "sha256": 35,
+    "keccak256": 130,
+    "sha512_256": 45,
+    "sha3_256": 130,
+    "ed25519verify": 1900,
+    "ed25519verify_bare": 1900,
+    "ecdsa_verify": 1700,
+    "ecdsa_pk_decompress": 650,
+    "ecdsa_pk_recover": 2000,
+    "vrf_verify": 5700,
+    "bn256_add": 70,
+    "bn256_scalar_mul": 970,
+    "bn256_pairing": 8700,
+    "divmodw": 20,
+    "expw": 10,
+    "sqrt": 4,
+    "bsqrt": 40,
+    "b+": 10,
+    "b-": 10,
+    "b*": 20,
+    "b/": 20,
+    "b%": 20,
+    "b|": 6,
+    "b&": 6,
+    "b^": 6,
+    "b~": 4,
+    "json_ref": 25,
+    "base64_decode": 1,
+}
+
+# encoded size of opcodes with immediates, opcode byte included
+OPCODE_SIZES: Dict[str, int] = {
+    "b": 3, "bz": 3, "bnz": 3, "callsub": 3,
+    "txna": 3, "gtxn": 3, "gtxna": 4, "gtxnsa": 3, "gtxnas": 3, "itxna": 3,
+    "gitxn": 3, "gitxna": 4, "substring": 3, "extract": 3, "proto": 3,
+    "txn": 2, "global": 2, "load": 2, "store": 2, "gload": 3, "gloads": 2,
+    "gloadss": 1, "arg": 2, "gtxns": 2, "txnas": 2, "gtxnsas": 2, "gaid": 2,
+    "intc": 2, "bytec": 2, "dig": 2, "bury": 2, "cover": 2, "uncover": 2,
+    "popn": 2, "dupn": 2, "frame_dig": 2, "frame_bury": 2, "replace2": 2,
+    "asset_holding_get": 2, "asset_params_get": 2, "app_params_get": 2,
+    "acct_params_get": 2, "itxn_field": 2, "itxn": 2, "ecdsa_verify": 2,
+    "ecdsa_pk_decompress": 2, "ecdsa_pk_recover": 2, "json_ref": 2,
+    "base64_decode": 2, "vrf_verify": 2, "block": 2,
+}
+
+# named integer constants TEAL accepts in place of int literals
+NAMED_INTS: Dict[str, int] = {
+    "NoOp": 0, "OptIn": 1, "CloseOut": 2, "ClearState": 3,
+    "UpdateApplication": 4, "DeleteApplication": 5,
+    "unknown": 0, "pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6,
+}
+
+TERMINALS = {"return", "err", "retsub"}
+BRANCHES = {"b", "bz", "bnz"}
+
+
+class Instruction(NamedTuple):
+    op: str
+    args: List[str]
+    line: int
+
+
+class Block(NamedTuple):
+    label: Optional[str]
+    instructions: List[Instruction]
+    # entry points whose marker comment is in this block
+    markers: List[str]
+
+
+class Cost(NamedTuple):
+    """The cost a + b·n of a path, with one n per loop, by loop label."""
+
+    constant: int
+    perIteration: Dict[str, int]
+
+    def __add__(self, other: "Cost") -> "Cost":  # type: ignore[override]
+        perIteration = dict(self.perIteration)
+        for label, cost in other.perIteration.items():
+            perIteration[label] = perIteration.get(label, 0) + cost
+        return Cost(self.constant + other.constant, perIteration)
+
+    def at(self, loopBound: int) -> int:
+        """The cost with every loop running loopBound times."""
+        return self.constant + sum(self.perIteration.values()) * loopBound
+
+    def __str__(self) -> str:
+        terms = [str(self.constant)]
+        for label, cost in sorted(self.perIteration.items()):
+            terms.append("{}·n({})".format(cost, label))
+        return " + ".join(terms)
+
+
+ZERO = Cost(0, dict())
+
+
+class PathProfile(NamedTuple):
+    branch: str
+    cost: Cost
+    # labels of the blocks the path runs through, for finding it in the TEAL
+    blocks: List[str]
+    end: str
+
+
+class ProgramProfile(NamedTuple):
+    size: int
+    paths: List[PathProfile]
+
+    def branches(self) -> Dict[str, List[PathProfile]]:
+        branches: Dict[str, List[PathProfile]] = dict()
+        for path in self.paths:
+            branches.setdefault(path.branch, []).append(path)
+        return branches
+
+
+def parseTeal(teal: str) -> Tuple[List[Block], Dict[str, int]]:
+    """Split TEAL source into basic blocks.
+
+    Returns:
+        The blocks in program order, and the index of each labelled block.
+    """
+    blocks: List[Block] = [Block(None, [], [])]
+    labels: Dict[str, int] = dict()
+
+    for number, line in enumerate(teal.splitlines(), 1):
+        line = line.strip()
+        if line.startswith("//"):
+            comment = line[2:].strip()
+            if comment.startswith(BRANCH_MARKER):
+                blocks[-1].markers.append(comment[len(BRANCH_MARKER):])
+            continue
+        if line == "" or line.startswith("#pragma"):
+            continue
+
+        if line.endswith(":"):
+            label = line[:-1]
+            if blocks[-1].instructions or blocks[-1].label is not None:
+                blocks.append(Block(label, [], []))
+            else:
+                blocks[-1] = Block(label, [], blocks[-1].markers)
+            labels[label] = len(blocks) - 1
+            continue
+
+        fields = _splitLine(line)
+        blocks[-1].instructions.append(Instruction(fields[0], fields[1:], number))
+        if fields[0] in TERMINALS or fields[0] in BRANCHES or fields[0] in ("switch", "match"):
+            blocks.append(Block(None, [], []))
+
+    if not blocks[-1].instructions and blocks[-1].label is None and len(blocks) > 1:
+        blocks.pop()
+
+    return blocks, labels
+
+
+def _splitLine(line: str) -> List[str]:
+    # strips a trailing comment, keeping // inside string literals
+    fields: List[str] = []
+    for match in re.finditer(r'"(?:\\.|[^"\\])*"|//.*|\S+', line):
+        token = match.group(0)
+        if token.startswith("//"):
+            break
+        fields.append(token)
+    return fields
+
+
+class _Analysis:
+    def __init__(self, teal: str) -> None:
+        self.blocks, self.labels = parseTeal(teal)
+        self._subroutines: Dict[int, Cost] = dict()
+
+    def successors(self, index: int) -> List[int]:
+        block = self.blocks[index]
+        last = block.instructions[-1] if block.instructions else None
+        fallthrough = [index + 1] if index + 1 < len(self.blocks) else []
+
+        if last is None:
+            return fallthrough
+        if last.op in TERMINALS:
+            return []
+        if last.op == "b":
+            return [self.labels[last.args[0]]]
+        if last.op in ("bz", "bnz"):
+            return [self.labels[last.args[0]]] + fallthrough
+        if last.op in ("switch", "match"):
+            return [self.labels[label] for label in last.args] + fallthrough
+        return fallthrough
+
+    def blockCost(self, index: int) -> Cost:
+        cost = ZERO
+        for instruction in self.blocks[index].instructions:
+            cost = cost + Cost(OPCODE_COSTS.get(instruction.op, 1), dict())
+            if instruction.op == "callsub":
+                cost = cost + self.subroutineCost(self.labels[instruction.args[0]])
+        return cost
+
+    def subroutineCost(self, entry: int) -> Cost:
+        if entry not in self._subroutines:
+            # recursion would be costed as a loop of unknown count
+            self._subroutines[entry] = ZERO
+            paths = self.paths(entry)
+            self._subroutines[entry] = max(
+                (cost for _, cost, _ in paths), key=lambda cost: cost.at(DEFAULT_LOOP_BOUND), default=ZERO
+            )
+        return self._subroutines[entry]
+
+    def backEdges(self, entry: int) -> Set[Tuple[int, int]]:
+        edges: Set[Tuple[int, int]] = set()
+        onStack: Set[int] = set()
+        visited: Set[int] = set()
+
+        def visit(index: int) -> None:
+            visited.add(index)
+            onStack.add(index)
+            for successor in self.successors(index):
+                if successor in onStack:
+                    edges.add((index, successor))
+                elif successor not in visited:
+                    visit(successor)
+            onStack.discard(index)
+
+        visit(entry)
+        return edges
+
+    def loops(self, entry: int) -> Dict[int, Tuple[Set[int], Set[int]]]:
+        """Find the natural loops reachable from entry.
+
+        Returns:
+            For each loop header, the blocks of the loop and its latches, the
+            blocks that branch back to the header.
+        """
+        loops: Dict[int, Tuple[Set[int], Set[int]]] = dict()
+        predecessors: Dict[int, List[int]] = dict()
+        for index in range(len(self.blocks)):
+            for successor in self.successors(index):
+                predecessors.setdefault(successor, []).append(index)
+
+        for latch, header in self.backEdges(entry):
+            body, latches = loops.get(header, ({header}, set()))
+            latches.add(latch)
+            body.add(latch)
+            stack = [latch]
+            while stack:
+                index = stack.pop()
+                if index == header:
+                    continue
+                for predecessor in predecessors.get(index, []):
+                    if predecessor not in body:
+                        body.add(predecessor)
+                        stack.append(predecessor)
+            loops[header] = (body, latches)
+
+        for header, (body, _) in loops.items():
+            if any(other != header and other in body for other in loops):
+                raise Exception("Nested loop in {} is not supported".format(self._name(header)))
+
+        return loops
+
+    def paths(self, entry: int) -> List[Tuple[List[int], Cost, str]]:
+        """Cost every path from entry to a terminal instruction.
+
+        Back edges are removed, and every path through a loop header is
+        charged for the worst iteration of the loop once per n.
+        """
+        backEdges = self.backEdges(entry)
+        loops = self.loops(entry)
+
+        iterationCosts: Dict[int, Cost] = dict()
+        for header, (body, latches) in loops.items():
+            worst = self._worstWithin(header, latches, body, backEdges)
+            if worst.perIteration:
+                raise Exception("Nested loop in {} is not supported".format(self._name(header)))
+            iterationCosts[header] = Cost(0, {self._name(header): worst.constant})
+
+        results: List[Tuple[List[int], Cost, str]] = []
+
+        def walk(index: int, path: List[int], cost: Cost) -> None:
+            path = path + [index]
+            cost = cost + self.blockCost(index)
+            if index in iterationCosts:
+                cost = cost + iterationCosts[index]
+
+            successors = [s for s in self.successors(index) if (index, s) not in backEdges]
+            block = self.blocks[index]
+            if not successors:
+                last = block.instructions[-1].op if block.instructions else "end"
+                if last in TERMINALS or (last not in BRANCHES and index + 1 == len(self.blocks)):
+                    results.append((path, cost, last))
+                return
+            for successor in successors:
+                walk(successor, path, cost)
+
+        walk(entry, [], ZERO)
+        return results
+
+    def _worstWithin(
+            self, start: int, ends: Set[int], body: Set[int], backEdges: Set[Tuple[int, int]]
+    ) -> Cost:
+        worst: Optional[Cost] = None
+
+        def walk(index: int, cost: Cost) -> None:
+            nonlocal worst
+            cost = cost + self.blockCost(index)
+            if index in ends:
+                if worst is None or cost.at(1) > worst.at(1):
+                    worst = cost
+                return
+            for successor in self.successors(index):
+                if successor in body and (index, successor) not in backEdges:
+                    walk(successor, cost)
+
+        walk(start, ZERO)
+        assert worst is not None
+        return worst
+
+    def _name(self, index: int) -> str:
+        label = self.blocks[index].label
+        if label is not None:
+            return label
+        return "line {}".format(self.blocks[index].instructions[0].line)
+
+
+def profilePaths(teal: str) -> List[PathProfile]:
+    """Cost every path of a TEAL program."""
+    analysis = _Analysis(teal)
+
+    profiles: List[PathProfile] = []
+    for path, cost, end in analysis.paths(0):
+        markers = [marker for index in path for marker in analysis.blocks[index].markers]
+        profiles.append(PathProfile(
+            branch=markers[-1] if markers else NO_BRANCH,
+            cost=cost,
+            blocks=[analysis._name(index) for index in path if analysis.blocks[index].label is not None],
+            end=end,
+        ))
+    return profiles
+
+
+def _varuintSize(value: int) -> int:
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def _parseInt(token: str) -> int:
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    return int(token, 0)
+
+
+def _parseBytes(args: List[str]) -> bytes:
+    if args[0].startswith('"'):
+        return args[0][1:-1].encode("utf-8").decode("unicode_escape").encode("latin-1")
+    if args[0].startswith("0x"):
+        return bytes.fromhex(args[0][2:])
+    if args[0] in ("base64", "b64"):
+        import base64
+        return base64.b64decode(args[1])
+    if args[0] in ("base32", "b32"):
+        import base64
+        return base64.b32decode(args[1] + "=" * (-len(args[1]) % 8))
+    raise Exception("Unsupported byte constant: {}".format(" ".join(args)))
+
+
+def estimateSize(teal: str) -> int:
+    """Estimate the assembled size of a TEAL program in bytes.
+
+    Follows the assembler's constant handling: int and byte constants used
+    more than once go to the constant blocks, the others are pushed inline.
+    The result can differ from algod's by a few bytes, compile the program
+    for the exact size.
+    """
+    blocks, _ = parseTeal(teal)
+    instructions = [i for block in blocks for i in block.instructions]
+
+    ints: Dict[int, int] = dict()
+    byteConstants: Dict[bytes, int] = dict()
+    for instruction in instructions:
+        if instruction.op == "int":
+            value = _parseInt(instruction.args[0])
+            ints[value] = ints.get(value, 0) + 1
+        elif instruction.op == "byte":
+            value = _parseBytes(instruction.args)
+            byteConstants[value] = byteConstants.get(value, 0) + 1
+        elif instruction.op == "addr":
+            value = bytes(32)
+            byteConstants[value] = byteConstants.get(value, 0) + 1
+
+    intBlock = sorted((v for v, n in ints.items() if n > 1), key=lambda v: -ints[v])
+    byteBlock = sorted((v for v, n in byteConstants.items() if n > 1), key=lambda v: -byteConstants[v])
+
+    # the version
+    size = 1
+    if intBlock:
+        size += 1 + _varuintSize(len(intBlock)) + sum(_varuintSize(v) for v in intBlock)
+    if byteBlock:
+        size += 1 + _varuintSize(len(byteBlock)) + sum(_varuintSize(len(v)) + len(v) for v in byteBlock)
+
+    for instruction in instructions:
+        op = instruction.op
+        if op == "int":
+            value = _parseInt(instruction.args[0])
+            if value in intBlock:
+                size += 1 if intBlock.index(value) < 4 else 2
+            else:
+                size += 1 + _varuintSize(value)
+        elif op in ("byte", "addr"):
+            value = _parseBytes(instruction.args) if op == "byte" else bytes(32)
+            if value in byteBlock:
+                size += 1 if byteBlock.index(value) < 4 else 2
+            else:
+                size += 1 + _varuintSize(len(value)) + len(value)
+        elif op == "pushint":
+            size += 1 + _varuintSize(_parseInt(instruction.args[0]))
+        elif op == "pushbytes":
+            value = _parseBytes(instruction.args)
+            size += 1 + _varuintSize(len(value)) + len(value)
+        elif op == "method":
+            size += 1 + 1 + 4
+        elif op in ("switch", "match"):
+            size += 2 + 2 * len(instruction.args)
+        else:
+            size += OPCODE_SIZES.get(op, 1)
+
+    return size
+
+
+def profileProgram(teal: str, size: Optional[int] = None) -> ProgramProfile:
+    """Profile a TEAL program.
+
+    Args:
+        teal: The TEAL source.
+        size: The assembled size of the program, if known. Otherwise it is
+            estimated from the source.
+    """
+    return ProgramProfile(
+        size=size if size is not None else estimateSize(teal),
+        paths=profilePaths(teal),
+    )
+
+
+def branchLimits(branch: str, budget: int, loopBound: int) -> Tuple[int, int]:
+    """The budget and loop bound a branch is checked with."""
+    return budget * POOLED_CALLS.get(branch, 1), BRANCH_LOOP_BOUNDS.get(branch, loopBound)
+
+
+def checkBudget(
+        profile: ProgramProfile, budget: int = APP_CALL_BUDGET, loopBound: int = DEFAULT_LOOP_BOUND
+) -> List[PathProfile]:
+    """Find the paths that can cost more than the budget of their branch."""
+    overBudget: List[PathProfile] = []
+    for path in profile.paths:
+        branchBudget, branchBound = branchLimits(path.branch, budget, loopBound)
+        if path.cost.at(branchBound) > branchBudget:
+            overBudget.append(path)
+    return overBudget
+
+
+def report(
+        profiles: Dict[str, ProgramProfile], budget: int, loopBound: int, maxSize: int
+) -> Dict[str, object]:
+    programs: Dict[str, object] = dict()
+    for name, profile in profiles.items():
+        branches = dict()
+        for branch, paths in sorted(profile.branches().items()):
+            branchBudget, branchBound = branchLimits(branch, budget, loopBound)
+            worst = max(paths, key=lambda path: path.cost.at(branchBound))
+            perIteration = sum(worst.cost.perIteration.values())
+            branches[branch] = {
+                "paths": len(paths),
+                "budget": branchBudget,
+                "loop_bound": branchBound,
+                "worst_cost": str(worst.cost),
+                "worst_cost_at_bound": worst.cost.at(branchBound),
+                # the largest n the worst path stays within budget for
+                "max_loop_count": (
+                    (branchBudget - worst.cost.constant) // perIteration if perIteration else None
+                ),
+                "worst_path": worst.blocks,
+                "over_budget": worst.cost.at(branchBound) > branchBudget,
+            }
+        programs[name] = {"size": profile.size, "branches": branches}
+
+    totalSize = sum(profile.size for profile in profiles.values())
+    return {
+        "budget": budget,
+        "loop_bound": loopBound,
+        "max_size": maxSize,
+        "total_size": totalSize,
+        "programs": programs,
+        "ok": totalSize <= maxSize and not any(checkBudget(p, budget, loopBound) for p in profiles.values()),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=APP_CALL_BUDGET)
+    parser.add_argument("--loop-bound", type=int, default=DEFAULT_LOOP_BOUND,
+                        help="the number of times each loop is assumed to run")
+    parser.add_argument("--max-size", type=int, default=MAX_PROGRAM_SIZE)
+    parser.add_argument("--algod", action="store_true",
+                        help="compile with the algod of xpnet.testing.setup for exact sizes")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    sources = programSources()
+
+    sizes: Dict[str, Optional[int]] = {name: None for name in sources}
+    if args.algod:
+        from .testing.setup import getAlgodClient
+        from .utils import compileProgram
+
+        client = getAlgodClient()
+        sizes = {name: len(compileProgram(client, teal)) for name, teal in sources.items()}
+
+    profiles = {
+        name: profileProgram(sources[name], sizes[name]) for name in (APPROVAL, CLEAR_STATE)
+    }
+    result = report(profiles, args.budget, args.loop_bound, args.max_size)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for name, program in result["programs"].items():  # type: ignore[union-attr]
+            print("{} ({} bytes)".format(name, program["size"]))
+            for branch, stats in program["branches"].items():
+                print("  {:<24} {:>3} paths  {:<34} {:>5} of {:>5} at n={}  {}".format(
+                    branch, stats["paths"], stats["worst_cost"], stats["worst_cost_at_bound"],
+                    stats["budget"], stats["loop_bound"], "OVER BUDGET" if stats["over_budget"] else "ok",
+                ))
+        print("total size {} of {} bytes, budget {} per call: {}".format(
+            result["total_size"], args.max_size, args.budget, "ok" if result["ok"] else "FAILED"
+        ))
+
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+from importlib import metadata
+from typing import Callable, Dict, Optional
+
+from .files import atomicWrite
+
+# TEAL version the XP app is compiled for
+TEAL_VERSION = 8
+
+PROGRAM_CACHE_DIR = os.environ.get(
+    "XPNET_PROGRAM_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "xpnet", "programs"),
+)
+
+MANIFEST_NAME = "manifest.json"
+
+APPROVAL = "approval"
+CLEAR_STATE = "clear_state"
+
+# the modules the TEAL of the XP app is generated from
+_SOURCE_PATHS = [
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ("approvals.py", "contracts.py", "events.py", "replay.py", "whitelist.py")
+]
+
+
+def programKey(teal: str, version: int = TEAL_VERSION) -> str:
+    """The content address of a compiled program in the cache."""
+    return hashlib.sha256("{}\n{}".format(version, teal).encode("utf-8")).hexdigest()
+
+
+def sourceFingerprint() -> str:
+    """Identify the contract source without importing pyteal.
+
+    The manifest records this fingerprint at build time, so that a cache built
+    from an older contracts.py or pyteal release is not used.
+    """
+    try:
+        pytealVersion = metadata.version("pyteal")
+    except metadata.PackageNotFoundError:
+        pytealVersion = ""
+
+    digest = hashlib.sha256()
+    for path in _SOURCE_PATHS:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    digest.update("\n{}\n{}".format(pytealVersion, TEAL_VERSION).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def programSources() -> Dict[str, str]:
+    """Generate the TEAL source of the XP app programs.
+
+    This is the only place pyteal is needed, it is imported here so that
+    loading cached programs never pays for it.
+    """
+    from pyteal import compileTeal, Mode
+
+    from .contracts import approval_program, clear_state_program
+
+    return {
+        APPROVAL: compileTeal(approval_program(), mode=Mode.Application, version=TEAL_VERSION),
+        CLEAR_STATE: compileTeal(clear_state_program(), mode=Mode.Application, version=TEAL_VERSION),
+    }
+
+
+def loadCachedProgram(key: str, cacheDir: str = PROGRAM_CACHE_DIR) -> Optional[bytes]:
+    try:
+        with open(os.path.join(cacheDir, key + ".bin"), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def storePrograms(
+        sources: Dict[str, str],
+        programs: Dict[str, bytes],
+        cacheDir: str = PROGRAM_CACHE_DIR,
+) -> None:
+    """Store compiled programs and point the manifest at them.
+
+    Args:
+        sources: The TEAL source of each program, by name.
+        programs: The compiled bytes of each program, by name.
+        cacheDir: The cache directory.
+    """
+    os.makedirs(cacheDir, exist_ok=True)
+
+    entries: Dict[str, Dict[str, str]] = dict()
+    for name, teal in sources.items():
+        key = programKey(teal)
+        program = programs[name]
+        atomicWrite(os.path.join(cacheDir, key + ".bin"), program)
+        entries[name] = {
+            "key": key,
+            "sha256": hashlib.sha256(program).hexdigest(),
+        }
+
+    manifest = {
+        "source": sourceFingerprint(),
+        "version": TEAL_VERSION,
+        "programs": entries,
+    }
+    atomicWrite(
+        os.path.join(cacheDir, MANIFEST_NAME),
+        json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"),
+    )
+
+
+def loadPrograms(cacheDir: str = PROGRAM_CACHE_DIR) -> Optional[Dict[str, bytes]]:
+    """Load the compiled XP app programs recorded in the manifest.
+
+    Returns:
+        The compiled bytes of each program by name, or None if the cache is
+        missing, was built from a different contract source, or is corrupt.
+    """
+    try:
+        with open(os.path.join(cacheDir, MANIFEST_NAME), "rb") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if manifest.get("source") != sourceFingerprint():
+        return None
+
+    programs: Dict[str, bytes] = dict()
+    for name in (APPROVAL, CLEAR_STATE):
+        entry = manifest["programs"].get(name)
+        if entry is None:
+            return None
+
+        program = loadCachedProgram(entry["key"], cacheDir)
+        if program is None or hashlib.sha256(program).hexdigest() != entry["sha256"]:
+            return None
+
+        programs[name] = program
+
+    return programs
+
+
+def buildPrograms(
+        compile: Callable[[str], bytes], cacheDir: str = PROGRAM_CACHE_DIR
+) -> Dict[str, bytes]:
+    """Compile the XP app programs and populate the cache.
+
+    Programs whose TEAL source is already in the cache are not compiled again.
+
+    Args:
+        compile: A function compiling TEAL source to program bytes, usually
+            backed by algod's compile endpoint.
+        cacheDir: The cache directory.
+
+    Returns:
+        The compiled bytes of each program, by name.
+    """
+    sources = programSources()
+
+    programs: Dict[str, bytes] = dict()
+    for name, teal in sources.items():
+        program = loadCachedProgram(programKey(teal), cacheDir)
+        if program is None:
+            program = compile(teal)
+        programs[name] = program
+
+    try:
+        storePrograms(sources, programs, cacheDir)
+    except OSError:
+        # a read-only cache only costs a compile per process
+        pass
+
+    return programs
@@ -0,0 +1,68 @@
+"""Replay protection of the XP app's actions.
+
+Every executed action ID is marked in a bitmap kept in boxes of the app. The
+bitmap is split into pages of PAGE_SIZE bytes, one box per page, and action
+ID n is bit n % PAGE_BITS of page n // PAGE_BITS, counting from the most
+significant bit of the first byte like TEAL's getbit. Checking and marking an
+action reads and writes a single byte of a single box.
+
+The page of an action depends on nothing but its ID, so validators can put
+the right box reference on their transactions without reading the app's
+state. Pages below the ac_low global of the app have been pruned, and actions
+in them are rejected.
+"""
+
+from base64 import b64decode
+from typing import Optional, Tuple
+
+from algosdk import error
+from algosdk.v2client.algod import AlgodClient
+
+from .whitelist import BOX_BYTE_MIN_BALANCE, BOX_FLAT_MIN_BALANCE
+
+ACTION_BOX_PREFIX = b"ac"
+
+# a page fits the box I/O a single box reference pays for
+PAGE_SIZE = 1024
+PAGE_BITS = PAGE_SIZE * 8
+
+# minimum balance the app account needs for each page
+PAGE_MIN_BALANCE = BOX_FLAT_MIN_BALANCE + BOX_BYTE_MIN_BALANCE * (len(ACTION_BOX_PREFIX) + 8 + PAGE_SIZE)
+
+
+def actionPage(actionID: int) -> int:
+    return actionID // PAGE_BITS
+
+
+def actionBoxName(page: int) -> bytes:
+    return ACTION_BOX_PREFIX + page.to_bytes(8, "big")
+
+
+def actionBit(actionID: int) -> Tuple[int, int]:
+    """The byte of its page an action is in, and its bit in that byte."""
+    bit = actionID % PAGE_BITS
+    return bit // 8, bit % 8
+
+
+def actionBoxRef(appID: int, actionID: int) -> Tuple[int, bytes]:
+    """The box reference an app call executing actionID needs."""
+    return appID, actionBoxName(actionPage(actionID))
+
+
+def isActionExecuted(page: Optional[bytes], actionID: int) -> bool:
+    """Check an action in the value of its page box, None if there is none."""
+    if page is None:
+        return False
+    byte, bit = actionBit(actionID)
+    return bool(page[byte] & (0x80 >> bit))
+
+
+def getActionPage(client: AlgodClient, appID: int, page: int) -> Optional[bytes]:
+    """Read a page box of an app, or None if it does not exist."""
+    try:
+        box = client.application_box_by_name(appID, actionBoxName(page))
+    except error.AlgodHTTPError as e:
+        if e.code == 404:
+            return None
+        raise
+    return b64decode(box["value"])
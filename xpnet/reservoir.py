@@ -0,0 +1,316 @@
+"""Pre-built transaction templates of the bridge actions.
+
+Building a group with algosdk costs far more than signing it: every
+transaction is turned into a map field by field, its addresses decoded and
+checked, and it is encoded once for the group ID and once more to be
+signed. A TxnReservoir builds the parts of the groups of freeze_nft,
+withdraw_nft and validate_transfer_nft that do not depend on the action
+ahead of time, as canonical msgpack maps for the current validity window:
+the window itself, the fees, the app calls to the app and the budget calls
+of validate_transfer_nft. When an action comes, only its own fields are
+filled in before the group is signed and sent:
+
+    reservoir = TxnReservoir(client, appID, params)
+    txID = reservoir.sendFreeze(funder, nftHolder, receiver, nftID, fees)
+    waitForTransaction(client, txID)
+
+The templates are built again for a new window, starting at the latest
+round, as soon as the current window gets within evictRounds of its last
+valid round, so actions never go out in a window about to close. The
+rounds are learnt from the confirmation engine as it follows blocks. When
+it has not seen one for IDLE_SECONDS, because nothing was waited on, the
+next send asks algod for the latest round first.
+
+The groups themselves cannot be signed ahead of time. Every transaction of
+an atomic group signs the group ID, a hash of all the transactions of the
+group, which include the NFT, the accounts and the arguments of the action.
+"""
+
+import threading
+import time
+from base64 import b32encode, b64decode, b64encode
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import msgpack
+from algosdk import constants, encoding
+from algosdk.v2client.algod import AlgodClient
+
+from .account import Account
+from .approvals import VALIDATORS_BOX, ActionApproval, budgetCalls, packApprovals
+from .confirmation import getConfirmationEngine
+from .metrics import timed
+from .mirror import AppStateMirror
+from .operations import getWhitelistShards
+from .params import IDLE_SECONDS, SuggestedParamsProvider, getSuggestedParams
+from .replay import actionBoxName, actionPage
+from .utils import getAppGlobalState
+from .whitelist import shardOf, whitelistBoxName
+
+FREEZE = "freeze_nft"
+WITHDRAW = "withdraw_nft"
+VALIDATE = "validate_transfer_nft"
+
+DEFAULT_VALID_ROUNDS = 20
+DEFAULT_EVICT_ROUNDS = 5
+
+TxnMap = Dict[str, Any]
+
+# the signature of a signed transaction, for estimating its size
+_SIGNATURE_SIZE = 64
+
+# a signed transaction is a map of its signature and its transaction
+_SIGNED_PREFIX = b"\x82" + msgpack.packb("sig") + msgpack.packb(b"\0" * _SIGNATURE_SIZE)[:2]
+_TXN_KEY = msgpack.packb("txn")
+
+
+class _Window(NamedTuple):
+    first: int
+    last: int
+    flatFee: bool
+    # the flat fee or fee per byte of the params
+    fee: int
+    # the maps of the transactions of each kind of group, without the
+    # fields of an action
+    templates: Dict[str, List[TxnMap]]
+    budgetCalls: List[TxnMap]
+
+
+def _encode(txn: TxnMap) -> bytes:
+    return msgpack.packb(dict(sorted(txn.items())), use_bin_type=True)
+
+
+def _publicKey(account: Account) -> bytes:
+    return account.signingKey.verify_key.encode()
+
+
+class TxnReservoir:
+    """Sends bridge actions from templates of the current validity window.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod for every new window.
+        validRounds: The size of the validity windows.
+        evictRounds: The number of rounds before the last valid round of a
+            window at which it is replaced.
+        mirror: A mirror of the app's global state. If omitted, the
+            threshold and number of whitelist shards are fetched from algod
+            once.
+    """
+
+    def __init__(
+            self,
+            client: AlgodClient,
+            appID: int,
+            params: Optional[SuggestedParamsProvider] = None,
+            validRounds: int = DEFAULT_VALID_ROUNDS,
+            evictRounds: int = DEFAULT_EVICT_ROUNDS,
+            mirror: Optional[AppStateMirror] = None,
+    ) -> None:
+        if evictRounds >= validRounds:
+            raise Exception("Windows of {} rounds are evicted right away".format(validRounds))
+
+        self.client = client
+        self.appID = appID
+        self.params = params
+        self.validRounds = validRounds
+        self.evictRounds = evictRounds
+        self.mirror = mirror
+
+        self._lock = threading.Lock()
+        self._window: Optional[_Window] = None
+        self._round = 0
+        self._roundSeenAt = 0.0
+        self._threshold: Optional[int] = None
+        self._shards: Optional[int] = None
+
+        getConfirmationEngine(client).addRoundListener(self.advance)
+
+    def close(self) -> None:
+        """Stop following the client's confirmation engine."""
+        getConfirmationEngine(self.client).removeRoundListener(self.advance)
+
+    def advance(self, round: int) -> None:
+        """Record that the chain reached a round, and refill if needed."""
+        self._round = max(self._round, round)
+        self._roundSeenAt = time.monotonic()
+        window = self._window
+        if window is not None and self._isStale(window):
+            self._refill(window)
+
+    def _isStale(self, window: _Window) -> bool:
+        return window.last - self._round <= self.evictRounds
+
+    def _getThreshold(self) -> int:
+        if self._threshold is None:
+            if self.mirror is not None:
+                threshold = self.mirror[b"threshold"]
+            else:
+                threshold = getAppGlobalState(self.client, self.appID)[b"threshold"]
+            assert isinstance(threshold, int)
+            self._threshold = threshold
+        return self._threshold
+
+    def _getShards(self) -> int:
+        if self._shards is None:
+            self._shards = getWhitelistShards(self.client, self.appID, self.mirror)
+        return self._shards
+
+    def _refill(self, stale: Optional[_Window]) -> _Window:
+        with self._lock:
+            # another thread may have refilled it already
+            if self._window is not stale and self._window is not None:
+                return self._window
+
+            suggestedParams = getSuggestedParams(self.client, self.params)
+            first = max(suggestedParams.first, self._round)
+            self._round = first
+
+            header: TxnMap = {"fv": first, "lv": first + self.validRounds}
+            if suggestedParams.fee:
+                header["fee"] = suggestedParams.fee
+            if suggestedParams.gen:
+                header["gen"] = suggestedParams.gen
+            header["gh"] = b64decode(suggestedParams.gh)
+
+            appCall = {**header, "type": "appl", "apid": self.appID}
+            self._window = _Window(
+                first=first,
+                last=first + self.validRounds,
+                flatFee=bool(suggestedParams.flat_fee),
+                fee=suggestedParams.fee,
+                templates={
+                    FREEZE: [appCall, {**header, "type": "axfer", "aamt": 1}],
+                    WITHDRAW: [appCall, {**header, "type": "acfg"}],
+                    VALIDATE: [appCall, {**header, "type": "acfg", "apar": {"t": 1}}],
+                },
+                budgetCalls=[
+                    {**appCall, "apaa": [b"budget"]} for _ in range(budgetCalls(self._getThreshold()))
+                ],
+            )
+            return self._window
+
+    def _currentWindow(self) -> _Window:
+        if time.monotonic() - self._roundSeenAt > IDLE_SECONDS:
+            self.advance(self.client.status()["last-round"])
+
+        window = self._window
+        if window is None or self._isStale(window):
+            window = self._refill(window)
+        return window
+
+    def _fee(self, window: _Window, txn: TxnMap) -> int:
+        if window.flatFee:
+            return window.fee
+        if window.fee == 0:
+            return constants.min_txn_fee
+        # the size algosdk estimates, signed and without a group ID
+        size = len(_SIGNED_PREFIX) + _SIGNATURE_SIZE + len(_TXN_KEY) + len(_encode(txn))
+        return max(window.fee * size, constants.min_txn_fee)
+
+    def _send(self, window: _Window, txns: List[Tuple[TxnMap, Account]]) -> str:
+        with timed("sign"):
+            for txn, _ in txns:
+                txn["fee"] = self._fee(window, txn)
+
+            txIDs = [encoding.checksum(constants.txid_prefix + _encode(txn)) for txn, _ in txns]
+            group = encoding.checksum(
+                constants.tgid_prefix + msgpack.packb({"txlist": txIDs}, use_bin_type=True)
+            )
+
+            signed: List[bytes] = []
+            for txn, signer in txns:
+                txn["grp"] = group
+                encoded = _encode(txn)
+                signature = signer.signingKey.sign(constants.txid_prefix + encoded).signature
+                signed.append(_SIGNED_PREFIX + signature + _TXN_KEY + encoded)
+
+            appCallID = b32encode(
+                encoding.checksum(constants.txid_prefix + _encode(txns[0][0]))
+            ).decode().strip("=")
+
+        self.client.send_raw_transaction(b64encode(b"".join(signed)).decode())
+        return appCallID
+
+    def sendFreeze(
+            self, funder: Account, nftHolder: Account, receiver: Account, nftID: int, fees: int
+    ) -> str:
+        """Send the group of a freeze_nft call.
+
+        Returns:
+            The ID of the app call, once it is sent.
+        """
+        window = self._currentWindow()
+        appCall, transfer = window.templates[FREEZE]
+        return self._send(window, [
+            (
+                {**appCall, "snd": _publicKey(funder), "apaa": [b"freeze_nft", fees.to_bytes(8, "big")],
+                 "apas": [nftID], "apbx": [{"n": whitelistBoxName(shardOf(nftID, self._getShards()))}]},
+                funder,
+            ),
+            (
+                {**transfer, "snd": _publicKey(nftHolder), "arcv": _publicKey(receiver), "xaid": nftID},
+                nftHolder,
+            ),
+        ])
+
+    def sendWithdraw(self, nftHolder: Account, nftID: int, fee: int) -> str:
+        """Send the group of a withdraw_nft call.
+
+        Returns:
+            The ID of the app call, once it is sent.
+        """
+        window = self._currentWindow()
+        appCall, destroy = window.templates[WITHDRAW]
+        sender = _publicKey(nftHolder)
+        return self._send(window, [
+            (
+                {**appCall, "snd": sender, "apaa": [b"withdraw_nft", fee.to_bytes(8, "big")],
+                 "apas": [nftID]},
+                nftHolder,
+            ),
+            ({**destroy, "snd": sender, "caid": nftID}, nftHolder),
+        ])
+
+    def sendValidate(
+            self,
+            sender: Account,
+            receiver: Account,
+            actionID: int,
+            actionData: Union[str, bytes],
+            approvals: List[ActionApproval],
+    ) -> str:
+        """Send the group of a validate_transfer_nft call.
+
+        Returns:
+            The ID of the app call, once it is sent.
+        """
+        window = self._currentWindow()
+        appCall, create = window.templates[VALIDATE]
+        signers, signatures = packApprovals(approvals, self._getThreshold())
+        data = actionData.encode() if isinstance(actionData, str) else actionData
+        address = _publicKey(sender)
+
+        txns: List[Tuple[TxnMap, Account]] = [
+            (
+                {
+                    **appCall,
+                    "snd": address,
+                    "apaa": [b"validate_transfer_nft", actionID.to_bytes(8, "big"), data, signers, signatures],
+                    "apat": [_publicKey(receiver)],
+                    "apbx": [{"n": actionBoxName(actionPage(actionID))}, {"n": VALIDATORS_BOX}],
+                },
+                sender,
+            ),
+            ({**create, "snd": address, "note": actionID.to_bytes(8, "big")}, sender),
+        ]
+        # noted like those of xpnet.operations
+        txns.extend(
+            (
+                {**budgetCall, "snd": address, "note": actionID.to_bytes(8, "big") + i.to_bytes(8, "big")},
+                sender,
+            )
+            for i, budgetCall in enumerate(window.budgetCalls)
+        )
+        return self._send(window, txns)
@@ -0,0 +1,869 @@
+"""An in-process stand-in for algod and KMD.
+
+FakeAlgodClient implements the algod endpoints xpnet uses on top of a small
+in-memory ledger, so the operations layer can run without a sandbox:
+
+    client = FakeAlgodClient()
+    kmd = FakeKMDClient(client)
+
+Rounds are produced instantly whenever someone waits for one, or every
+blockTime seconds. Transactions are checked (signature, group, validity
+window, fees, balances) and applied to the ledger when they are sent, the way
+algod evaluates them against its pending state, and they are confirmed by the
+next block. Account and application reads therefore already see transactions
+that are still in the pool.
+
+TEAL is not evaluated. App calls run an AppLogic written in Python instead,
+by default xpnet.logic.XpnetAppLogic, the model of
+xpnet.contracts.approval_program that xpnet.preflight checks groups with.
+"""
+
+import copy
+import hashlib
+import threading
+import time
+from base64 import b64decode, b64encode
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import msgpack
+from algosdk import account, constants, encoding, error
+from algosdk.future import transaction
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from ..confirmation import txnID
+from ..logic import AppCall, AppLogic, AppRejected, XpnetAppLogic
+from ..programs import TEAL_VERSION
+from ..utils import getAppAddress
+from ..whitelist import BOX_BYTE_MIN_BALANCE, BOX_FLAT_MIN_BALANCE
+
+GENESIS_ID = "fake-v1"
+GENESIS_HASH = hashlib.sha256(b"xpnet-fake").digest()
+
+GENESIS_ACCOUNTS = 3
+GENESIS_AMOUNT = 4_000_000_000_000_000
+
+MIN_BALANCE = 100_000
+MAX_VALID_ROUNDS = 1000
+
+# minimum balance increase of each global state entry of an app
+SCHEMA_UINT_COST = 28_500
+SCHEMA_BYTES_COST = 50_000
+
+MAX_GLOBAL_KEYS = 64
+MAX_KEY_LEN = 64
+MAX_KEY_VALUE_LEN = 128
+
+# msgpack fields holding addresses, rendered as strings in JSON responses
+_ADDRESS_FIELDS = {"snd", "rcv", "close", "arcv", "asnd", "aclose", "rekey", "m", "r", "f", "c", "apat"}
+
+KMD_WALLET_ID = "fake-wallet"
+KMD_WALLET_HANDLE = "fake-wallet-handle"
+
+
+class _Rejected(Exception):
+    pass
+
+
+class _AccountState:
+    __slots__ = ("amount", "authAddr", "assets", "createdAssets", "createdApps", "boxes", "boxBytes")
+
+    def __init__(self) -> None:
+        self.amount = 0
+        # boxes of the app of an app account, for its minimum balance
+        self.boxes = 0
+        self.boxBytes = 0
+        # the key the account is rekeyed to
+        self.authAddr: Optional[bytes] = None
+        # asset ID -> amount held
+        self.assets: Dict[int, int] = dict()
+        self.createdAssets: Set[int] = set()
+        self.createdApps: Set[int] = set()
+
+
+class _AssetState:
+    __slots__ = ("creator", "params")
+
+    def __init__(self, creator: str, params: Dict[str, Any]) -> None:
+        self.creator = creator
+        self.params = params
+
+
+class _AppState:
+    __slots__ = ("creator", "approval", "clear", "numUints", "numByteSlices", "globalState", "boxes")
+
+    def __init__(
+            self, creator: str, approval: bytes, clear: bytes, numUints: int, numByteSlices: int
+    ) -> None:
+        self.creator = creator
+        self.approval = approval
+        self.clear = clear
+        self.numUints = numUints
+        self.numByteSlices = numByteSlices
+        self.globalState: Dict[bytes, Union[int, bytes]] = dict()
+        self.boxes: Dict[bytes, bytes] = dict()
+
+
+class _TxnRecord:
+    __slots__ = ("stxn", "confirmedRound", "applyData", "logs", "globalDelta")
+
+    def __init__(self, stxn: Dict[str, Any]) -> None:
+        self.stxn = stxn
+        self.confirmedRound = 0
+        # caid/apid of created assets and apps, as in a block
+        self.applyData: Dict[str, Any] = dict()
+        self.logs: List[bytes] = []
+        self.globalDelta: Dict[bytes, Tuple[int, Union[int, bytes]]] = dict()
+
+
+def _jsonValue(key: str, value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _jsonValue(k, v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonValue(key, v) for v in value]
+    if isinstance(value, bytes):
+        if key in _ADDRESS_FIELDS and len(value) == 32:
+            return encoding.encode_address(value)
+        return b64encode(value).decode()
+    return value
+
+
+def _jsonState(state: Dict[bytes, Union[int, bytes]]) -> List[Dict[str, Any]]:
+    entries = []
+    for key, value in state.items():
+        if isinstance(value, int):
+            entries.append({"key": b64encode(key).decode(), "value": {"type": 2, "uint": value, "bytes": ""}})
+        else:
+            entries.append({"key": b64encode(key).decode(), "value": {"type": 1, "uint": 0, "bytes": b64encode(value).decode()}})
+    return entries
+
+
+class FakeAlgodClient:
+    """An in-process algod with the endpoints xpnet uses.
+
+    Args:
+        blockTime: Seconds between rounds. With 0, a round is produced as soon
+            as someone waits for it.
+        genesisAccounts: The number of funded accounts the ledger starts with,
+            see FakeKMDClient.
+        appLogic: Runs the app calls, see xpnet.logic.AppCall.
+    """
+
+    def __init__(
+            self,
+            blockTime: float = 0.0,
+            genesisAccounts: int = GENESIS_ACCOUNTS,
+            appLogic: Optional[AppLogic] = None,
+    ) -> None:
+        self.blockTime = blockTime
+        # the lowest fee of a transaction the pool takes, set to simulate
+        # congestion; algod's threshold is per byte
+        self.feeThreshold = 0
+        self.appLogic: AppLogic = appLogic if appLogic is not None else XpnetAppLogic()
+
+        self._lock = threading.RLock()
+        self._newRound = threading.Condition(self._lock)
+
+        self._round = 1
+        self._roundTime = time.monotonic()
+        self._blocks: Dict[int, List[str]] = {1: []}
+        self._pool: List[str] = []
+        self._txns: Dict[str, _TxnRecord] = dict()
+        self._leases: Dict[Tuple[bytes, bytes], int] = dict()
+
+        self._accounts: Dict[str, _AccountState] = dict()
+        self._assets: Dict[int, _AssetState] = dict()
+        self._apps: Dict[int, _AppState] = dict()
+        self._nextIndex = 1000
+
+        self.genesisKeys: List[str] = []
+        for _ in range(genesisAccounts):
+            privateKey, address = account.generate_account()
+            self.genesisKeys.append(privateKey)
+            self._getAccount(address).amount = GENESIS_AMOUNT
+
+    # chain
+
+    def _advance(self) -> None:
+        if self.blockTime <= 0:
+            return
+
+        elapsed = int((time.monotonic() - self._roundTime) / self.blockTime)
+        for _ in range(elapsed):
+            self._produceBlock()
+        if elapsed > 0:
+            self._roundTime += elapsed * self.blockTime
+
+    def _produceBlock(self) -> None:
+        self._round += 1
+        for txID in self._pool:
+            self._txns[txID].confirmedRound = self._round
+        self._blocks[self._round] = self._pool
+        self._pool = []
+        self._roundTime = time.monotonic()
+        self._newRound.notify_all()
+
+    def _status(self) -> Dict[str, Any]:
+        return {
+            "last-round": self._round,
+            "last-version": "future",
+            "next-version": "future",
+            "next-version-round": self._round + 1,
+            "next-version-supported": True,
+            "time-since-last-round": int((time.monotonic() - self._roundTime) * 1e9),
+            "catchup-time": 0,
+            "stopped-at-unsupported-round": False,
+        }
+
+    def status(self, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            return self._status()
+
+    def status_after_block(self, block_num: int = None, round_num: int = None, **kwargs) -> Dict[str, Any]:
+        target = block_num if block_num is not None else round_num
+        if target is None:
+            raise error.UnderspecifiedRoundError
+
+        with self._lock:
+            while True:
+                self._advance()
+                if self._round > target:
+                    return self._status()
+
+                if self.blockTime <= 0:
+                    self._produceBlock()
+                else:
+                    wait = self._roundTime + self.blockTime - time.monotonic()
+                    self._newRound.wait(max(wait, 0))
+
+    def block_info(self, block: int = None, response_format: str = "json", round_num: int = None, **kwargs):
+        round = block if block is not None else round_num
+        if round is None:
+            raise error.UnderspecifiedRoundError
+
+        with self._lock:
+            self._advance()
+            if round not in self._blocks:
+                raise error.AlgodHTTPError("failed to retrieve information from the ledger", 404)
+
+            txns = []
+            for txID in self._blocks[round]:
+                record = self._txns[txID]
+                stib = dict(record.stxn)
+                txn = dict(stib["txn"])
+                txn.pop("gen", None)
+                txn.pop("gh", None)
+                stib["txn"] = txn
+                stib["hgi"] = True
+                stib.update(record.applyData)
+                dt: Dict[str, Any] = dict()
+                if record.globalDelta:
+                    dt["gd"] = {
+                        key: {"at": action, "ui": value} if action == 2 else {"at": action, "bs": value}
+                        for key, (action, value) in record.globalDelta.items()
+                    }
+                if record.logs:
+                    dt["lg"] = list(record.logs)
+                if dt:
+                    stib["dt"] = dt
+                txns.append(stib)
+
+            block = {
+                "block": {
+                    "rnd": round,
+                    "gen": GENESIS_ID,
+                    "gh": GENESIS_HASH,
+                    "ts": int(time.time()),
+                    "txns": txns,
+                }
+            }
+
+        if response_format == "msgpack":
+            return msgpack.packb(block, use_bin_type=True)
+        return _jsonValue("", block)
+
+    def suggested_params(self, **kwargs) -> transaction.SuggestedParams:
+        with self._lock:
+            self._advance()
+            return transaction.SuggestedParams(
+                0,
+                self._round,
+                self._round + MAX_VALID_ROUNDS,
+                b64encode(GENESIS_HASH).decode(),
+                GENESIS_ID,
+                False,
+                "future",
+                constants.min_txn_fee,
+            )
+
+    # transactions
+
+    def send_transaction(self, txn, **kwargs) -> str:
+        return self.send_transactions([txn])
+
+    def send_transactions(self, txns, **kwargs) -> str:
+        serialized = []
+        for txn in txns:
+            assert not isinstance(
+                txn, transaction.Transaction
+            ), "Attempt to send UNSIGNED transaction {}".format(txn)
+            serialized.append(b64decode(encoding.msgpack_encode(txn)))
+
+        return self.send_raw_transaction(b64encode(b"".join(serialized)))
+
+    def send_raw_transaction(self, txn, **kwargs) -> str:
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(b64decode(txn))
+        stxns: List[Dict[str, Any]] = list(unpacker)
+
+        with self._lock:
+            self._advance()
+            try:
+                txIDs = self._submitGroup(stxns)
+            except _Rejected as e:
+                raise error.AlgodHTTPError(str(e), 400)
+
+        return txIDs[0]
+
+    def _submitGroup(self, stxns: List[Dict[str, Any]]) -> List[str]:
+        if len(stxns) == 0 or len(stxns) > constants.tx_group_limit:
+            raise _Rejected("invalid group size {}".format(len(stxns)))
+
+        txns = [stxn["txn"] for stxn in stxns]
+        txIDs = [txnID(txn) for txn in txns]
+        nextRound = self._round + 1
+
+        # identical transactions, like app calls with the same arguments and
+        # no note, have the same ID and only one of them could be committed
+        for i, txID in enumerate(txIDs):
+            if txID in txIDs[:i]:
+                raise _Rejected("transaction {} appears more than once in the group".format(txID))
+
+        for txID, stxn in zip(txIDs, stxns):
+            txn = stxn["txn"]
+            if txID in self._txns:
+                raise _Rejected("transaction already in ledger: {}".format(txID))
+            if txn.get("gh") != GENESIS_HASH:
+                raise _Rejected("{}: genesis hash mismatch".format(txID))
+            if not txn.get("fv", 0) <= nextRound <= txn.get("lv", 0):
+                raise _Rejected(
+                    "txn dead: round {} outside of {}--{}".format(nextRound, txn.get("fv", 0), txn.get("lv", 0))
+                )
+            self._verifySignature(txID, stxn)
+
+        self._verifyGroup(txns)
+
+        fees = sum(txn.get("fee", 0) for txn in txns)
+        if fees < constants.min_txn_fee * len(txns):
+            raise _Rejected("txgroup had {} in fees, which is less than the minimum {}".format(
+                fees, constants.min_txn_fee * len(txns)))
+
+        for txID, txn in zip(txIDs, txns):
+            if txn.get("fee", 0) < self.feeThreshold:
+                raise _Rejected("{}: fee {} below threshold {}".format(
+                    txID, txn.get("fee", 0), self.feeThreshold))
+
+        for txID, txn in zip(txIDs, txns):
+            lease = txn.get("lx")
+            if lease and self._leases.get((txn["snd"], lease), 0) >= nextRound:
+                raise _Rejected("{}: transaction using an overlapping lease".format(txID))
+
+        undo = _Undo(self)
+        records = [_TxnRecord(stxn) for stxn in stxns]
+        try:
+            for i, (txn, record) in enumerate(zip(txns, records)):
+                self._apply(txn, record, txns, i, undo)
+            for address in undo.touchedAccounts():
+                self._checkMinBalance(address)
+        except _Rejected as e:
+            undo.rollback()
+            raise _Rejected("transaction {}: {}".format(txIDs[0], e))
+        except AppRejected as e:
+            undo.rollback()
+            raise _Rejected("transaction {}: logic eval error: {}".format(txIDs[0], e))
+
+        for txID, txn, record in zip(txIDs, txns, records):
+            if txn.get("lx"):
+                self._leases[(txn["snd"], txn["lx"])] = txn["lv"]
+            self._txns[txID] = record
+            self._pool.append(txID)
+
+        return txIDs
+
+    def _verifySignature(self, txID: str, stxn: Dict[str, Any]) -> None:
+        sender = stxn["txn"]["snd"]
+        signer = stxn.get("sgnr", sender)
+        if "sig" not in stxn:
+            raise _Rejected("{}: only single signatures are supported".format(txID))
+
+        senderState = self._accounts.get(encoding.encode_address(sender))
+        authAddr = senderState.authAddr if senderState is not None else None
+        if signer != (authAddr or sender):
+            raise _Rejected("{}: should have been authorized by {}".format(
+                txID, encoding.encode_address(authAddr or sender)))
+
+        encoded = msgpack.packb(dict(sorted(stxn["txn"].items())), use_bin_type=True)
+        try:
+            VerifyKey(signer).verify(constants.txid_prefix + encoded, stxn["sig"])
+        except BadSignatureError:
+            raise _Rejected("{}: invalid signature".format(txID))
+
+    def _verifyGroup(self, txns: List[Dict[str, Any]]) -> None:
+        groups = {txn.get("grp") for txn in txns}
+        if len(txns) == 1 and groups == {None}:
+            return
+
+        if len(groups) != 1 or None in groups:
+            raise _Rejected("transactions in a group must share a group ID")
+
+        digests = []
+        for txn in txns:
+            ungrouped = {k: v for k, v in txn.items() if k != "grp"}
+            encoded = msgpack.packb(dict(sorted(ungrouped.items())), use_bin_type=True)
+            digests.append(encoding.checksum(constants.txid_prefix + encoded))
+
+        encodedGroup = msgpack.packb({"txlist": digests}, use_bin_type=True)
+        if encoding.checksum(constants.tgid_prefix + encodedGroup) != groups.pop():
+            raise _Rejected("incomplete group")
+
+    def _getAccount(self, address: str) -> _AccountState:
+        state = self._accounts.get(address)
+        if state is None:
+            state = _AccountState()
+            self._accounts[address] = state
+        return state
+
+    def _minBalance(self, state: _AccountState) -> int:
+        balance = MIN_BALANCE * (1 + len(state.assets))
+        balance += BOX_FLAT_MIN_BALANCE * state.boxes + BOX_BYTE_MIN_BALANCE * state.boxBytes
+        for appID in state.createdApps:
+            app = self._apps[appID]
+            balance += MIN_BALANCE
+            balance += SCHEMA_UINT_COST * app.numUints + SCHEMA_BYTES_COST * app.numByteSlices
+        return balance
+
+    def _checkMinBalance(self, address: str) -> None:
+        state = self._accounts.get(address)
+        if state is None:
+            return
+        if state.amount == 0 and len(state.assets) == 0 and len(state.createdApps) == 0 and state.boxes == 0:
+            # closed account
+            return
+        minBalance = self._minBalance(state)
+        if state.amount < minBalance:
+            raise _Rejected(
+                "account {} balance {} below min {}".format(address, state.amount, minBalance)
+            )
+
+    def _transfer(self, sender: str, receiver: str, amount: int, undo: "_Undo") -> None:
+        undo.saveAccount(sender)
+        undo.saveAccount(receiver)
+        senderState = self._getAccount(sender)
+        if senderState.amount < amount:
+            raise _Rejected("overspend (account {}, data {{amount {}}})".format(sender, senderState.amount))
+        senderState.amount -= amount
+        self._getAccount(receiver).amount += amount
+
+    def _newIndex(self) -> int:
+        self._nextIndex += 1
+        return self._nextIndex
+
+    def _apply(
+            self,
+            txn: Dict[str, Any],
+            record: _TxnRecord,
+            group: List[Dict[str, Any]],
+            groupIndex: int,
+            undo: "_Undo",
+    ) -> None:
+        sender = encoding.encode_address(txn["snd"])
+        undo.saveAccount(sender)
+        senderState = self._getAccount(sender)
+
+        fee = txn.get("fee", 0)
+        if senderState.amount < fee:
+            raise _Rejected("overspend (account {}, data {{amount {}}})".format(sender, senderState.amount))
+        senderState.amount -= fee
+
+        if "rekey" in txn:
+            senderState.authAddr = None if txn["rekey"] == txn["snd"] else txn["rekey"]
+
+        txnType = txn["type"]
+        if txnType == "pay":
+            self._applyPayment(sender, txn, undo)
+        elif txnType == "axfer":
+            self._applyAssetTransfer(sender, txn, undo)
+        elif txnType == "acfg":
+            self._applyAssetConfig(sender, txn, record, undo)
+        elif txnType == "appl":
+            self._applyAppCall(sender, txn, record, group, groupIndex, undo)
+        else:
+            raise _Rejected("unsupported transaction type {}".format(txnType))
+
+    def _applyPayment(self, sender: str, txn: Dict[str, Any], undo: "_Undo") -> None:
+        receiver = encoding.encode_address(txn["rcv"]) if "rcv" in txn else encoding.encode_address(bytes(32))
+        self._transfer(sender, receiver, txn.get("amt", 0), undo)
+
+        if "close" in txn:
+            senderState = self._getAccount(sender)
+            if senderState.assets or senderState.createdApps:
+                raise _Rejected("cannot close account {} with assets or apps".format(sender))
+            self._transfer(sender, encoding.encode_address(txn["close"]), senderState.amount, undo)
+
+    def _applyAssetTransfer(self, sender: str, txn: Dict[str, Any], undo: "_Undo") -> None:
+        assetID = txn.get("xaid", 0)
+        asset = self._assets.get(assetID)
+        if asset is None:
+            raise _Rejected("asset {} does not exist".format(assetID))
+
+        receiver = encoding.encode_address(txn["arcv"]) if "arcv" in txn else encoding.encode_address(bytes(32))
+        amount = txn.get("aamt", 0)
+
+        source = sender
+        if "asnd" in txn:
+            if asset.params.get("c") != txn["snd"]:
+                raise _Rejected("only the clawback address can revoke asset {}".format(assetID))
+            source = encoding.encode_address(txn["asnd"])
+
+        undo.saveAccount(source)
+        undo.saveAccount(receiver)
+
+        # opt in
+        if source == receiver and amount == 0 and "aclose" not in txn:
+            self._getAccount(receiver).assets.setdefault(assetID, 0)
+            return
+
+        sourceState = self._getAccount(source)
+        receiverState = self._getAccount(receiver)
+        if assetID not in sourceState.assets:
+            raise _Rejected("asset {} missing from {}".format(assetID, source))
+        if assetID not in receiverState.assets:
+            raise _Rejected("asset {} missing from {}".format(assetID, receiver))
+        if sourceState.assets[assetID] < amount:
+            raise _Rejected("underflow on subtracting {} from sender amount {}".format(
+                amount, sourceState.assets[assetID]))
+
+        sourceState.assets[assetID] -= amount
+        receiverState.assets[assetID] += amount
+
+        if "aclose" in txn:
+            closeTo = encoding.encode_address(txn["aclose"])
+            undo.saveAccount(closeTo)
+            closeState = self._getAccount(closeTo)
+            if assetID not in closeState.assets:
+                raise _Rejected("asset {} missing from {}".format(assetID, closeTo))
+            closeState.assets[assetID] += sourceState.assets.pop(assetID)
+
+    def _applyAssetConfig(
+            self, sender: str, txn: Dict[str, Any], record: _TxnRecord, undo: "_Undo"
+    ) -> None:
+        assetID = txn.get("caid", 0)
+        params = txn.get("apar")
+
+        if assetID == 0:
+            assetID = self._newIndex()
+            params = params or dict()
+            undo.saveAsset(assetID)
+            self._assets[assetID] = _AssetState(sender, dict(params))
+            senderState = self._getAccount(sender)
+            senderState.assets[assetID] = params.get("t", 0)
+            senderState.createdAssets.add(assetID)
+            record.applyData["caid"] = assetID
+            return
+
+        asset = self._assets.get(assetID)
+        if asset is None:
+            raise _Rejected("asset {} does not exist".format(assetID))
+        if asset.params.get("m") != txn["snd"]:
+            raise _Rejected("this transaction should be issued by the manager")
+
+        undo.saveAsset(assetID)
+        if params is None:
+            # destroy
+            undo.saveAccount(asset.creator)
+            creatorState = self._getAccount(asset.creator)
+            if creatorState.assets.get(assetID) != asset.params.get("t", 0):
+                raise _Rejected("cannot destroy asset {}: creator is holding only part of it".format(assetID))
+            del creatorState.assets[assetID]
+            creatorState.createdAssets.discard(assetID)
+            del self._assets[assetID]
+        else:
+            reconfigured = dict(asset.params)
+            for field in ("m", "r", "f", "c"):
+                if field in params:
+                    reconfigured[field] = params[field]
+                else:
+                    reconfigured.pop(field, None)
+            asset.params = reconfigured
+
+    def _applyAppCall(
+            self,
+            sender: str,
+            txn: Dict[str, Any],
+            record: _TxnRecord,
+            group: List[Dict[str, Any]],
+            groupIndex: int,
+            undo: "_Undo",
+    ) -> None:
+        appID = txn.get("apid", 0)
+        onCompletion = txn.get("apan", transaction.OnComplete.NoOpOC)
+
+        if appID == 0:
+            appID = self._newIndex()
+            schema = txn.get("apgs", dict())
+            undo.saveApp(appID)
+            self._apps[appID] = _AppState(
+                sender, txn.get("apap", b""), txn.get("apsu", b""),
+                schema.get("nui", 0), schema.get("nbs", 0),
+            )
+            self._getAccount(sender).createdApps.add(appID)
+            record.applyData["apid"] = appID
+
+        app = self._apps.get(appID)
+        if app is None:
+            raise _Rejected("application {} does not exist".format(appID))
+
+        undo.saveApp(appID)
+        before = dict(app.globalState)
+
+        if onCompletion == transaction.OnComplete.ClearStateOC:
+            return
+
+        call = AppCall(
+            appID, app.creator, txn, group, groupIndex, app.globalState, app.boxes, self._round + 1
+        )
+        self.appLogic(call)
+        self._checkGlobalState(app)
+
+        appAddress = getAppAddress(appID)
+        undo.saveAccount(appAddress)
+        appAccount = self._getAccount(appAddress)
+        appAccount.boxes = len(app.boxes)
+        appAccount.boxBytes = sum(len(name) + len(value) for name, value in app.boxes.items())
+
+        for key, value in app.globalState.items():
+            if before.get(key) != value:
+                record.globalDelta[key] = (2 if isinstance(value, int) else 1, value)
+        for key in before.keys() - app.globalState.keys():
+            record.globalDelta[key] = (3, 0)
+        record.logs = call.logs
+
+        if onCompletion == transaction.OnComplete.DeleteApplicationOC:
+            undo.saveAccount(app.creator)
+            self._getAccount(app.creator).createdApps.discard(appID)
+            del self._apps[appID]
+
+    def _checkGlobalState(self, app: _AppState) -> None:
+        uints = 0
+        byteSlices = 0
+        for key, value in app.globalState.items():
+            if len(key) > MAX_KEY_LEN:
+                raise _Rejected("key too long: length was {}, maximum is {}".format(len(key), MAX_KEY_LEN))
+            if isinstance(value, int):
+                uints += 1
+            else:
+                byteSlices += 1
+                if len(key) + len(value) > MAX_KEY_VALUE_LEN:
+                    raise _Rejected("key/value total too long for key {!r}".format(key))
+
+        if uints > app.numUints:
+            raise _Rejected("store integer count {} exceeds schema integer count {}".format(uints, app.numUints))
+        if byteSlices > app.numByteSlices:
+            raise _Rejected("store bytes count {} exceeds schema bytes count {}".format(byteSlices, app.numByteSlices))
+
+    def pending_transaction_info(self, transaction_id: str, response_format: str = "json", **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            record = self._txns.get(transaction_id)
+            if record is None:
+                raise error.AlgodHTTPError("txn does not exist", 404)
+
+            response: Dict[str, Any] = {
+                "pool-error": "",
+                "txn": _jsonValue("", record.stxn),
+            }
+            if record.confirmedRound > 0:
+                response["confirmed-round"] = record.confirmedRound
+                if "caid" in record.applyData:
+                    response["asset-index"] = record.applyData["caid"]
+                if "apid" in record.applyData:
+                    response["application-index"] = record.applyData["apid"]
+                if record.globalDelta:
+                    response["global-state-delta"] = [
+                        {
+                            "key": b64encode(key).decode(),
+                            "value": {"action": action, "uint": value}
+                            if action != 1 else {"action": action, "bytes": b64encode(value).decode()},
+                        }
+                        for key, (action, value) in record.globalDelta.items()
+                    ]
+                if record.logs:
+                    response["logs"] = [b64encode(log).decode() for log in record.logs]
+            return response
+
+    def pending_transactions(self, max_txns: int = 0, response_format: str = "json", **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            txIDs = self._pool if max_txns == 0 else self._pool[:max_txns]
+            return {
+                "top-transactions": [_jsonValue("", self._txns[txID].stxn) for txID in txIDs],
+                "total-transactions": len(self._pool),
+            }
+
+    # state
+
+    def account_info(self, address: str, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            state = self._accounts.get(address, _AccountState())
+            return {
+                "address": address,
+                "amount": state.amount,
+                "amount-without-pending-rewards": state.amount,
+                "min-balance": self._minBalance(state),
+                "round": self._round,
+                "status": "Offline",
+                "assets": [
+                    {"asset-id": assetID, "amount": amount, "is-frozen": False}
+                    for assetID, amount in state.assets.items()
+                ],
+                "created-assets": [
+                    {"index": assetID, "params": _jsonValue("", self._assets[assetID].params)}
+                    for assetID in state.createdAssets
+                ],
+                "created-apps": [self._appInfo(appID) for appID in state.createdApps],
+            }
+
+    def _appInfo(self, appID: int) -> Dict[str, Any]:
+        app = self._apps[appID]
+        return {
+            "id": appID,
+            "params": {
+                "creator": app.creator,
+                "approval-program": b64encode(app.approval).decode(),
+                "clear-state-program": b64encode(app.clear).decode(),
+                "global-state-schema": {"num-uint": app.numUints, "num-byte-slice": app.numByteSlices},
+                "local-state-schema": {"num-uint": 0, "num-byte-slice": 0},
+                "global-state": _jsonState(app.globalState),
+            },
+        }
+
+    def application_info(self, application_id: int, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            if application_id not in self._apps:
+                raise error.AlgodHTTPError("application does not exist", 404)
+            return self._appInfo(application_id)
+
+    def application_boxes(self, application_id: int, limit: int = 0, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            if application_id not in self._apps:
+                raise error.AlgodHTTPError("application does not exist", 404)
+            names = list(self._apps[application_id].boxes)
+            if limit > 0:
+                names = names[:limit]
+            return {"boxes": [{"name": b64encode(name).decode()} for name in names]}
+
+    def application_box_by_name(self, application_id: int, box_name: bytes, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            app = self._apps.get(application_id)
+            if app is None or box_name not in app.boxes:
+                raise error.AlgodHTTPError("box not found", 404)
+            return {
+                "name": b64encode(box_name).decode(),
+                "round": self._round,
+                "value": b64encode(app.boxes[box_name]).decode(),
+            }
+
+    def asset_info(self, asset_id: int, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            asset = self._assets.get(asset_id)
+            if asset is None:
+                raise error.AlgodHTTPError("asset does not exist", 404)
+            params = _jsonValue("", asset.params)
+            params["creator"] = asset.creator
+            return {"index": asset_id, "params": params}
+
+    def compile(self, source: str, source_map: bool = False, **kwargs) -> Dict[str, str]:
+        """Stand in for TEAL compilation.
+
+        The program is not assembled. The result is a deterministic byte
+        string derived from the source, which is enough to create apps with.
+        """
+        program = bytes([TEAL_VERSION]) + hashlib.sha256(source.encode("utf-8")).digest()
+        programHash = encoding.encode_address(encoding.checksum(b"Program" + program))
+        return {"hash": programHash, "result": b64encode(program).decode()}
+
+    def appAddress(self, appID: int) -> str:
+        return getAppAddress(appID)
+
+
+class _Undo:
+    """Restores the ledger objects a failed group changed."""
+
+    def __init__(self, client: FakeAlgodClient) -> None:
+        self.client = client
+        self.accounts: Dict[str, Optional[_AccountState]] = dict()
+        self.assets: Dict[int, Optional[_AssetState]] = dict()
+        self.apps: Dict[int, Optional[_AppState]] = dict()
+        self.nextIndex = client._nextIndex
+
+    def saveAccount(self, address: str) -> None:
+        if address not in self.accounts:
+            self.accounts[address] = copy.deepcopy(self.client._accounts.get(address))
+
+    def saveAsset(self, assetID: int) -> None:
+        if assetID not in self.assets:
+            self.assets[assetID] = copy.deepcopy(self.client._assets.get(assetID))
+
+    def saveApp(self, appID: int) -> None:
+        if appID not in self.apps:
+            self.apps[appID] = copy.deepcopy(self.client._apps.get(appID))
+
+    def touchedAccounts(self) -> List[str]:
+        return list(self.accounts)
+
+    def rollback(self) -> None:
+        for store, saved in (
+                (self.client._accounts, self.accounts),
+                (self.client._assets, self.assets),
+                (self.client._apps, self.apps),
+        ):
+            for key, value in saved.items():
+                if value is None:
+                    store.pop(key, None)
+                else:
+                    store[key] = value
+        self.client._nextIndex = self.nextIndex
+
+
+class FakeKMDClient:
+    """A KMD holding the genesis accounts of a FakeAlgodClient in one wallet."""
+
+    def __init__(self, algod: FakeAlgodClient, walletName: str = "unencrypted-default-wallet") -> None:
+        self.algod = algod
+        self.walletName = walletName
+
+    def list_wallets(self) -> List[Dict[str, Any]]:
+        return [{"id": KMD_WALLET_ID, "name": self.walletName}]
+
+    def init_wallet_handle(self, id: str, password: str) -> str:
+        if id != KMD_WALLET_ID:
+            raise error.KMDHTTPError("wallet not found")
+        return KMD_WALLET_HANDLE
+
+    def release_wallet_handle(self, handle: str) -> bool:
+        return True
+
+    def list_keys(self, handle: str) -> List[str]:
+        return [account.address_from_private_key(sk) for sk in self.algod.genesisKeys]
+
+    def export_key(self, handle: str, password: str, address: str) -> str:
+        for sk in self.algod.genesisKeys:
+            if account.address_from_private_key(sk) == address:
+                return sk
+        raise error.KMDHTTPError("key does not exist in this wallet")
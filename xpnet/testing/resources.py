@@ -1,81 +1,201 @@
+import threading
 from random import randint
-from typing import List
+from typing import List, Optional, Tuple
 
 from algosdk import account
 from algosdk.future import transaction
 from algosdk.v2client.algod import AlgodClient
 
 from .setup import getGenesisAccounts
-from ..account import Account
-from ..utils import waitForTransaction
+from ..account import Account, sign_many
+from ..operations import MAX_GROUP_SIZE, NftSpec, mint_nfts
+from ..params import SuggestedParamsProvider, getSuggestedParams
+from ..utils import waitForTransactions
 
 FUNDING_AMOUNT = 100_000_000
 
-accountList: List[Account] = []
-
-
-def getTemporaryAccount(client: AlgodClient) -> Account:
-    global accountList
-
-    if len(accountList) == 0:
-        sks = [account.generate_account()[0] for i in range(16)]
-        accountList = [Account(sk) for sk in sks]
+POOL_SIZE = 16
+POOL_LOW_WATER = 4
+
+
+class TemporaryAccountPool:
+    """A pool of funded temporary accounts that refills itself.
+
+    New accounts are funded by groups of up to 16 payments, with the payments
+    spread over all genesis accounts. When the pool drops below lowWater
+    accounts, a background thread funds enough accounts to bring it back to
+    size, so callers only wait for funding when they drain it faster than it
+    refills.
+
+    Args:
+        client: An algod client.
+        size: The number of accounts the pool is filled to.
+        lowWater: The number of accounts below which the pool is refilled.
+        fundingAmount: The number of microAlgos each account is funded with.
+        params: A suggested params provider. If omitted, the params are
+            fetched from algod.
+    """
+
+    def __init__(
+            self,
+            client: AlgodClient,
+            size: int = POOL_SIZE,
+            lowWater: int = POOL_LOW_WATER,
+            fundingAmount: int = FUNDING_AMOUNT,
+            params: Optional[SuggestedParamsProvider] = None,
+    ) -> None:
+        self.client = client
+        self.size = size
+        self.lowWater = lowWater
+        self.fundingAmount = fundingAmount
+        self.params = params
+
+        self._accounts: List[Account] = []
+        self._condition = threading.Condition()
+        self._refilling = False
+        self._error: Optional[Exception] = None
+
+    def get(self) -> Account:
+        """Take a funded account out of the pool, waiting if it is empty."""
+        with self._condition:
+            if len(self._accounts) - 1 < self.lowWater:
+                self._startRefill()
+
+            while len(self._accounts) == 0:
+                if self._error is not None:
+                    error, self._error = self._error, None
+                    raise error
+                if not self._refilling:
+                    self._startRefill()
+                self._condition.wait()
+
+            return self._accounts.pop()
+
+    def _startRefill(self) -> None:
+        if self._refilling:
+            return
+
+        self._refilling = True
+        thread = threading.Thread(
+            target=self._refill, name="xpnet-account-pool", daemon=True
+        )
+        thread.start()
+
+    def _refill(self) -> None:
+        try:
+            with self._condition:
+                count = max(self.size - len(self._accounts), 1)
+            accounts = self.fund(count)
+        except Exception as e:
+            with self._condition:
+                self._error = e
+                self._refilling = False
+                self._condition.notify_all()
+            return
+
+        with self._condition:
+            self._accounts.extend(accounts)
+            self._refilling = False
+            self._condition.notify_all()
+
+    def fund(self, count: int) -> List[Account]:
+        """Create and fund new accounts, without adding them to the pool."""
+        accounts = [Account(account.generate_account()[0]) for _ in range(count)]
 
         genesisAccounts = getGenesisAccounts()
-        suggestedParams = client.suggested_params()
-
-        txns: List[transaction.Transaction] = []
-        for i, a in enumerate(accountList):
-            fundingAccount = genesisAccounts[i % len(genesisAccounts)]
-            txns.append(
-                transaction.PaymentTxn(
-                    sender=fundingAccount.getAddress(),
-                    receiver=a.getAddress(),
-                    amt=FUNDING_AMOUNT,
-                    sp=suggestedParams,
-                )
+        suggestedParams = getSuggestedParams(self.client, self.params)
+
+        groups: List[List[Tuple[transaction.Transaction, Account]]] = []
+        for start in range(0, count, MAX_GROUP_SIZE):
+            group: List[Tuple[transaction.Transaction, Account]] = []
+            for i in range(start, min(start + MAX_GROUP_SIZE, count)):
+                fundingAccount = genesisAccounts[i % len(genesisAccounts)]
+                group.append((
+                    transaction.PaymentTxn(
+                        sender=fundingAccount.getAddress(),
+                        receiver=accounts[i].getAddress(),
+                        amt=self.fundingAmount,
+                        sp=suggestedParams,
+                    ),
+                    fundingAccount,
+                ))
+            transaction.assign_group_id([txn for txn, _ in group])
+            groups.append(group)
+
+        signedTxns = sign_many([txn for group in groups for txn in group])
+
+        txIDs = []
+        start = 0
+        for group in groups:
+            self.client.send_transactions(signedTxns[start:start + len(group)])
+            txIDs.append(signedTxns[start].get_txid())
+            start += len(group)
+
+        waitForTransactions(self.client, txIDs)
+
+        return accounts
+
+
+accountPool: Optional[TemporaryAccountPool] = None
+accountPoolLock = threading.Lock()
+
+
+def getTemporaryAccount(
+        client: AlgodClient, params: Optional[SuggestedParamsProvider] = None
+) -> Account:
+    """Take a funded account out of the shared pool.
+
+    The pool is created by the first call, with its client and params. Later
+    calls with another client, or with other params, raise an exception
+    rather than silently funding accounts with those of the first call.
+    """
+    global accountPool
+
+    with accountPoolLock:
+        if accountPool is None:
+            accountPool = TemporaryAccountPool(client, params=params)
+        elif accountPool.client is not client:
+            raise Exception("The temporary account pool was created for another client")
+        elif params is not None and params is not accountPool.params:
+            if accountPool.params is not None:
+                raise Exception("The temporary account pool was created with other params")
+            # the pool fetched its params from algod until now
+            accountPool.params = params
+        pool = accountPool
+
+    return pool.get()
+
+
+def createDummyNFTAssets(
+        client: AlgodClient,
+        count: int,
+        seller: Account = None,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> List[int]:
+    if seller is None:
+        seller = getTemporaryAccount(client, params)
+
+    nfts: List[NftSpec] = []
+    for _ in range(count):
+        randomNumber = randint(0, 999)
+        # this random note reduces the likelihood of this transaction looking like a duplicate
+        randomNote = bytes(randint(0, 255) for _ in range(20))
+
+        nfts.append(
+            NftSpec(
+                unitName=f"D{randomNumber}",
+                assetName=f"Dummy {randomNumber}",
+                url=f"https://dummy.asset/{randomNumber}",
+                note=randomNote,
             )
+        )
 
-        txns = transaction.assign_group_id(txns)
-        signedTxns = [
-            txn.sign(genesisAccounts[i % len(genesisAccounts)].getPrivateKey())
-            for i, txn in enumerate(txns)
-        ]
+    return mint_nfts(client, seller, nfts, params=params)
 
-        client.send_transactions(signedTxns)
 
-        waitForTransaction(client, signedTxns[0].get_txid())
-
-    return accountList.pop()
-
-
-def createDummyNFTAsset(client: AlgodClient, seller: Account = None) -> int:
-    if seller is None:
-        seller = getTemporaryAccount(client)
-
-    randomNumber = randint(0, 999)
-    # this random note reduces the likelihood of this transaction looking like a duplicate
-    randomNote = bytes(randint(0, 255) for _ in range(20))
-
-    txn = transaction.AssetCreateTxn(
-        sender=seller.getAddress(),
-        total=1,  # NFTs have totalIssuance of exactly 1
-        decimals=0,  # NFTs have decimals of exactly 0
-        default_frozen=False,
-        manager=seller.getAddress(),
-        reserve=seller.getAddress(),
-        freeze=seller.getAddress(),
-        clawback=seller.getAddress(),
-        unit_name=f"D{randomNumber}",
-        asset_name=f"Dummy {randomNumber}",
-        url=f"https://dummy.asset/{randomNumber}",
-        note=randomNote,
-        sp=client.suggested_params(),
-    )
-    signedTxn = txn.sign(seller.getPrivateKey())
-
-    client.send_transaction(signedTxn)
-
-    response = waitForTransaction(client, signedTxn.get_txid())
-    assert response.assetIndex is not None and response.assetIndex > 0
-    return response.assetIndex
+def createDummyNFTAsset(
+        client: AlgodClient,
+        seller: Account = None,
+        params: Optional[SuggestedParamsProvider] = None,
+) -> int:
+    return createDummyNFTAssets(client, 1, seller, params)[0]
@@ -0,0 +1,295 @@
+"""An HTTP stand-in for algod, serving a FakeAlgodClient on the algod routes.
+
+xpnet.testing.fake runs in process, so it never exercises the HTTP paths of
+xpnet.aio. FakeAlgodServer serves a fake over aiohttp on the routes of the
+algod v2 API that xpnet uses, so that AsyncAlgodClient talks to it the way
+it talks to a node:
+
+    async with FakeAlgodServer() as server:
+        client = AsyncAlgodClient(ALGOD_TOKEN, server.address)
+        ...
+
+The fake's calls can block, waiting for a block, so they run in the default
+executor. `python -m xpnet.testing.server` serves a fake until interrupted,
+and with --check runs the xpnet.aio operations against it and exits 1 on
+failure.
+"""
+
+import argparse
+import asyncio
+import functools
+import sys
+from base64 import b64decode, b64encode
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from aiohttp import web
+from algosdk import account, error
+from algosdk.future import transaction
+
+from ..account import Account, sign_many
+from ..aio import operations as aio
+from ..aio.client import AsyncAlgodClient
+from ..aio.utils import getBalances
+from ..approvals import approveAction
+from ..operations import NftSpec, fund_action_pages, mint_nfts
+from ..utils import waitForTransaction
+from .fake import FakeAlgodClient
+from .setup import ALGOD_TOKEN
+
+DEFAULT_HOST = "127.0.0.1"
+
+FUNDING_AMOUNT = 10_000_000
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+def _call(function: Callable[[web.Request], Any]) -> Handler:
+    """Run a fake call off the event loop and answer like algod."""
+
+    @functools.wraps(function)
+    async def handler(request: web.Request) -> web.StreamResponse:
+        body = await request.read()
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, function, request, body)
+        except error.AlgodHTTPError as e:
+            return web.json_response({"message": str(e)}, status=e.code or 400)
+        except Exception as e:
+            return web.json_response({"message": str(e)}, status=500)
+
+        if isinstance(result, bytes):
+            return web.Response(body=result, content_type="application/msgpack")
+        return web.json_response(result)
+
+    return handler
+
+
+def makeApp(fake: FakeAlgodClient) -> web.Application:
+    """Build an aiohttp app serving fake on the algod v2 routes."""
+
+    def status(request: web.Request, body: bytes) -> Any:
+        return fake.status()
+
+    def statusAfterBlock(request: web.Request, body: bytes) -> Any:
+        return fake.status_after_block(int(request.match_info["round"]))
+
+    def block(request: web.Request, body: bytes) -> Any:
+        return fake.block_info(
+            int(request.match_info["round"]), response_format=request.query.get("format", "json")
+        )
+
+    def params(request: web.Request, body: bytes) -> Any:
+        sp = fake.suggested_params()
+        return {
+            "fee": sp.fee,
+            "last-round": sp.first,
+            "genesis-hash": sp.gh,
+            "genesis-id": sp.gen,
+            "consensus-version": sp.consensus_version,
+            "min-fee": sp.min_fee,
+        }
+
+    def send(request: web.Request, body: bytes) -> Any:
+        return {"txId": fake.send_raw_transaction(b64encode(body))}
+
+    def pending(request: web.Request, body: bytes) -> Any:
+        return fake.pending_transaction_info(request.match_info["txid"])
+
+    def accountInfo(request: web.Request, body: bytes) -> Any:
+        return fake.account_info(request.match_info["address"])
+
+    def applicationInfo(request: web.Request, body: bytes) -> Any:
+        return fake.application_info(int(request.match_info["id"]))
+
+    def applicationBoxes(request: web.Request, body: bytes) -> Any:
+        return fake.application_boxes(int(request.match_info["id"]), int(request.query.get("max", 0)))
+
+    def applicationBox(request: web.Request, body: bytes) -> Any:
+        encoding, _, name = request.query.get("name", "").partition(":")
+        if encoding != "b64":
+            raise error.AlgodHTTPError("only b64 box names are supported", 400)
+        return fake.application_box_by_name(int(request.match_info["id"]), b64decode(name))
+
+    def assetInfo(request: web.Request, body: bytes) -> Any:
+        return fake.asset_info(int(request.match_info["id"]))
+
+    def compile(request: web.Request, body: bytes) -> Any:
+        return fake.compile(body.decode("utf-8"))
+
+    app = web.Application()
+    app.add_routes([
+        web.get("/v2/status", _call(status)),
+        web.get("/v2/status/wait-for-block-after/{round}", _call(statusAfterBlock)),
+        web.get("/v2/blocks/{round}", _call(block)),
+        web.get("/v2/transactions/params", _call(params)),
+        web.post("/v2/transactions", _call(send)),
+        web.get("/v2/transactions/pending/{txid}", _call(pending)),
+        web.get("/v2/accounts/{address}", _call(accountInfo)),
+        web.get("/v2/applications/{id}", _call(applicationInfo)),
+        web.get("/v2/applications/{id}/boxes", _call(applicationBoxes)),
+        web.get("/v2/applications/{id}/box", _call(applicationBox)),
+        web.get("/v2/assets/{id}", _call(assetInfo)),
+        web.post("/v2/teal/compile", _call(compile)),
+    ])
+    return app
+
+
+class FakeAlgodServer:
+    """Serves a FakeAlgodClient over HTTP while the context is entered.
+
+    Args:
+        fake: The fake to serve. If omitted, a new one is created.
+        host: The host to listen on.
+        port: The port to listen on, 0 for any free port.
+    """
+
+    def __init__(
+            self, fake: Optional[FakeAlgodClient] = None, host: str = DEFAULT_HOST, port: int = 0
+    ) -> None:
+        self.fake = fake if fake is not None else FakeAlgodClient()
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def address(self) -> str:
+        return "http://{}:{}".format(self.host, self.port)
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(makeApp(self.fake))
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # the port the OS picked when asked for any
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeAlgodServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+
+def _setUp(fake: FakeAlgodClient) -> Tuple[Account, Account, Account, int, int]:
+    """Fund a bridge, a holder and a receiver, and mint the holder 2 NFTs,
+    the first of which the receiver opts in to."""
+    funder = Account(fake.genesisKeys[0])
+    bridge, holder, receiver = [Account(account.generate_account()[0]) for _ in range(3)]
+
+    suggestedParams = fake.suggested_params()
+    funding = [
+        (
+            transaction.PaymentTxn(
+                sender=funder.getAddress(), receiver=a.getAddress(), amt=FUNDING_AMOUNT, sp=suggestedParams
+            ),
+            funder,
+        )
+        for a in (bridge, holder, receiver)
+    ]
+    transaction.assign_group_id([txn for txn, _ in funding])
+    signedTxns = sign_many(funding)
+    fake.send_transactions(signedTxns)
+    waitForTransaction(fake, signedTxns[0].get_txid())
+
+    freezeID, withdrawID = mint_nfts(
+        fake, holder, [NftSpec(unitName="C", assetName="Check", note=bytes([i])) for i in range(2)]
+    )
+
+    optIn = receiver.sign(transaction.AssetTransferTxn(
+        sender=receiver.getAddress(), receiver=receiver.getAddress(), amt=0, index=freezeID,
+        sp=fake.suggested_params(),
+    ))
+    fake.send_transaction(optIn)
+    waitForTransaction(fake, optIn.get_txid())
+
+    return bridge, holder, receiver, freezeID, withdrawID
+
+
+async def check(server: FakeAlgodServer) -> None:
+    """Run the xpnet.aio operations against a served fake.
+
+    The accounts and NFTs are set up in process, the app and the bridge
+    actions go over HTTP.
+    """
+    loop = asyncio.get_running_loop()
+    bridge, holder, receiver, freezeID, withdrawID = await loop.run_in_executor(
+        None, _setUp, server.fake
+    )
+
+    async with AsyncAlgodClient(ALGOD_TOKEN, server.address) as client:
+        appID = await aio.createXpApp(client, bridge, [bridge], [freezeID], 1, 0, 0)
+        await loop.run_in_executor(None, fund_action_pages, server.fake, appID, bridge, 1)
+
+        await aio.freeze_nft(client, appID, holder, holder, receiver, freezeID, 1)
+        await aio.withdraw_nft(client, appID, holder, withdrawID, 1)
+
+        # validations of distinct actions at once, sharing the threshold
+        approvals = [
+            approveAction(
+                bridge, 0, appID, actionID, b"validate_transfer_nft", b"check", receiver.getAddress()
+            )
+            for actionID in range(2)
+        ]
+        await asyncio.gather(*[
+            aio.validate_transfer_nft(client, appID, bridge, receiver, actionID, "check", [approval])
+            for actionID, approval in enumerate(approvals)
+        ])
+
+        # approvals for one receiver do not execute the action for another
+        approval = approveAction(
+            bridge, 0, appID, 2, b"validate_transfer_nft", b"check", receiver.getAddress()
+        )
+        try:
+            await aio.validate_transfer_nft(client, appID, bridge, holder, 2, "check", [approval])
+        except error.AlgodHTTPError:
+            pass
+        else:
+            raise Exception("An approval for the receiver executed the action for the holder")
+
+        if (await getBalances(client, receiver.getAddress())).get(freezeID) != 1:
+            raise Exception("The receiver does not hold the frozen NFT")
+        if withdrawID in await getBalances(client, holder.getAddress()):
+            raise Exception("The withdrawn NFT was not destroyed")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument(
+        "--block-time", type=float, default=0.0, help="seconds per round, 0 for instant rounds"
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="run the xpnet.aio operations against the server and exit"
+    )
+    args = parser.parse_args(argv)
+
+    async def run() -> int:
+        async with FakeAlgodServer(FakeAlgodClient(blockTime=args.block_time), args.host, args.port) as server:
+            if args.check:
+                try:
+                    await check(server)
+                except Exception as e:
+                    print("check failed: {}".format(e), file=sys.stderr)
+                    return 1
+                print("check passed against {}".format(server.address))
+                return 0
+
+            print("serving a fake algod on {}".format(server.address))
+            await asyncio.Event().wait()
+            return 0
+
+    try:
+        return asyncio.run(run())
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
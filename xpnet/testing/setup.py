@@ -1,15 +1,40 @@
-from typing import List, Optional
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
+from algosdk import account
 from algosdk.kmd import KMDClient
 from algosdk.v2client.algod import AlgodClient
 
 from ..account import Account
+from ..files import atomicWrite, fileLock
 
 ALGOD_ADDRESS = "http://localhost:4001"
 ALGOD_TOKEN = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
+# run against the in-process network of xpnet.testing.fake instead of a sandbox
+USE_FAKE_NETWORK = os.environ.get("XPNET_FAKE_NETWORK", "") not in ("", "0")
+FAKE_BLOCK_TIME = float(os.environ.get("XPNET_FAKE_BLOCK_TIME", "0"))
+
+fakeAlgod = None
+
+
+def getFakeAlgodClient():
+    global fakeAlgod
+
+    if fakeAlgod is None:
+        from .fake import FakeAlgodClient
+
+        fakeAlgod = FakeAlgodClient(blockTime=FAKE_BLOCK_TIME)
+
+    return fakeAlgod
+
 
 def getAlgodClient() -> AlgodClient:
+    if USE_FAKE_NETWORK:
+        return getFakeAlgodClient()
     return AlgodClient(ALGOD_TOKEN, ALGOD_ADDRESS)
 
 
@@ -18,41 +43,98 @@ KMD_TOKEN = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
 
 def getKmdClient() -> KMDClient:
+    if USE_FAKE_NETWORK:
+        from .fake import FakeKMDClient
+
+        return FakeKMDClient(getFakeAlgodClient(), KMD_WALLET_NAME)
     return KMDClient(KMD_TOKEN, KMD_ADDRESS)
 
 
 KMD_WALLET_NAME = "unencrypted-default-wallet"
 KMD_WALLET_PASSWORD = ""
 
+# a directory to keep the keys of the genesis accounts exported from KMD in,
+# in plain text, shared by the processes of a test run; only set it for a
+# sandbox whose keys hold nothing of value
+KMD_CACHE_DIR: Optional[str] = os.environ.get("XPNET_KMD_CACHE") or None
+
+# concurrent export_key requests
+EXPORT_WORKERS = 8
+
 kmdAccounts: Optional[List[Account]] = None
+kmdAccountsLock = threading.Lock()
 
 
-def getGenesisAccounts() -> List[Account]:
-    global kmdAccounts
+def _loadCachedKeys(path: str, addresses: List[str]) -> Optional[List[str]]:
+    try:
+        with open(path, "r") as f:
+            privateKeys = json.load(f)["keys"]
+        byAddress: Dict[str, str] = {
+            account.address_from_private_key(sk): sk for sk in privateKeys
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
 
-    if kmdAccounts is None:
-        kmd = getKmdClient()
+    # a wallet recreated with the same ID has other keys
+    if set(byAddress) != set(addresses):
+        return None
+    return [byAddress[addr] for addr in addresses]
 
-        wallets = kmd.list_wallets()
-        walletID = None
-        for wallet in wallets:
-            if wallet["name"] == KMD_WALLET_NAME:
-                walletID = wallet["id"]
-                break
 
-        if walletID is None:
-            raise Exception("Wallet not found: {}".format(KMD_WALLET_NAME))
+def _exportKeys(kmd: KMDClient, walletHandle: str, addresses: List[str]) -> List[str]:
+    with ThreadPoolExecutor(max_workers=max(1, min(EXPORT_WORKERS, len(addresses)))) as executor:
+        return list(executor.map(
+            lambda addr: kmd.export_key(walletHandle, KMD_WALLET_PASSWORD, addr), addresses
+        ))
 
-        walletHandle = kmd.init_wallet_handle(walletID, KMD_WALLET_PASSWORD)
 
-        try:
-            addresses = kmd.list_keys(walletHandle)
-            privateKeys = [
-                kmd.export_key(walletHandle, KMD_WALLET_PASSWORD, addr)
-                for addr in addresses
-            ]
-            kmdAccounts = [Account(sk) for sk in privateKeys]
-        finally:
-            kmd.release_wallet_handle(walletHandle)
+def getGenesisAccounts() -> List[Account]:
+    """Get the accounts of the KMD wallet that holds the genesis funds.
+
+    The keys are exported from KMD by every process, unless KMD_CACHE_DIR is
+    set by XPNET_KMD_CACHE. Then they are exported once and kept in a file
+    of it by wallet ID, readable by its owner only, which is only used while
+    its keys are those of the addresses KMD lists. Processes loading them at
+    the same time wait for the first one to export them, so KMD is only
+    asked once.
+    """
+    global kmdAccounts
 
-    return kmdAccounts
+    with kmdAccountsLock:
+        if kmdAccounts is None:
+            kmd = getKmdClient()
+
+            wallets = kmd.list_wallets()
+            walletID = None
+            for wallet in wallets:
+                if wallet["name"] == KMD_WALLET_NAME:
+                    walletID = wallet["id"]
+                    break
+
+            if walletID is None:
+                raise Exception("Wallet not found: {}".format(KMD_WALLET_NAME))
+
+            walletHandle = kmd.init_wallet_handle(walletID, KMD_WALLET_PASSWORD)
+
+            try:
+                addresses = kmd.list_keys(walletHandle)
+
+                # a fake network has new keys in every process
+                if KMD_CACHE_DIR is None or USE_FAKE_NETWORK:
+                    privateKeys = _exportKeys(kmd, walletHandle, addresses)
+                else:
+                    os.makedirs(KMD_CACHE_DIR, mode=0o700, exist_ok=True)
+                    path = os.path.join(KMD_CACHE_DIR, "wallet-{}.json".format(walletID))
+                    with fileLock(path + ".lock"):
+                        cachedKeys = _loadCachedKeys(path, addresses)
+                        if cachedKeys is None:
+                            privateKeys = _exportKeys(kmd, walletHandle, addresses)
+                            atomicWrite(path, json.dumps({"keys": privateKeys}).encode("utf-8"))
+                        else:
+                            privateKeys = cachedKeys
+
+                kmdAccounts = [Account(sk) for sk in privateKeys]
+            finally:
+                kmd.release_wallet_handle(walletHandle)
+
+        return kmdAccounts
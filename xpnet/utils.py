@@ -1,88 +1,241 @@
-from base64 import b64decode
-from typing import Dict, Union, List, Any, Optional
-
-from algosdk import encoding
+from array import array
+from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING, Dict, Iterable, Iterator, Mapping, Set, Tuple, Union, List, Any, Optional
+)
+
+from algosdk import encoding, error
 from algosdk.v2client.algod import AlgodClient
-from pyteal import compileTeal, Expr, Mode
+
+from .metrics import timed
+from .programs import TEAL_VERSION
+
+if TYPE_CHECKING:
+    from pyteal import Expr
 
 
 class PendingTxnResponse:
+    """A view of algod's pending transaction response.
+
+    Fields are read from the response dict when they are accessed, and logs
+    are only base64 decoded the first time they are read.
+    """
+
+    __slots__ = ("response", "_logs")
+
     def __init__(self, response: Dict[str, Any]) -> None:
-        self.poolError: str = response["pool-error"]
-        self.txn: Dict[str, Any] = response["txn"]
+        self.response = response
+        self._logs: Optional[List[bytes]] = None
+
+    @property
+    def poolError(self) -> str:
+        return self.response["pool-error"]
+
+    @property
+    def txn(self) -> Dict[str, Any]:
+        return self.response["txn"]
+
+    @property
+    def applicationIndex(self) -> Optional[int]:
+        return self.response.get("application-index")
+
+    # TODO:
+    @property
+    def assetIndex(self) -> Optional[int]:
+        return self.response.get("asset-index")
+
+    @property
+    def closeRewards(self) -> Optional[int]:
+        return self.response.get("close-rewards")
+
+    @property
+    def closingAmount(self) -> Optional[int]:
+        return self.response.get("closing-amount")
+
+    @property
+    def confirmedRound(self) -> Optional[int]:
+        return self.response.get("confirmed-round")
+
+    @property
+    def globalStateDelta(self) -> Optional[Any]:
+        return self.response.get("global-state-delta")
+
+    @property
+    def localStateDelta(self) -> Optional[Any]:
+        return self.response.get("local-state-delta")
+
+    @property
+    def receiverRewards(self) -> Optional[int]:
+        return self.response.get("receiver-rewards")
 
-        self.applicationIndex: Optional[int] = response.get("application-index")
-        # TODO:
-        self.assetIndex: Optional[int] = response.get("asset-index")
-        self.closeRewards: Optional[int] = response.get("close-rewards")
-        self.closingAmount: Optional[int] = response.get("closing-amount")
-        self.confirmedRound: Optional[int] = response.get("confirmed-round")
-        self.globalStateDelta: Optional[Any] = response.get("global-state-delta")
-        self.localStateDelta: Optional[Any] = response.get("local-state-delta")
-        self.receiverRewards: Optional[int] = response.get("receiver-rewards")
-        self.senderRewards: Optional[int] = response.get("sender-rewards")
+    @property
+    def senderRewards(self) -> Optional[int]:
+        return self.response.get("sender-rewards")
 
-        self.innerTxns: List[Any] = response.get("inner-txns", [])
-        self.logs: List[bytes] = [b64decode(l) for l in response.get("logs", [])]
+    @property
+    def innerTxns(self) -> List[Any]:
+        return self.response.get("inner-txns", [])
+
+    @property
+    def logs(self) -> List[bytes]:
+        if self._logs is None:
+            self._logs = [b64decode(l) for l in self.response.get("logs", [])]
+        return self._logs
 
 
 def waitForTransaction(
         client: AlgodClient, txID: str, timeout: int = 10
 ) -> PendingTxnResponse:
-    lastStatus = client.status()
-    lastRound = lastStatus["last-round"]
-    startRound = lastRound
+    return waitForTransactions(client, [txID], timeout)[0]
+
+
+def waitForTransactions(
+        client: AlgodClient, txIDs: List[str], timeout: int = 10
+) -> List[PendingTxnResponse]:
+    """Wait for several transactions to be confirmed.
+
+    All waiters on the same client share one block follower, so the number of
+    algod calls per round does not grow with the number of transactions.
+
+    Args:
+        client: An algod client.
+        txIDs: The IDs of the transactions to wait for.
+        timeout: The number of rounds to wait before giving up.
+
+    Returns:
+        The PendingTxnResponse of each transaction, in the order of txIDs.
+    """
+    from .confirmation import getConfirmationEngine
+
+    with timed("wait"):
+        return getConfirmationEngine(client).waitForTransactions(txIDs, timeout)
+
 
-    while lastRound < startRound + timeout:
-        pending_txn = client.pending_transaction_info(txID)
+# what algod says when it turns a group away for a reason that passes, like a
+# congested pool, rather than for the group itself
+TRANSIENT_REJECTIONS = (
+    # the fee per byte a congested pool takes
+    "below threshold",
+    "transaction pool have reached capacity",
+    "transaction pool is full",
+    # the group's window closed before it got there
+    "txn dead",
+)
 
-        if pending_txn.get("confirmed-round", 0) > 0:
-            return PendingTxnResponse(pending_txn)
 
-        if pending_txn["pool-error"]:
-            raise Exception("Pool error: {}".format(pending_txn["pool-error"]))
+def isTransientRejection(e: error.AlgodHTTPError) -> bool:
+    """Whether algod turned a group away for a reason that passes.
 
-        lastStatus = client.status_after_block(lastRound + 1)
+    The group was not taken, and the same actions can be sent again later.
+    """
+    message = str(e)
+    return any(reason in message for reason in TRANSIENT_REJECTIONS)
 
-        lastRound += 1
 
-    raise Exception(
-        "Transaction {} not confirmed after {} rounds".format(txID, timeout)
-    )
+def isEvalRejection(e: error.AlgodHTTPError) -> bool:
+    """Whether algod rejected a group on evaluating it, e.g. because the
+    app's program or a balance check failed.
 
+    Sending the same group again is rejected again.
+    """
+    return e.code == 400 and not isTransientRejection(e)
 
-def fullyCompileContract(client: AlgodClient, contract: Expr) -> bytes:
-    teal = compileTeal(contract, mode=Mode.Application, version=5)
+
+def compileProgram(client: AlgodClient, teal: str) -> bytes:
     response = client.compile(teal)
     return b64decode(response["result"])
 
 
-def decodeState(stateArray: List[Any]) -> Dict[bytes, Union[int, bytes]]:
-    state: Dict[bytes, Union[int, bytes]] = dict()
+def fullyCompileContract(client: AlgodClient, contract: "Expr") -> bytes:
+    from pyteal import compileTeal, Mode
+
+    teal = compileTeal(contract, mode=Mode.Application, version=TEAL_VERSION)
+    return compileProgram(client, teal)
+
+
+def decodeStateValue(value: Dict[str, Any]) -> Union[int, bytes]:
+    valueType = value["type"]
+
+    if valueType == 2:
+        # value is uint64
+        return value.get("uint", 0)
+    elif valueType == 1:
+        # value is byte array
+        return b64decode(value.get("bytes", ""))
+    else:
+        raise Exception(f"Unexpected state type: {valueType}")
+
+
+class LazyState(Mapping[bytes, Union[int, bytes]]):
+    """A read-only app state that decodes entries when they are accessed.
+
+    Looking up a key base64 encodes it and finds the raw entry, so the other
+    keys and values are never decoded. Decoded values are kept.
+    """
 
-    for pair in stateArray:
+    __slots__ = ("_raw", "_decoded")
+
+    def __init__(self, stateArray: List[Any]) -> None:
+        self._raw: Dict[str, Dict[str, Any]] = {
+            pair["key"]: pair["value"] for pair in stateArray
+        }
+        self._decoded: Dict[bytes, Union[int, bytes]] = dict()
+
+    def __getitem__(self, key: bytes) -> Union[int, bytes]:
+        value = self._decoded.get(key)
+        if value is None:
+            value = decodeStateValue(self._raw[b64encode(key).decode()])
+            self._decoded[key] = value
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, bytes) and b64encode(key).decode() in self._raw
+
+    def __iter__(self) -> Iterator[bytes]:
+        return (b64decode(key) for key in self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __repr__(self) -> str:
+        return "LazyState({!r})".format(dict(self))
+
+
+def decodeState(stateArray: List[Any]) -> Mapping[bytes, Union[int, bytes]]:
+    return LazyState(stateArray)
+
+
+def decodeStateDelta(
+        deltaArray: List[Any],
+) -> Dict[bytes, Optional[Union[int, bytes]]]:
+    """Decode a state delta, mapping deleted keys to None."""
+    delta: Dict[bytes, Optional[Union[int, bytes]]] = dict()
+
+    for pair in deltaArray:
         key = b64decode(pair["key"])
 
         value = pair["value"]
-        valueType = value["type"]
-
-        if valueType == 2:
-            # value is uint64
-            value = value.get("uint", 0)
-        elif valueType == 1:
-            # value is byte array
-            value = b64decode(value.get("bytes", ""))
+        action = value["action"]
+
+        if action == 1:
+            # set byte array
+            delta[key] = b64decode(value.get("bytes", ""))
+        elif action == 2:
+            # set uint64
+            delta[key] = value.get("uint", 0)
+        elif action == 3:
+            # delete
+            delta[key] = None
         else:
-            raise Exception(f"Unexpected state type: {valueType}")
-
-        state[key] = value
+            raise Exception(f"Unexpected state delta action: {action}")
 
-    return state
+    return delta
 
 
 def getAppGlobalState(
         client: AlgodClient, appID: int
-) -> Dict[bytes, Union[int, bytes]]:
+) -> Mapping[bytes, Union[int, bytes]]:
     appInfo = client.application_info(appID)
     return decodeState(appInfo["params"]["global-state"])
 
@@ -107,3 +260,86 @@ def getBalances(client: AlgodClient, account: str) -> Dict[int, int]:
         balances[assetID] = amount
 
     return balances
+
+
+class BalanceTable:
+    """Balances of many accounts, stored as one account x asset matrix.
+
+    Asset ID 0 is the Algo balance, as in getBalances. Accounts that do not
+    hold an asset have a balance of 0 for it.
+    """
+
+    __slots__ = ("accounts", "assetIDs", "amounts", "_rows", "_columns")
+
+    def __init__(self, accounts: List[str], assetIDs: List[int], amounts: "array[int]") -> None:
+        self.accounts = accounts
+        self.assetIDs = assetIDs
+        # row-major, len(accounts) * len(assetIDs) entries
+        self.amounts = amounts
+
+        self._rows = {account: i for i, account in enumerate(accounts)}
+        self._columns = {assetID: i for i, assetID in enumerate(assetIDs)}
+
+    def get(self, account: str, assetID: int) -> int:
+        row = self._rows[account]
+        column = self._columns[assetID]
+        return self.amounts[row * len(self.assetIDs) + column]
+
+    def row(self, account: str) -> Dict[int, int]:
+        """Get the balances of one account, like getBalances."""
+        start = self._rows[account] * len(self.assetIDs)
+        return dict(zip(self.assetIDs, self.amounts[start:start + len(self.assetIDs)]))
+
+    def column(self, assetID: int) -> List[int]:
+        """Get the balance of one asset for every account, in account order."""
+        return list(self.amounts[self._columns[assetID]::len(self.assetIDs)])
+
+
+def getBalancesMany(
+        client: AlgodClient,
+        accounts: List[str],
+        assetIDs: Optional[Iterable[int]] = None,
+        maxWorkers: int = 16,
+) -> BalanceTable:
+    """Get the balances of many accounts concurrently.
+
+    Args:
+        client: An algod client.
+        accounts: The addresses of the accounts.
+        assetIDs: The assets to report, use 0 for the Algo balance. If omitted,
+            every asset held by any of the accounts is reported, along with
+            the Algo balance.
+        maxWorkers: The maximum number of account_info requests in flight.
+
+    Returns:
+        A BalanceTable with one row per account, in the order of accounts.
+    """
+    wanted: Optional[Set[int]] = None if assetIDs is None else set(assetIDs)
+
+    def fetch(account: str) -> List[Tuple[int, int]]:
+        accountInfo = client.account_info(account)
+
+        holdings = [(0, accountInfo["amount"])]
+        for assetHolding in accountInfo.get("assets", []):
+            holdings.append((assetHolding["asset-id"], assetHolding["amount"]))
+
+        if wanted is not None:
+            holdings = [h for h in holdings if h[0] in wanted]
+        return holdings
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        rows = list(executor.map(fetch, accounts))
+
+    if wanted is not None:
+        columns = sorted(wanted)
+    else:
+        columns = sorted({assetID for holdings in rows for assetID, _ in holdings})
+
+    columnIndex = {assetID: i for i, assetID in enumerate(columns)}
+    amounts = array("Q", bytes(8 * len(accounts) * len(columns)))
+    for i, holdings in enumerate(rows):
+        start = i * len(columns)
+        for assetID, amount in holdings:
+            amounts[start + columnIndex[assetID]] = amount
+
+    return BalanceTable(list(accounts), columns, amounts)
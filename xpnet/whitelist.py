@@ -0,0 +1,133 @@
+"""Packed storage of the NFT whitelist of the XP app.
+
+The whitelist is kept in boxes of the app instead of one global state key per
+asset. Asset IDs are split over a number of shards by assetID % shards, and
+each shard is a box holding its IDs as sorted 8 byte big endian integers, so
+that the app checks membership with a binary search. A shard holds at most
+MAX_SHARD_IDS IDs, which keeps every box within the 1024 bytes of box I/O a
+single box reference pays for.
+"""
+
+from bisect import bisect_left
+from base64 import b64decode
+from typing import Dict, Iterable, List
+
+from algosdk.v2client.algod import AlgodClient
+
+WHITELIST_BOX_PREFIX = b"wl"
+
+ASSET_ID_SIZE = 8
+
+MAX_SHARD_IDS = 128
+
+# the most shards the app accepts, which bounds the whitelist to
+# MAX_SHARDS * MAX_SHARD_IDS assets
+MAX_SHARDS = 256
+
+# minimum balance of an account, the app account included
+ACCOUNT_MIN_BALANCE = 100_000
+
+# minimum balance of a box: a flat amount plus an amount per byte of its name
+# and value
+BOX_FLAT_MIN_BALANCE = 2500
+BOX_BYTE_MIN_BALANCE = 400
+
+
+def whitelistBoxName(shard: int) -> bytes:
+    return WHITELIST_BOX_PREFIX + shard.to_bytes(8, "big")
+
+
+def shardOf(assetID: int, shards: int) -> int:
+    return assetID % shards
+
+
+def whitelistShardCount(assetIDs: Iterable[int]) -> int:
+    """The smallest number of shards none of which overflows for assetIDs."""
+    ids = set(assetIDs)
+
+    shards = max(1, -(-len(ids) // MAX_SHARD_IDS))
+    while shards <= MAX_SHARDS:
+        counts: Dict[int, int] = dict()
+        for assetID in ids:
+            shard = shardOf(assetID, shards)
+            counts[shard] = counts.get(shard, 0) + 1
+        if max(counts.values(), default=0) <= MAX_SHARD_IDS:
+            return shards
+        shards += 1
+
+    raise Exception("Whitelist of {} assets does not fit in {} shards".format(len(ids), MAX_SHARDS))
+
+
+def packWhitelist(assetIDs: Iterable[int], shards: int) -> Dict[int, bytes]:
+    """Pack asset IDs into the value of each shard box.
+
+    Args:
+        assetIDs: The whitelisted asset IDs.
+        shards: The number of shards of the app.
+
+    Returns:
+        The box value of each shard, by shard. Shards without any asset are
+        left out, their box does not need to exist.
+    """
+    buckets: Dict[int, List[int]] = dict()
+    for assetID in set(assetIDs):
+        buckets.setdefault(shardOf(assetID, shards), []).append(assetID)
+
+    packed: Dict[int, bytes] = dict()
+    for shard, ids in sorted(buckets.items()):
+        if len(ids) > MAX_SHARD_IDS:
+            raise Exception("Whitelist shard {} has {} assets, more than {}".format(
+                shard, len(ids), MAX_SHARD_IDS))
+        packed[shard] = b"".join(assetID.to_bytes(ASSET_ID_SIZE, "big") for assetID in sorted(ids))
+    return packed
+
+
+def unpackShard(value: bytes) -> List[int]:
+    return [
+        int.from_bytes(value[i:i + ASSET_ID_SIZE], "big")
+        for i in range(0, len(value), ASSET_ID_SIZE)
+    ]
+
+
+def unpackWhitelist(packed: Dict[int, bytes]) -> List[int]:
+    """Get the sorted asset IDs of packed shard boxes."""
+    return sorted(assetID for value in packed.values() for assetID in unpackShard(value))
+
+
+def shardContains(value: bytes, assetID: int) -> bool:
+    """Binary search a shard box for an asset, like the app does."""
+    ids = unpackShard(value)
+    i = bisect_left(ids, assetID)
+    return i < len(ids) and ids[i] == assetID
+
+
+def whitelistMinBalance(packed: Dict[int, bytes]) -> int:
+    """The minimum balance the app account needs for the shard boxes."""
+    return sum(
+        BOX_FLAT_MIN_BALANCE + BOX_BYTE_MIN_BALANCE * (len(whitelistBoxName(shard)) + len(value))
+        for shard, value in packed.items()
+    )
+
+
+def getWhitelist(client: AlgodClient, appID: int, shards: int) -> Dict[int, bytes]:
+    """Read the shard boxes of an app.
+
+    Args:
+        client: An algod client.
+        appID: The ID of the XP app.
+        shards: The number of shards, the wl_shards global of the app.
+
+    Returns:
+        The box value of each shard that has a box, by shard.
+    """
+    names = {
+        b64decode(box["name"]) for box in client.application_boxes(appID).get("boxes", [])
+    }
+
+    packed: Dict[int, bytes] = dict()
+    for shard in range(shards):
+        name = whitelistBoxName(shard)
+        if name in names:
+            box = client.application_box_by_name(appID, name)
+            packed[shard] = b64decode(box["value"])
+    return packed